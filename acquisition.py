@@ -0,0 +1,283 @@
+"""Read AirPi sensors concurrently.
+
+Read the enabled sensors in parallel on a small pool of worker threads,
+so that one sample costs roughly as long as the slowest sensor rather
+than the sum of all of them. Sensors which share a bus (for example all
+of the I2C devices, or all of the MCP3008 analogue inputs) are placed in
+the same group, and a group is always read one sensor at a time by a
+single worker so that devices never collide on the wire. Each sensor
+has a deadline; if its reading has not arrived by then it is marked as
+missing and the sample carries on without it.
+
+"""
+import threading
+import time
+import Queue
+from sensors.sensor import TickCache
+
+class SensorGroup(object):
+    """A set of sensors which share a bus.
+
+    Sensors in a group are always read sequentially, in the order in
+    which they were enabled. A group is 'busy' while a worker is reading
+    it; a busy group is not handed out again until that read finishes,
+    even if it has overrun its deadline.
+
+    """
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.sensors = []
+        self.busy = False
+
+class Tick(object):
+    """The state of one acquisition pass.
+
+    Holds the readings as they arrive from the workers, plus an Event
+    per sensor so that the main thread can wait on each one with its own
+    deadline.
+
+    """
+
+    def __init__(self, sensors, deadlines):
+        self.start = time.time()
+        self.deadlines = deadlines
+        self.readings = {}
+        self.errors = {}
+        self.done = dict((sensorplugin, threading.Event()) for sensorplugin in sensors)
+
+    def expired(self, sensorplugin):
+        """Check whether a sensor's deadline has already passed.
+
+        Args:
+            sensorplugin: The sensor to check.
+
+        Returns:
+            boolean True if the deadline has passed.
+
+        """
+        deadline = self.deadlines[sensorplugin]
+        return deadline is not None and time.time() > self.start + deadline
+
+class SensorAcquisition(object):
+    """Read AirPi sensors concurrently.
+
+    Read the enabled sensors in parallel on a pool of worker threads,
+    grouping sensors which share a bus and enforcing a deadline on each
+    sensor. Readings are always returned in the same order as the
+    sensors were passed in, so that column-based outputs (e.g. CSV)
+    remain stable.
+
+    """
+
+    def __init__(self, sensors, reader, missing, workers=4, deadline=None):
+        """Initialise.
+
+        Args:
+            sensors: List of enabled sensor plugins.
+            reader: Function which takes a sensor plugin and returns its
+                    reading (usually read_sensor() or read_gps()).
+            missing: Function which takes a sensor plugin and returns a
+                     placeholder reading for a sensor which failed or
+                     missed its deadline.
+            workers: Maximum number of worker threads. Set to 0 to read
+                     all sensors sequentially in the calling thread.
+            deadline: Default per-sensor deadline (seconds from the start
+                      of the pass). Sensors with their own 'deadline'
+                      attribute override this. None means no deadline.
+
+        """
+        self.sensors = list(sensors)
+        self.reader = reader
+        self.missing = missing
+        self.deadline = deadline
+        self.groups = self.group_sensors(self.sensors)
+        self.lock = threading.Lock()
+        self.jobs = Queue.Queue()
+        self.late = []
+        self.errors = {}
+        self.workers = []
+        for dummy in range(min(workers, len(self.groups))):
+            worker = threading.Thread(target=self.work)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    @staticmethod
+    def getbus(sensorplugin):
+        """Get the bus a sensor lives on.
+
+        Args:
+            sensorplugin: The sensor plugin.
+
+        Returns:
+            string The bus identifier, or None if the sensor does not
+                   share a bus with anything else.
+
+        """
+        return getattr(sensorplugin, "bus", None)
+
+    def group_sensors(self, sensors):
+        """Split sensors into groups which can be read in parallel.
+
+        Args:
+            sensors: List of sensor plugins.
+
+        Returns:
+            list The SensorGroups, in order of first appearance.
+
+        """
+        groups = []
+        bybus = {}
+        for sensorplugin in sensors:
+            bus = self.getbus(sensorplugin)
+            if bus is None:
+                group = SensorGroup(None)
+                groups.append(group)
+            elif bus in bybus:
+                group = bybus[bus]
+            else:
+                group = SensorGroup(bus)
+                bybus[bus] = group
+                groups.append(group)
+            group.sensors.append(sensorplugin)
+        return groups
+
+    def getdeadline(self, sensorplugin):
+        """Get the deadline for a sensor.
+
+        Args:
+            sensorplugin: The sensor plugin.
+
+        Returns:
+            float The deadline in seconds, or None for no deadline.
+
+        """
+        deadline = getattr(sensorplugin, "deadline", None)
+        if deadline is None:
+            deadline = self.deadline
+        return deadline
+
+    def acquire(self, sensors=None, ticktime=None):
+        """Read a set of sensors.
+
+        Start a new tick (so that chips which provide several
+        measurements are read afresh, once), then hand each group of
+        sensors to a worker and wait for each reading in turn until its
+        deadline. Readings which fail or arrive
+        late are replaced by the 'missing' placeholder; the sensors
+        concerned are listed in self.late and self.errors afterwards.
+        Sensors in a group which is still busy from an earlier pass are
+        late straight away, without waiting for them.
+
+        Args:
+            sensors: The sensors to read. Defaults to all of them.
+            ticktime: The scheduled time of the sample, if known.
+
+        Returns:
+            list The readings, in the same order as 'sensors'.
+
+        """
+        if sensors is None:
+            sensors = self.sensors
+        wanted = set(sensors)
+        deadlines = dict((s, self.getdeadline(s)) for s in sensors)
+        TickCache.advance(ticktime)
+        tick = Tick(sensors, deadlines)
+        self.late = []
+        skipped = set()
+        if not self.workers:
+            self.read_group(list(sensors), tick)
+        else:
+            for group in self.groups:
+                members = [s for s in group.sensors if s in wanted]
+                if not members:
+                    continue
+                with self.lock:
+                    if group.busy:
+                        # The previous pass is still reading this bus;
+                        # these sensors won't be read, so don't wait.
+                        skipped.update(members)
+                        continue
+                    group.busy = True
+                self.jobs.put((group, members, tick))
+        readings = []
+        for sensorplugin in sensors:
+            done = tick.done[sensorplugin]
+            if sensorplugin in skipped:
+                pass
+            elif deadlines[sensorplugin] is None:
+                done.wait()
+            else:
+                done.wait(max(tick.start + deadlines[sensorplugin] - time.time(), 0))
+            if done.is_set() and sensorplugin in tick.readings:
+                readings.append(tick.readings[sensorplugin])
+            else:
+                if not done.is_set():
+                    self.late.append(sensorplugin)
+                readings.append(self.missing(sensorplugin))
+        self.errors = dict(tick.errors)
+        return readings
+
+    def read_group(self, members, tick):
+        """Read the members of a group one after the other.
+
+        Every member is started first (see Sensor.start()), so that slow
+        conversions overlap with reading the rest of the group. Members
+        which are ready (see Sensor.ready()) are read before those which
+        are still converting; if none are, the next one is read anyway.
+        Sensors whose deadline has already passed (because an earlier
+        member of the group overran) are not read at all.
+
+        Args:
+            members: The sensors to read.
+            tick: The Tick to record the readings in.
+
+        """
+        for sensorplugin in members:
+            try:
+                sensorplugin.start()
+            except Exception:
+                # Any problem with the sensor will show up when it's read
+                pass
+        pending = list(members)
+        while pending:
+            sensorplugin = self.nextready(pending)
+            pending.remove(sensorplugin)
+            if tick.expired(sensorplugin):
+                continue
+            try:
+                tick.readings[sensorplugin] = self.reader(sensorplugin)
+            except Exception as excep:
+                tick.errors[sensorplugin] = excep
+            tick.done[sensorplugin].set()
+
+    @staticmethod
+    def nextready(pending):
+        """Choose the next member of a group to read.
+
+        Args:
+            pending: The members still to be read, in order.
+
+        Returns:
+            The first of them which is ready, or the first if none are.
+
+        """
+        for sensorplugin in pending:
+            try:
+                if sensorplugin.ready():
+                    return sensorplugin
+            except Exception:
+                # Any problem with the sensor will show up when it's read
+                return sensorplugin
+        return pending[0]
+
+    def work(self):
+        """Worker thread: read groups of sensors as they are queued."""
+        while True:
+            group, members, tick = self.jobs.get()
+            try:
+                self.read_group(members, tick)
+            finally:
+                with self.lock:
+                    group.busy = False
@@ -0,0 +1,244 @@
+"""Average AirPi readings over time in constant memory.
+
+When 'averageFreq' is set, readings are combined over each averaging
+period before being output. Rather than storing every reading until the
+end of the period, each sensor has an aggregator which updates a few
+running totals as each reading arrives, so memory use doesn't grow with
+the length of the period or the sample rate. The aggregator depends on
+the sensor's 'readingtype':
+
+- sample: the mean (using Welford's method, which is numerically
+  stable), plus minimum, maximum and standard deviation.
+- pulseCount: the sum, since counts should be added together rather than
+  averaged.
+- direction: the circular mean, so that (for example) 350 and 10 degrees
+  average to 0 rather than 180.
+
+"""
+import collections
+import math
+
+class MeanAggregator(object):
+    """Running mean, variance, minimum and maximum of readings.
+
+    """
+    readingtype = "average"
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.sumsquares = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        """Add a value.
+
+        Args:
+            value: The value to add.
+
+        """
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.sumsquares += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def getvalue(self):
+        """Get the aggregated value.
+
+        Returns:
+            float The mean.
+
+        """
+        return self.mean
+
+    def getstddev(self):
+        """Get the sample standard deviation.
+
+        Returns:
+            float The standard deviation, or 0 if there are fewer than two
+                  values.
+
+        """
+        if self.count < 2:
+            return 0.0
+        return math.sqrt(self.sumsquares / (self.count - 1))
+
+    def result(self):
+        """Get the aggregated statistics.
+
+        Returns:
+            dict The value, minimum, maximum, standard deviation and count.
+                 The value is None if there were no valid readings.
+
+        """
+        if not self.count:
+            return {"value": None, "min": None, "max": None,
+                    "stddev": None, "count": 0}
+        return {
+            "value": self.getvalue(),
+            "min": self.min,
+            "max": self.max,
+            "stddev": self.getstddev(),
+            "count": self.count
+            }
+
+class SumAggregator(MeanAggregator):
+    """Running total of pulse counts.
+
+    The total is kept exactly (whole counts stay whole), rather than
+    being worked out from the mean; only the minimum, maximum and
+    standard deviation come from MeanAggregator.
+
+    """
+    readingtype = "pulseCount"
+
+    def __init__(self):
+        MeanAggregator.__init__(self)
+        self.total = 0
+
+    def add(self, value):
+        """Add a count.
+
+        Args:
+            value: The count to add.
+
+        """
+        MeanAggregator.add(self, value)
+        self.total += value
+
+    def getvalue(self):
+        """Get the aggregated value.
+
+        Returns:
+            float The sum.
+
+        """
+        return self.total
+
+class CircularAggregator(object):
+    """Running circular mean of directions (in degrees).
+
+    """
+    readingtype = "direction"
+
+    def __init__(self):
+        self.count = 0
+        self.sumsin = 0.0
+        self.sumcos = 0.0
+
+    def add(self, value):
+        """Add a direction.
+
+        Args:
+            value: The direction in degrees.
+
+        """
+        self.count += 1
+        self.sumsin += math.sin(math.radians(value))
+        self.sumcos += math.cos(math.radians(value))
+
+    def result(self):
+        """Get the aggregated statistics.
+
+        The standard deviation is the circular standard deviation, in
+        degrees. Minimum and maximum aren't meaningful for directions,
+        so are None.
+
+        Returns:
+            dict The value, minimum, maximum, standard deviation and count.
+                 The value is None if there were no valid readings.
+
+        """
+        stats = {"value": None, "min": None, "max": None, "stddev": None,
+                 "count": self.count}
+        if self.count:
+            stats["value"] = math.degrees(math.atan2(self.sumsin,
+                                                     self.sumcos)) % 360
+            length = math.hypot(self.sumsin, self.sumcos) / self.count
+            stats["stddev"] = math.degrees(math.sqrt(-2 * math.log(
+                min(max(length, 1e-12), 1.0))))
+        return stats
+
+AGGREGATORS = {
+    "sample": MeanAggregator,
+    "pulseCount": SumAggregator,
+    "direction": CircularAggregator
+    }
+
+def get_aggregator(readingtype):
+    """Create an aggregator for a type of reading.
+
+    Args:
+        readingtype: The 'readingtype' of the sensor.
+
+    Returns:
+        object A new aggregator; MeanAggregator if the type is unknown.
+
+    """
+    return AGGREGATORS.get(readingtype, MeanAggregator)()
+
+def isvalid(value):
+    """Check whether a value should be included in an aggregate.
+
+    Args:
+        value: The value to check.
+
+    Returns:
+        boolean True if the value is a number (and not NaN).
+
+    """
+    if value is None or value == "-":
+        return False
+    try:
+        return not math.isnan(float(value))
+    except (TypeError, ValueError):
+        return False
+
+class DatasetAggregator(object):
+    """Aggregate the readings from every sensor over an averaging period.
+
+    """
+
+    def __init__(self):
+        self.aggregates = collections.OrderedDict()
+
+    def add(self, reading):
+        """Add one reading.
+
+        Args:
+            reading: The reading (as created by read_sensor()).
+
+        """
+        identifier = reading["sensor"] + "-" + reading["name"]
+        if identifier not in self.aggregates:
+            template = dict(reading)
+            for key in ["value", "age"]:
+                template.pop(key, None)
+            template["identifier"] = identifier
+            aggregator = get_aggregator(reading["readingtype"])
+            self.aggregates[identifier] = (template, aggregator)
+        if isvalid(reading["value"]):
+            self.aggregates[identifier][1].add(float(reading["value"]))
+
+    def result(self):
+        """Get the aggregated readings, and start a new period.
+
+        Returns:
+            list One reading per sensor, in the order they were first
+                 added. As well as the usual keys, each has 'min', 'max',
+                 'stddev' and 'count'.
+
+        """
+        formatted = []
+        for template, aggregator in self.aggregates.itervalues():
+            reading = dict(template)
+            reading.update(aggregator.result())
+            reading["readingtype"] = aggregator.readingtype
+            formatted.append(reading)
+        self.aggregates = collections.OrderedDict()
+        return formatted
@@ -29,12 +29,23 @@ import signal
 import urllib2
 import logging
 import subprocess
+import threading
 from logging import handlers
 from math import isnan
 from sensors import sensor
 from outputs import output
 from supports import support
 from notifications import notification
+import acquisition
+import aggregation
+import dispatcher
+import health
+import readings
+import scheduler
+
+# Sensor plugins which don't give readings (e.g. 'capture'), so that they
+# can be closed when sampling stops
+SENSORSUPPORTS = []
 
 class MissingField(Exception):
     """Exception to raise when an imported plugin is missing a required
@@ -86,7 +97,9 @@ def get_subclasses(mod, cls):
 
     Load the named subclasses for a specified module. Keys are named
     'dummy' because they are not used, and calling them this means that
-    Pylint doesn't throw a message about them not being used.
+    Pylint doesn't throw a message about them not being used. Indirect
+    subclasses (e.g. of sensor.AsyncSensor) are found too, but abstract
+    classes (which can't be instantiated) are skipped.
 
     Args:
         mod: Module from which subclass should be loaded.
@@ -96,8 +109,9 @@ def get_subclasses(mod, cls):
         The subclass.
 
     """
-    for dummy, obj in inspect.getmembers(mod):
-        if hasattr(obj, "__bases__") and cls in obj.__bases__:
+    for dummy, obj in inspect.getmembers(mod, inspect.isclass):
+        if (issubclass(obj, cls) and obj is not cls and
+                not inspect.isabstract(obj)):
             return obj
 
 def check_conn():
@@ -157,6 +171,19 @@ def led_off(pin):
     """
     GPIO.output(pin, GPIO.LOW)
 
+def leds_off():
+    """Turn LEDs off after a sample.
+
+    Turn off the green LED, and the red LED unless it is meant to stay
+    lit for the rest of the run.
+
+    """
+    if SETTINGS['GREENPIN']:
+        led_off(SETTINGS['GREENPIN'])
+    if (SETTINGS['REDPIN'] and
+            SETTINGS['FAILLED'] != "constant"):
+        led_off(SETTINGS['REDPIN'])
+
 def get_serial():
     """Get Raspberry Pi serial no.
 
@@ -214,6 +241,7 @@ def set_cfg_paths():
     cfgpaths['outputs'] = os.path.join(cfgdir, 'outputs.cfg')
     cfgpaths['notifications'] = os.path.join(cfgdir, 'notifications.cfg')
     cfgpaths['supports'] = os.path.join(cfgdir, 'supports.cfg')
+    cfgpaths['i2ccache'] = os.path.join(cfgdir, 'i2ctopology.json')
     logdir = os.path.join(basedir, 'log')
     cfgpaths['log'] = os.path.join(logdir, 'airpi.log')
     return cfgpaths
@@ -378,6 +406,91 @@ def set_up_supports():
         
     return supportplugins
 
+def discover_i2c(sensorconfig):
+    """Find which of the configured I2C sensors are connected.
+
+    Probe the I2C buses named in sensors.cfg for the sensors which can
+    be discovered, or use the result cached by a previous run.
+
+    Args:
+        sensorconfig: The parsed sensors.cfg.
+
+    Returns:
+        dict The discovered topology (see sensors/i2cdiscovery.py), or
+             None if discovery is off.
+
+    """
+    if SETTINGS['I2CDISCOVERY'] == "off":
+        return None
+    from sensors import i2cdiscovery
+    buses = set()
+    for i in sensorconfig.sections():
+        if (sensorconfig.has_option(i, "filename") and
+                sensorconfig.get(i, "filename") in i2cdiscovery.ADDRESSES and
+                sensorconfig.has_option(i, "i2cbus")):
+            buses.add(sensorconfig.getint(i, "i2cbus"))
+    if not buses:
+        return None
+    topology, cached = i2cdiscovery.discover(sorted(buses),
+                            CFGPATHS['i2ccache'], SETTINGS['I2CRESCAN'])
+    for busnum, addresses in sorted(topology.items()):
+        msg = "I2C bus " + str(busnum) + ": devices at "
+        msg += (", ".join("0x%02X" % address for address in addresses)
+                or "none")
+        if cached:
+            msg += " (cached; set i2crescan to re-scan)"
+        msg = format_msg(msg, 'info')
+        print(msg)
+        logthis("info", msg)
+    return topology
+
+def check_discovered(sensorconfig, section, enabled, topology):
+    """Decide whether to enable a sensor, given the discovered topology.
+
+    Depending on the 'i2cdiscovery' setting, a sensor whose device
+    didn't respond is disabled ('disable' or 'enable'), and a disabled
+    sensor whose device did respond is enabled ('enable'); in any case
+    the mismatch is reported.
+
+    Args:
+        sensorconfig: The parsed sensors.cfg.
+        section: The sensor's section in sensors.cfg.
+        enabled: Whether the section is enabled in sensors.cfg.
+        topology: The topology from discover_i2c().
+
+    Returns:
+        boolean Whether the sensor should be enabled.
+
+    """
+    if (topology is None or not sensorconfig.has_option(section, "filename")
+            or not sensorconfig.has_option(section, "i2cbus")):
+        return enabled
+    from sensors import i2cdiscovery
+    found = i2cdiscovery.present(topology,
+                                 sensorconfig.get(section, "filename"),
+                                 sensorconfig.getint(section, "i2cbus"))
+    if found is None or found == enabled:
+        return enabled
+    action = SETTINGS['I2CDISCOVERY']
+    if enabled:
+        msg = str(section) + " is enabled but its device was not found"
+        if action in ["disable", "enable"]:
+            msg += "; disabling it."
+            enabled = False
+        else:
+            msg += "."
+    else:
+        msg = str(section) + " is disabled but its device was found"
+        if action == "enable":
+            msg += "; enabling it."
+            enabled = True
+        else:
+            msg += "."
+    msg = format_msg(msg, 'warning')
+    print(msg)
+    logthis("warning", msg)
+    return enabled
+
 def set_up_sensors():
     """Set up AirPi sensors.
 
@@ -401,6 +514,8 @@ def set_up_sensors():
 
     SENSORNAMES = SENSORCONFIG.sections()
 
+    topology = discover_i2c(SENSORCONFIG)
+
     sensorplugins = []
 
     GPIO.setwarnings(False)
@@ -414,6 +529,7 @@ def set_up_sensors():
                 logthis("info", str(i) + " requested: " + str(enabled))
             except Exception as excep:
                 enabled = True
+            enabled = check_discovered(SENSORCONFIG, i, enabled, topology)
 
             # If enabled, load the plugin
             if enabled:
@@ -485,6 +601,30 @@ def set_up_sensors():
                     LOGGER.error(msg)
                     raise
 
+                # Options which apply to every sensor, regardless of type
+                instclass.section = i
+                if SENSORCONFIG.has_option(i, "bus"):
+                    instclass.bus = SENSORCONFIG.get(i, "bus")
+                if SENSORCONFIG.has_option(i, "deadline"):
+                    instclass.deadline = SENSORCONFIG.getfloat(i, "deadline")
+                if SENSORCONFIG.has_option(i, "ttl"):
+                    instclass.ttl = SENSORCONFIG.getfloat(i, "ttl")
+                if SENSORCONFIG.has_option(i, "sampleinterval"):
+                    interval = SENSORCONFIG.getfloat(i, "sampleinterval")
+                    if interval < instclass.mininterval:
+                        msg = "sampleinterval for " + str(i) + " is too short;"
+                        msg += " using " + str(instclass.mininterval) + "s."
+                        msg = format_msg(msg, 'warning')
+                        print(msg)
+                        logthis("warning", msg)
+                        interval = instclass.mininterval
+                    if (getattr(instclass, "readingtype", None) == "pulseCount"
+                            and interval > SETTINGS['SAMPLEFREQ']):
+                        # Counts are summed between outputs, so must be
+                        # read at least once per sample
+                        interval = SETTINGS['SAMPLEFREQ']
+                    instclass.sampleinterval = interval or None
+
                 # Check for a getval() method
                 if callable(getattr(instclass, "getval", None)):
                     sensorplugins.append(instclass)
@@ -496,6 +636,7 @@ def set_up_sensors():
                     msg = format_msg(msg, 'success')
                     print(msg)
                 else:
+                    SENSORSUPPORTS.append(instclass)
                     msg = "Loaded sensor support plugin " + str(i)
                     msg = format_msg(msg, 'success')
                     print(msg)
@@ -885,6 +1026,13 @@ def set_settings():
                 else:
                     settingslist['AVERAGECOUNT'] = averagecount
                     settingslist['PRINTUNAVERAGED'] = mainconfig.getboolean("Sampling", "printUnaveraged")
+    settingslist['ALIGN'] = True # Default
+    if mainconfig.has_option("Sampling", "align"):
+        settingslist['ALIGN'] = mainconfig.getboolean("Sampling", "align")
+    settingslist['OVERRUNPOLICY'] = "skip" # Default
+    if mainconfig.has_option("Sampling", "overrun"):
+        settingslist['OVERRUNPOLICY'] = mainconfig.get("Sampling",
+            "overrun").lower()
     settingslist['STOPAFTER'] = 0 # Default
     if mainconfig.has_option("Sampling", "stopafter"):
         if mainconfig.getint("Sampling", "stopafter") != 0:
@@ -894,6 +1042,43 @@ def set_settings():
     if mainconfig.has_option("Sampling", "dummyduration"):
         settingslist['DUMMYDURATION'] = mainconfig.getint("Sampling",
             "dummyduration")
+    settingslist['SENSORWORKERS'] = 4 # Default
+    if mainconfig.has_option("Sampling", "parallelsensors"):
+        if not mainconfig.getboolean("Sampling", "parallelsensors"):
+            settingslist['SENSORWORKERS'] = 0
+    if (settingslist['SENSORWORKERS'] and
+            mainconfig.has_option("Sampling", "sensorworkers")):
+        settingslist['SENSORWORKERS'] = mainconfig.getint("Sampling",
+            "sensorworkers")
+    settingslist['ASYNCOUTPUTS'] = True # Default
+    settingslist['OUTPUTQUEUESIZE'] = 10 # Default
+    settingslist['OUTPUTOVERFLOW'] = "dropoldest" # Default
+    if mainconfig.has_section("Outputs"):
+        if mainconfig.has_option("Outputs", "asyncoutputs"):
+            settingslist['ASYNCOUTPUTS'] = mainconfig.getboolean("Outputs",
+                "asyncoutputs")
+        if mainconfig.has_option("Outputs", "queuesize"):
+            settingslist['OUTPUTQUEUESIZE'] = mainconfig.getint("Outputs",
+                "queuesize")
+        if mainconfig.has_option("Outputs", "overflow"):
+            settingslist['OUTPUTOVERFLOW'] = mainconfig.get("Outputs",
+                "overflow").lower()
+    settingslist['SENSORDEADLINE'] = None # Default (the tick period)
+    if mainconfig.has_option("Sampling", "sensordeadline"):
+        if mainconfig.getfloat("Sampling", "sensordeadline") != 0:
+            settingslist['SENSORDEADLINE'] = mainconfig.getfloat("Sampling",
+                "sensordeadline")
+    settingslist['SKIPAFTER'] = 3 # Default
+    if mainconfig.has_option("Sampling", "skipafter"):
+        settingslist['SKIPAFTER'] = mainconfig.getint("Sampling", "skipafter")
+    settingslist['SKIPBACKOFF'] = 60 # Default
+    if mainconfig.has_option("Sampling", "skipbackoff"):
+        settingslist['SKIPBACKOFF'] = mainconfig.getfloat("Sampling",
+            "skipbackoff")
+    settingslist['MAXSKIPBACKOFF'] = 3600 # Default
+    if mainconfig.has_option("Sampling", "maxskipbackoff"):
+        settingslist['MAXSKIPBACKOFF'] = mainconfig.getfloat("Sampling",
+            "maxskipbackoff")
     # LEDs
     settingslist['REDPIN'] = mainconfig.getint("LEDs", "redPin")
     settingslist['GREENPIN'] = mainconfig.getint("LEDs", "greenPin")
@@ -903,6 +1088,21 @@ def set_settings():
     settingslist['OPERATOR'] = mainconfig.get("Misc", "operator")
     settingslist['HELP'] = mainconfig.getboolean("Misc", "help")
     settingslist['PRINTERRORS'] = mainconfig.getboolean("Misc", "printErrors")
+    settingslist['I2CDISCOVERY'] = "off" # Default
+    if mainconfig.has_option("Misc", "i2cdiscovery"):
+        settingslist['I2CDISCOVERY'] = mainconfig.get("Misc",
+            "i2cdiscovery").lower()
+        if settingslist['I2CDISCOVERY'] not in ["off", "warn", "disable",
+                                                "enable"]:
+            msg = "Unknown i2cdiscovery '" + settingslist['I2CDISCOVERY']
+            msg += "' in settings.cfg; using 'warn'."
+            msg = format_msg(msg, 'warning')
+            print(msg)
+            logthis("warning", msg)
+            settingslist['I2CDISCOVERY'] = "warn"
+    settingslist['I2CRESCAN'] = False # Default
+    if mainconfig.has_option("Misc", "i2crescan"):
+        settingslist['I2CRESCAN'] = mainconfig.getboolean("Misc", "i2crescan")
     # Debug
     settingslist['WAITTOSTART'] = mainconfig.getboolean("Debug", "waittostart")
 
@@ -964,22 +1164,24 @@ def delay_start():
     Delay sampling for a predetermined amount of time, notifying the
     user in 10-second chunks. This is primarily used to wait until the
     'start' of a full minute (i.e. zero seconds on the clock) before
-    starting a run.
+    starting a run. If samples are aligned to the clock and the sample
+    frequency is longer than a minute, wait for the start of the next
+    sample period instead (e.g. the next five minutes).
 
-    Args:
-        delay: How long the run should be delayed for (seconds).
+    Returns:
+        float The wall-clock time at which sampling should start.
 
     """
-    # First calculate the required delay length
-    now = datetime.datetime.now()
-    seconds = float(now.second + (now.microsecond / 1000000))
-    delay = (60 - seconds)
-    # Now account for any dummy runs (including if DUMMYRUN = 0)
+    # First calculate when sampling should start, allowing for any dummy
+    # runs (including if DUMMYRUN = 0)
     dummyduration = SETTINGS['DUMMYDURATION']
-    if delay > dummyduration:
-        delay = delay - dummyduration
-    else:
-        delay = delay + (60 - dummyduration)
+    period = 60
+    if SETTINGS['ALIGN'] and SETTINGS['SAMPLEFREQ'] > period:
+        period = SETTINGS['SAMPLEFREQ']
+    startat = scheduler.next_boundary(period)
+    while startat - time.time() <= dummyduration:
+        startat += period
+    delay = startat - dummyduration - time.time()
     # OK, commence the delay
     print("==========================================================")
     msg = "Sampling will start in " + str(int(delay)) + " seconds."
@@ -994,6 +1196,7 @@ def delay_start():
         print(msg)
         time.sleep(10)
         remaining -= 10
+    return startat
 
 def dummy_runs(dummyduration):
     """Do dummy runs to kick off sensors.
@@ -1015,14 +1218,242 @@ def dummy_runs(dummyduration):
     while diff < dummyduration:
         # Note there is no sleep() here, so they will read as quickly as
         # possible for 15 seconds.
-        for i in PLUGINSSENSORS:
-            if i == gpsplugininstance:
-                read_gps(i)
-            else:
-                read_sensor(i, None)
+        ACQUISITION.acquire()
         diff = time.time() - startdummy
     return True
 
+def set_up_acquisition(sensors):
+    """Set up concurrent reading of sensors.
+
+    Create the SensorAcquisition object which reads the enabled sensors
+    each sample. Sensors are read in parallel unless 'parallelsensors'
+    is turned off in settings.cfg.
+
+    Args:
+        sensors: List of enabled 'sensor' plugins.
+
+    Returns:
+        SensorAcquisition The object used to read the sensors.
+
+    """
+    engine = acquisition.SensorAcquisition(sensors, read_plugin,
+                missing_reading, SETTINGS['SENSORWORKERS'],
+                SETTINGS['SENSORDEADLINE'] or RATES.period)
+    for group in engine.groups:
+        names = ", ".join(s.sensorname for s in group.sensors)
+        logthis("info", "Sensor group (" + str(group.bus) + "): " + names)
+    return engine
+
+def set_up_derived(sensors):
+    """Set up virtual sensors.
+
+    Create the Derivation which calculates the virtual sensors (see
+    sensors/virtual.py) from the other sensors' readings each sample.
+    Virtual sensors whose inputs can't be found are left out, with a
+    warning.
+
+    Args:
+        sensors: List of enabled 'sensor' plugins, including virtual
+                 ones.
+
+    Returns:
+        Derivation The virtual sensors; its 'physical' list holds the
+                   sensors which are actually read.
+
+    """
+    from sensors import virtual
+    derived = virtual.Derivation(sensors)
+    for sensorplugin, reason in derived.dropped:
+        msg = "Virtual sensor " + str(sensorplugin.section)
+        msg += " disabled; " + reason + "."
+        msg = format_msg(msg, 'warning')
+        print(msg)
+        logthis("warning", msg)
+    if derived.virtual:
+        names = ", ".join(s.sensorname for s in derived.virtual)
+        logthis("info", "Virtual sensors (in order): " + names)
+    return derived
+
+def make_virtual_reading(sensorplugin, value, age):
+    """Create the data for a virtual sensor.
+
+    Args:
+        sensorplugin: The virtual sensor plugin.
+        value: The value calculated for it (None if it couldn't be).
+        age: How old its oldest input is (seconds).
+
+    Returns:
+        Reading The sensor data.
+
+    """
+    flags = 0
+    if value is None:
+        flags = readings.MISSING
+    reading = make_reading(sensorplugin, value,
+                           PLUGINSSUPPORTS.get("limits"), flags)
+    reading["age"] = age
+    return reading
+
+def set_up_health(sensors):
+    """Set up circuit breakers for the sensors.
+
+    Create the HealthMonitor which decides whether each sensor should be
+    read, so that sensors which keep failing are skipped for a while
+    rather than being re-read every sample.
+
+    Args:
+        sensors: List of enabled 'sensor' plugins.
+
+    Returns:
+        HealthMonitor The circuit breakers.
+
+    """
+    return health.HealthMonitor(sensors, SETTINGS['SKIPAFTER'],
+                SETTINGS['SKIPBACKOFF'], SETTINGS['MAXSKIPBACKOFF'])
+
+def report_health(sensorplugin, state):
+    """Report a change in a sensor's health.
+
+    Args:
+        sensorplugin: The sensor.
+        state: Its new state (see health.py).
+
+    """
+    if state == health.OPEN:
+        msg = sensorplugin.sensorname + " has failed "
+        msg += str(SETTINGS['SKIPAFTER']) + " times in a row; skipping it for "
+        msg += "{0:.0f}".format(HEALTH.nextprobe(sensorplugin)) + "s."
+        msg = format_msg(msg, 'warning')
+        for j in PLUGINSNOTIFICATIONS:
+            j.sendnotification("alertsensor")
+    elif state == health.HEALTHY:
+        msg = sensorplugin.sensorname + " is working again."
+        msg = format_msg(msg, 'info')
+    else:
+        return
+    logthis("info", msg)
+    if SETTINGS['PRINTERRORS']:
+        print(msg)
+
+def set_up_dispatcher(outputs):
+    """Set up background output of data.
+
+    Create the OutputDispatcher object which hands data to each enabled
+    output plugin. Outputs run in their own threads unless
+    'asyncoutputs' is turned off in settings.cfg.
+
+    Args:
+        outputs: List of enabled 'output' plugins.
+
+    Returns:
+        OutputDispatcher The object used to output data.
+
+    """
+    try:
+        return dispatcher.OutputDispatcher(outputs,
+                    SETTINGS['OUTPUTQUEUESIZE'], SETTINGS['OUTPUTOVERFLOW'],
+                    SETTINGS['ASYNCOUTPUTS'])
+    except ValueError as excep:
+        msg = format_msg(str(excep) + " in output settings.", 'error')
+        print(msg)
+        logthis("error", msg)
+        sys.exit(1)
+
+def set_up_rates(sensors):
+    """Set up the rate at which each sensor is read.
+
+    Sensors are read every sample unless they have their own
+    'sampleinterval' in sensors.cfg, and never faster than their
+    driver allows.
+
+    Args:
+        sensors: List of enabled 'sensor' plugins.
+
+    Returns:
+        RateSchedule The schedule of sensor reads.
+
+    """
+    intervals = {}
+    for sensorplugin in sensors:
+        interval = sensorplugin.sampleinterval or SETTINGS['SAMPLEFREQ']
+        intervals[sensorplugin] = max(interval, sensorplugin.mininterval)
+        if intervals[sensorplugin] != SETTINGS['SAMPLEFREQ']:
+            msg = sensorplugin.sensorname + " will be read every "
+            msg += str(intervals[sensorplugin]) + " seconds."
+            logthis("info", msg)
+    rates = scheduler.RateSchedule(sensors, intervals, SETTINGS['SAMPLEFREQ'])
+    if rates.period != SETTINGS['SAMPLEFREQ']:
+        logthis("info", "Sensor tick is " + str(rates.period) + " seconds.")
+    return rates
+
+def set_up_scheduler():
+    """Set up the timing of samples.
+
+    Create the TickScheduler which decides when each sample is taken.
+    It ticks at the sensor tick period, which is shorter than the sample
+    frequency if any sensors are read more often than that. If samples
+    are aligned to the clock, the first tick is at the start of a sample
+    period.
+
+    Returns:
+        TickScheduler The scheduler.
+
+    """
+    try:
+        return scheduler.TickScheduler(RATES.period,
+                    SETTINGS['ALIGN'], SETTINGS['OVERRUNPOLICY'],
+                    SETTINGS['SAMPLEFREQ'])
+    except ValueError as excep:
+        msg = format_msg(str(excep) + " in settings.", 'error')
+        print(msg)
+        logthis("error", msg)
+        sys.exit(1)
+
+def read_plugin(sensorplugin):
+    """Read from any sensor.
+
+    Read info from a sensor, using `read_gps()` for the GPS and
+    `read_sensor()` for everything else.
+
+    Args:
+        sensorplugin: The sensor plugin which should be read.
+
+    Returns:
+        dict The sensor data.
+
+    """
+    if sensorplugin == gpsplugininstance:
+        return read_gps(sensorplugin)
+    return read_sensor(sensorplugin, PLUGINSSUPPORTS.get("limits"))
+
+def missing_reading(sensorplugin, flags=readings.MISSING):
+    """Create a placeholder for a sensor which could not be read.
+
+    Create the data for a sensor which failed, missed its deadline or
+    was skipped, in the same format as `read_sensor()` or `read_gps()`
+    but with no value(s).
+
+    Args:
+        sensorplugin: The sensor plugin which could not be read.
+        flags: The flags for the reading (e.g. readings.SKIPPED as well
+               as readings.MISSING).
+
+    Returns:
+        dict The (empty) sensor data.
+
+    """
+    if sensorplugin == gpsplugininstance:
+        reading = {}
+        reading["latitude"] = float("nan")
+        reading["longitude"] = float("nan")
+        reading["disposition"] = "unknown"
+        reading["exposure"] = "unknown"
+        reading["name"] = sensorplugin.valname
+        reading["sensor"] = sensorplugin.sensorname
+        reading["skipped"] = bool(flags & readings.SKIPPED)
+        return reading
+    return make_reading(sensorplugin, None, None, flags)
+
 def read_sensor(sensorplugin, limit):
     """Read from a non-GPS sensor.
 
@@ -1033,23 +1464,45 @@ def read_sensor(sensorplugin, limit):
         sensorplugin: The sensor plugin which should be read.
 
     Returns:
-        dict The sensor data.
+        Reading The sensor data.
 
     """
-    reading = {}
-    reading["value"] = sensorplugin.getval()
-    reading["unit"] = sensorplugin.valunit
-    reading["symbol"] = sensorplugin.valsymbol
-    reading["name"] = sensorplugin.valname
-    reading["sensor"] = sensorplugin.sensorname
-    reading["description"] = sensorplugin.description
-    reading["readingtype"] = sensorplugin.readingtype
-    if limit is not None and limit is not False:
-        reading["breach"] = limit.isbreach(reading["name"], reading["value"], reading["unit"])
-    else:
-        reading["breach"] = False
+    value = sensorplugin.getval()
+    flags = 0
+    if sensorplugin.stale:
+        flags = readings.STALE
+    reading = make_reading(sensorplugin, value, limit, flags)
+    if sensorplugin.valuetime is not None:
+        # Read in the background (see AsyncSensor), so the value is
+        # older than the reading
+        reading.timestamp = sensorplugin.valuetime
+    extras = sensorplugin.getextras()
+    if extras:
+        reading.extras = dict(extras)
     return reading
 
+def make_reading(sensorplugin, value, limit, flags=0):
+    """Create the data for one sensor reading.
+
+    The sensor's name, units, etc. are shared between all of its
+    readings; only the value, time and flags are stored per reading.
+
+    Args:
+        sensorplugin: The sensor plugin which was read.
+        value: The value read from the sensor.
+        limit: The 'limits' support plugin, if enabled.
+        flags: Any flags (e.g. readings.MISSING) for the reading.
+
+    Returns:
+        Reading The sensor data.
+
+    """
+    info = readings.SensorInfo.get(sensorplugin)
+    if limit is not None and limit is not False:
+        if limit.isbreach(info.name, value, info.unit):
+            flags |= readings.BREACH
+    return readings.Reading(info, value, time.time(), flags)
+
 def read_gps(sensorplugin):
     """Read from a GPS sensor.
 
@@ -1075,6 +1528,10 @@ def read_gps(sensorplugin):
     reading["exposure"] = val[4]
     reading["name"] = sensorplugin.valname
     reading["sensor"] = sensorplugin.sensorname
+    # Fix quality (age, mode, errors, satellites)
+    extras = sensorplugin.getextras()
+    if extras:
+        reading.update(extras)
     return reading
 
 def sample():
@@ -1091,193 +1548,188 @@ def sample():
     print(msg)
     print("==========================================================")
     global samples
+    global ledtimer
     greenhaslit = False
     redhaslit = False
-    lastupdated = 0
     alreadysentsensornotifications = False
     alreadysentoutputnotifications = False
     if 'AVERAGEFREQ' in SETTINGS:
         countcurrent = 0
         counttarget = SETTINGS['AVERAGECOUNT']
-        dataset = {}
+        dataset = aggregation.DatasetAggregator()
+    # The latest reading from each sensor, and the time it was read
+    latest = {}
+    # pulseCount values read since the last output
+    counts = {}
+    outputs = scheduler.RateSchedule([None], {}, SETTINGS['SAMPLEFREQ'])
     while True:
         try:
-            curtime = time.time()
-            timesincelast = curtime - lastupdated
-            sampletime = None
-            if timesincelast > (SETTINGS['SAMPLEFREQ'] - 0.01):
-                if (timesincelast > (SETTINGS['SAMPLEFREQ'] + 0.02)) and (samples is not 0):
-                    print(format_msg("Can't keep up - requested sample frequency is too fast!", "warning"))
-                lastupdated = curtime
-                data = []
-                # Read the sensors
-                failedsensors = []
-                sampletime = datetime.datetime.now()
-                for sensor in PLUGINSSENSORS:
-                    datadict = {}
-                    if sensor == gpsplugininstance:
-                        datadict = read_gps(sensor)
-                    else:
-                        datadict = read_sensor(sensor, PLUGINSSUPPORTS["limits"])
-                        # TODO: Ensure this is robust
-                        if (datadict["value"] is None or
-                                isnan(float(datadict["value"])) or
-                                datadict["value"] == 0):
-                            failedsensors.append(sensor.sensorname)
-                    # Average the data if required
-                    if (('AVERAGEFREQ' in SETTINGS) and
-                            (sensor != gpsplugininstance)):
-                        identifier = datadict['sensor'] + "-"
-                        identifier += datadict['name']
-                        if identifier not in dataset:
-                            dataset[identifier] = {}
-                            temp = datadict.copy()
-                            temp.pop("value", None)
-                            for thekey, thevalue in temp.iteritems():
-                                if thekey not in dataset[identifier]:
-                                    dataset[identifier][thekey] = thevalue
-                            dataset[identifier]['values'] = []
-                        dataset[identifier]['values'].append(datadict["value"])
-                    # Always record raw values for every sensor
-                    data.append(datadict)
-                # Record the outcome of reading sensors
+            overruns = SCHEDULER.overruns
+            ticktime = SCHEDULER.wait()
+            if SCHEDULER.overruns > overruns and samples != 0:
+                msg = "Can't keep up - requested sample frequency is too fast!"
+                msg += " (" + "{0:.2f}".format(SCHEDULER.lastlate) + "s late)"
+                print(format_msg(msg, "warning"))
+            # Read the sensors which are due this tick
+            failedsensors = []
+            due, skipped = HEALTH.filter(RATES.due(ticktime))
+            results = ACQUISITION.acquire(due, ticktime)
+            for sensor in ACQUISITION.late:
+                msg = "No reading from " + sensor.sensorname
+                msg += " within its deadline."
+                msg = format_msg(msg, 'error')
+                logthis("error", msg)
+                if SETTINGS['PRINTERRORS']:
+                    print(msg)
+            for sensor, excep in ACQUISITION.errors.iteritems():
+                msg = "Exception reading " + sensor.sensorname + ": "
+                msg += str(excep)
+                msg = format_msg(msg, 'error')
+                logthis("error", msg)
+                if SETTINGS['PRINTERRORS']:
+                    print(msg)
+            for sensor, datadict in zip(due, results):
+                failed = (sensor in ACQUISITION.late or
+                          sensor in ACQUISITION.errors)
+                if sensor != gpsplugininstance:
+                    # TODO: Ensure this is robust
+                    # Zero is a valid pulse count (no rain, no wind)
+                    if (datadict["value"] is None or
+                            isnan(float(datadict["value"])) or
+                            (datadict["value"] == 0 and
+                                datadict["readingtype"] != "pulseCount")):
+                        failedsensors.append(sensor.sensorname)
+                        failed = True
+                    elif datadict["readingtype"] == "pulseCount":
+                        # Sum the counts since the last output
+                        counts[sensor] = (counts.get(sensor, 0) +
+                                          datadict["value"])
+                        datadict["value"] = counts[sensor]
+                # Keep the last good reading if this one failed
+                if (sensor not in latest or
+                        (sensor not in ACQUISITION.late and
+                            sensor not in ACQUISITION.errors)):
+                    # Values read in the background can predate the tick
+                    readtime = ticktime
+                    if isinstance(datadict, readings.Reading):
+                        readtime = min(ticktime, datadict.timestamp)
+                    latest[sensor] = (datadict, readtime)
+                report_health(sensor, HEALTH.record(sensor, not failed))
+            for sensor in skipped:
+                latest[sensor] = (missing_reading(sensor,
+                        readings.MISSING | readings.SKIPPED), ticktime)
+            # Record the outcome of reading sensors
+            if failedsensors:
+                if not alreadysentsensornotifications:
+                    for j in PLUGINSNOTIFICATIONS:
+                        j.sendnotification("alertsensor")
+                    alreadysentsensornotifications = True
+                msg = "Failed to obtain data from these sensors: " + ", ".join(failedsensors)
+                msg = format_msg(msg, 'error')
+                logthis("error", msg)
+                if SETTINGS['PRINTERRORS']:
+                    print(msg)
+            elif due and not skipped:
+                msg = "Data successfully obtained from all sensors."
+                msg = format_msg(msg, 'success')
+                logthis("info", msg)
+            if not outputs.due(ticktime):
+                # Only some sensors are read on this tick; don't output
+                # until the next sample is due
+                continue
+            # Use the scheduled time, so samples fall on exact boundaries
+            sampletime = datetime.datetime.fromtimestamp(ticktime)
+            # Output the latest reading from every sensor, with its age
+            data = []
+            current = {}
+            for sensor in PLUGINSSENSORS:
+                datadict, readtime = latest[sensor]
+                datadict = datadict.copy()
+                datadict["age"] = ticktime - readtime
+                current[sensor] = datadict
+                # Average the data if required
+                if (('AVERAGEFREQ' in SETTINGS) and
+                        (sensor != gpsplugininstance)):
+                    dataset.add(datadict)
+                # Always record raw values for every sensor
+                data.append(datadict)
+            # Virtual sensors, calculated from the readings above
+            for datadict in DERIVED.evaluate(current, make_virtual_reading):
                 if 'AVERAGEFREQ' in SETTINGS:
-                    countcurrent += 1
-                if failedsensors:
-                    if not alreadysentsensornotifications:
-                        for j in PLUGINSNOTIFICATIONS:
-                            j.sendnotification("alertsensor")
-                        alreadysentsensornotifications = True
-                    msg = "Failed to obtain data from these sensors: " + ", ".join(failedsensors)
-                    msg = format_msg(msg, 'error')
-                    logthis("error", msg)
-                    if SETTINGS['PRINTERRORS']:
-                        print(msg)
-                else:
-                    msg = "Data successfully obtained from all sensors."
-                    msg = format_msg(msg, 'success')
-                    logthis("info", msg)
+                    dataset.add(datadict)
+                data.append(datadict)
+            counts = {}
+            if 'AVERAGEFREQ' in SETTINGS:
+                countcurrent += 1
 
-                # Output data
-                try:
-                    # Averaging
-                    if 'AVERAGEFREQ' in SETTINGS:
-                        if countcurrent == counttarget:
-                            data = average_dataset(identifier, dataset)
-                            dataset = {}
-                    if (('AVERAGEFREQ' in SETTINGS and
-                        countcurrent == counttarget) or
-                            ('AVERAGEFREQ' not in SETTINGS)):
-                        if 'AVERAGEFREQ' in SETTINGS:
-                            countcurrent = 0
-                        # Output the data
-                        outputsworking = True
-                        for i in PLUGINSOUTPUTS:
-                            LOGGER.debug(" Dataset to output to " + str(i) + ":")
-                            LOGGER.debug(" " + str(data))
-                            if i.output_data(data, sampletime) == False:
-                                outputsworking = False
-                        # Record the outcome of outputting data
-                        if outputsworking:
-                            msg = "Data output in all requested formats."
-                            msg = format_msg(msg, 'success')
-                            logthis("info", msg)
-                            if (SETTINGS['GREENPIN'] and
-                                    (SETTINGS['SUCCESSLED'] == "all" or
-                                    (SETTINGS['SUCCESSLED'] == "first" and
-                                        not greenhaslit))):
-                                led_on(SETTINGS['GREENPIN'])
-                                greenhaslit = True
-                        else:
-                            if not alreadysentoutputnotifications:
-                                for j in PLUGINSNOTIFICATIONS:
-                                    j.sendnotification("alertoutput")
-                                alreadysentoutputnotifications = True
-                            msg = "Failed to output in all requested formats."
-                            msg = format_msg(msg, 'error')
-                            logthis("error", msg)
-                            if SETTINGS['PRINTERRORS']:
-                                print(msg)
-                            if (SETTINGS['REDPIN'] and
-                                    (SETTINGS['FAILLED'] in ["all", "constant"] or
-                                    (SETTINGS['FAILLED'] == "first" and
-                                        not redhaslit))):
-                                led_on(SETTINGS['REDPIN'])
-                                redhaslit = True
-
-                except KeyboardInterrupt:
-                    raise
-                except Exception as excep:
-                    msg = "Exception during output: %s" % excep
-                    msg = format_msg(msg, 'error')
-                    logthis("error", msg)
-                else:
-                    # Delay before turning off LED
-                    time.sleep(1)
-                    if SETTINGS['GREENPIN']:
-                        led_off(SETTINGS['GREENPIN'])
-                    if (SETTINGS['REDPIN'] and
-                            SETTINGS['FAILLED'] != "constant"):
-                        led_off(SETTINGS['REDPIN'])
-                samples += 1
-                if samples == SETTINGS['STOPAFTER']:
-                    msg = "Reached requested number of samples - stopping run."
-                    msg = format_msg(msg, 'sys')
-                    print(msg)
-                    logthis("info", msg)
-                    stop_sampling(None, None)
+            # Output data
             try:
-                time.sleep(SETTINGS['SAMPLEFREQ'] - (time.time() - curtime))
+                # Averaging
+                if 'AVERAGEFREQ' in SETTINGS:
+                    if countcurrent == counttarget:
+                        data = dataset.result()
+                if (('AVERAGEFREQ' in SETTINGS and
+                    countcurrent == counttarget) or
+                        ('AVERAGEFREQ' not in SETTINGS)):
+                    if 'AVERAGEFREQ' in SETTINGS:
+                        countcurrent = 0
+                    # Output the data
+                    LOGGER.debug(" Dataset to output:")
+                    LOGGER.debug(" " + str(data))
+                    DISPATCHER.dispatch(data, sampletime)
+                # Record the outcome of outputting data. Outputs run in
+                # the background, so these may be from earlier samples.
+                successes, failures, failed = DISPATCHER.collect()
+                if successes or failures:
+                    if not failures:
+                        msg = "Data output in all requested formats."
+                        msg = format_msg(msg, 'success')
+                        logthis("info", msg)
+                        if (SETTINGS['GREENPIN'] and
+                                (SETTINGS['SUCCESSLED'] == "all" or
+                                (SETTINGS['SUCCESSLED'] == "first" and
+                                    not greenhaslit))):
+                            led_on(SETTINGS['GREENPIN'])
+                            greenhaslit = True
+                    else:
+                        if not alreadysentoutputnotifications:
+                            for j in PLUGINSNOTIFICATIONS:
+                                j.sendnotification("alertoutput")
+                            alreadysentoutputnotifications = True
+                        msg = "Failed to output data via: " + ", ".join(failed)
+                        msg = format_msg(msg, 'error')
+                        logthis("error", msg)
+                        if SETTINGS['PRINTERRORS']:
+                            print(msg)
+                        if (SETTINGS['REDPIN'] and
+                                (SETTINGS['FAILLED'] in ["all", "constant"] or
+                                (SETTINGS['FAILLED'] == "first" and
+                                    not redhaslit))):
+                            led_on(SETTINGS['REDPIN'])
+                            redhaslit = True
+
             except KeyboardInterrupt:
                 raise
-            except Exception:
-                pass # fall back on old method...
+            except Exception as excep:
+                msg = "Exception during output: %s" % excep
+                msg = format_msg(msg, 'error')
+                logthis("error", msg)
+            else:
+                # Turn off the LEDs after a second, without holding up
+                # sampling while we wait
+                ledtimer = threading.Timer(1, leds_off)
+                ledtimer.daemon = True
+                ledtimer.start()
+            samples += 1
+            if samples == SETTINGS['STOPAFTER']:
+                msg = "Reached requested number of samples - stopping run."
+                msg = format_msg(msg, 'sys')
+                print(msg)
+                logthis("info", msg)
+                stop_sampling(None, None)
         except KeyboardInterrupt:
             stop_sampling(None, None)
 
-def average_dataset(identifier, dataset):
-    """Average a dataset.
-
-    Take a dataset consisting of 'n' separate readings, and calculate
-    the mean across those readings. The dataset will be a dict of dicts;
-    each element in the first dict is a single time point in the set to
-    be averaged. Each of these single time points is a dict which
-    contains one reading for each of the enabled sensors.
-
-    Args:
-        identifier: The unique identifier for the sensor and property
-            being averaged.
-        dataset: The list of 'n' separate time points to be averaged.
-
-    Returns:
-        list The averaged data.
-
-    """
-    totals = {}
-    numberofsamples = {}
-    # For each identifier, sum the indidivual values in the
-    # dataset[identifier]['values'] list.
-    # Count the number of samples as we go along, in case one sensor has
-    # missed any readings.
-    for identifier, properties in dataset.iteritems():
-        totals[identifier] = 0
-        numberofsamples[identifier] = 0
-        for value in properties['values']:
-            if value != "-" and value is not None and not isnan(value):
-                totals[identifier] += value
-                numberofsamples[identifier] += 1
-    # For each identifier, divide the sum by the number of samples
-    for identifier, total in totals.iteritems():
-        dataset[identifier]['value'] = total / numberofsamples[identifier]
-        dataset[identifier]['readingtype'] = "average"
-    # Re-format to that expected by output_data() methods of the output
-    # plugins
-    formatted = []
-    for identifier in dataset:
-        dataset[identifier]['identifier'] = identifier
-        formatted.append(dataset[identifier])
-    return formatted
-
 def stop_sampling(dummy, _):
     """Stop a run.
 
@@ -1306,6 +1758,20 @@ def stop_sampling(dummy, _):
         # raises it's own error and quits before here, but quit again
         # just in case.
         sys.exit(1)
+    if ledtimer:
+        ledtimer.cancel()
+    for sensorplugin in (PLUGINSSENSORS or []) + SENSORSUPPORTS:
+        try:
+            sensorplugin.close()
+        except Exception as excep:
+            msg = "Exception closing " + sensorplugin.sensorname + ": "
+            msg += str(excep)
+            logthis("error", format_msg(msg, 'error'))
+    try:
+        # Give queued data a chance to be output
+        DISPATCHER.stop(5)
+    except NameError:
+        pass
     led_off(SETTINGS['GREENPIN'])
     led_off(SETTINGS['REDPIN'])
     timedelta = datetime.datetime.utcnow() - STARTTIME
@@ -1316,6 +1782,40 @@ def stop_sampling(dummy, _):
     msg = format_msg(msg, 'sys')
     print(msg)
     logthis("info", msg)
+    try:
+        stats = SCHEDULER.stats()
+        msg = "Timing: " + str(stats["overruns"]) + " overruns, "
+        msg += str(stats["skipped"]) + " skipped samples, "
+        msg += str(stats["clocksteps"]) + " system time changes, jitter "
+        msg += "{0:.3f}".format(stats["meanjitter"]) + "s mean / "
+        msg += "{0:.3f}".format(stats["maxjitter"]) + "s max."
+        msg = format_msg(msg, 'sys')
+        print(msg)
+        logthis("info", msg)
+    except NameError:
+        pass
+    try:
+        for sensorplugin, stats in HEALTH.stats().iteritems():
+            if not stats["failures"]:
+                continue
+            msg = "Health: " + sensorplugin.sensorname + " "
+            msg += str(stats["failures"]) + " failures, "
+            msg += str(stats["skipped"]) + " skipped readings, now "
+            msg += stats["state"] + "."
+            msg = format_msg(msg, 'sys')
+            print(msg)
+            logthis("info", msg)
+    except NameError:
+        pass
+    # Only loaded if an I2C sensor is enabled
+    i2cbus = sys.modules.get("sensors.i2cbus")
+    if i2cbus is not None:
+        for device, counts in sorted(i2cbus.stats().items()):
+            msg = "I2C: " + device + " " + str(counts["transactions"])
+            msg += " transactions, " + str(counts["errors"]) + " errors."
+            msg = format_msg(msg, 'sys')
+            print(msg)
+            logthis("info", msg)
     msg = "Sampling stopped."
     msg = format_msg(msg, 'sys')
     print(msg)
@@ -1335,6 +1835,7 @@ if __name__ == '__main__':
 
     #Set variables
     gpsplugininstance = None
+    ledtimer = None
     SETTINGS = set_settings()
     notificationsMade = {}
     samples = 0
@@ -1362,7 +1863,13 @@ if __name__ == '__main__':
     #Set up plugins
     PLUGINSSUPPORTS = set_up_supports()
     PLUGINSSENSORS = set_up_sensors()
+    DERIVED = set_up_derived(PLUGINSSENSORS)
+    PLUGINSSENSORS = DERIVED.physical
+    RATES = set_up_rates(PLUGINSSENSORS)
+    ACQUISITION = set_up_acquisition(PLUGINSSENSORS)
+    HEALTH = set_up_health(PLUGINSSENSORS)
     PLUGINSOUTPUTS = set_up_outputs()
+    DISPATCHER = set_up_dispatcher(PLUGINSOUTPUTS)
     PLUGINSNOTIFICATIONS = set_up_notifications()
 
     # Set up metadata
@@ -1390,8 +1897,9 @@ if __name__ == '__main__':
                 print(format_msg(output.get_help(), "help"))
 
     # Wait until the start of the next minute
+    SCHEDULER = set_up_scheduler()
     if SETTINGS["WAITTOSTART"]:
-        delay_start()
+        SCHEDULER.start(delay_start())
 
     if SETTINGS['DUMMYDURATION'] != 0:
         dummy_runs(SETTINGS['DUMMYDURATION'])
@@ -0,0 +1,216 @@
+"""Hand data to AirPi output plugins without waiting for them.
+
+Each output plugin gets its own worker thread and a bounded queue of
+samples waiting to be output. The main sampling loop only ever adds to
+the queues, so a slow upstream service (an HTTP POST to dweet.io, a
+MySQL connection, etc.) can't delay the next sensor reading. When a
+queue is full, its 'overflow' policy decides what happens:
+
+- dropoldest: discard the oldest waiting sample to make room.
+- block: wait for the output to catch up (sampling is delayed).
+- coalesce: discard *all* waiting samples, so that the output only
+  ever receives the most recent one.
+
+Each worker counts its successes and failures, so that the main loop
+can still drive the LEDs and notifications.
+
+"""
+import collections
+import threading
+
+OVERFLOWPOLICIES = ["dropoldest", "block", "coalesce"]
+
+class OutputWorker(object):
+    """Feed one output plugin from a bounded queue.
+
+    If 'threaded' is False, samples are output immediately in the
+    calling thread instead; this is the old, synchronous behaviour.
+
+    """
+
+    def __init__(self, plugin, queuesize=10, overflow="dropoldest", threaded=True):
+        """Initialise.
+
+        Args:
+            plugin: The output plugin to feed.
+            queuesize: Maximum number of samples waiting to be output.
+            overflow: What to do when the queue is full; one of
+                      OVERFLOWPOLICIES.
+            threaded: Whether to output from a separate thread.
+
+        """
+        if overflow not in OVERFLOWPOLICIES:
+            raise ValueError("Unknown overflow policy '" + str(overflow) + "'")
+        self.plugin = plugin
+        self.queuesize = max(int(queuesize), 1)
+        self.overflow = overflow
+        self.pending = collections.deque()
+        self.cond = threading.Condition()
+        self.successes = 0
+        self.failures = 0
+        self.dropped = 0
+        self.lasterror = None
+        self.running = True
+        self.thread = None
+        if threaded:
+            self.thread = threading.Thread(target=self.run,
+                                           name="output-" + plugin.getname())
+            self.thread.daemon = True
+            self.thread.start()
+
+    def put(self, data, sampletime):
+        """Queue a sample for output.
+
+        Args:
+            data: The data to be output.
+            sampletime: datetime representing the time the sample was taken.
+
+        """
+        if self.thread is None:
+            self.record(self.output(data, sampletime))
+            return
+        with self.cond:
+            if len(self.pending) >= self.queuesize:
+                if self.overflow == "block":
+                    while len(self.pending) >= self.queuesize and self.running:
+                        self.cond.wait()
+                elif self.overflow == "coalesce":
+                    self.dropped += len(self.pending)
+                    self.pending.clear()
+                else:
+                    self.pending.popleft()
+                    self.dropped += 1
+            self.pending.append((data, sampletime))
+            self.cond.notify_all()
+
+    def output(self, data, sampletime):
+        """Output one sample via the plugin.
+
+        Args:
+            data: The data to be output.
+            sampletime: datetime representing the time the sample was taken.
+
+        Returns:
+            boolean False if the plugin failed to output the data.
+
+        """
+        try:
+            return self.plugin.output_data(data, sampletime) != False
+        except Exception as excep:
+            with self.cond:
+                self.lasterror = excep
+            return False
+
+    def record(self, succeeded):
+        """Record the outcome of outputting one sample.
+
+        Args:
+            succeeded: boolean Whether the output succeeded.
+
+        """
+        with self.cond:
+            if succeeded:
+                self.successes += 1
+            else:
+                self.failures += 1
+
+    def run(self):
+        """Worker thread: output samples as they are queued."""
+        while True:
+            with self.cond:
+                while not self.pending and self.running:
+                    self.cond.wait()
+                if not self.pending:
+                    return
+                data, sampletime = self.pending.popleft()
+                self.cond.notify_all()
+            self.record(self.output(data, sampletime))
+
+    def stop(self, timeout=None):
+        """Stop the worker once its queue is empty.
+
+        Args:
+            timeout: Maximum time (seconds) to wait for queued samples
+                     to be output.
+
+        """
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+class OutputDispatcher(object):
+    """Hand data to all enabled output plugins.
+
+    """
+
+    def __init__(self, plugins, queuesize=10, overflow="dropoldest", threaded=True):
+        """Initialise.
+
+        Plugins may override the default queue size and overflow policy
+        with 'queuesize' and 'overflow' in outputs.cfg.
+
+        Args:
+            plugins: List of enabled output plugins.
+            queuesize: Default maximum number of samples waiting for each
+                       output.
+            overflow: Default overflow policy.
+            threaded: Whether outputs run in their own threads.
+
+        """
+        self.workers = []
+        for plugin in plugins:
+            size = plugin.params.get("queuesize") or queuesize
+            policy = (plugin.params.get("overflow") or overflow).strip().lower()
+            self.workers.append(OutputWorker(plugin, size, policy, threaded))
+        self.reported = dict((worker, (0, 0)) for worker in self.workers)
+
+    def dispatch(self, data, sampletime):
+        """Queue a sample for every output.
+
+        Args:
+            data: The data to be output.
+            sampletime: datetime representing the time the sample was taken.
+
+        """
+        for worker in self.workers:
+            worker.put(data, sampletime)
+
+    def collect(self):
+        """Collect the outcomes of outputs since the last call.
+
+        Returns:
+            int, int, list The number of successful outputs, the number
+                           of failed outputs, and the names of the plugins
+                           which failed.
+
+        """
+        successes = 0
+        failures = 0
+        failed = []
+        for worker in self.workers:
+            with worker.cond:
+                current = (worker.successes, worker.failures)
+                lasterror = worker.lasterror
+                worker.lasterror = None
+            previous = self.reported[worker]
+            self.reported[worker] = current
+            successes += current[0] - previous[0]
+            if current[1] > previous[1]:
+                failures += current[1] - previous[1]
+                name = worker.plugin.getname()
+                if lasterror is not None:
+                    name += " (" + str(lasterror) + ")"
+                failed.append(name)
+        return successes, failures, failed
+
+    def stop(self, timeout=None):
+        """Stop all workers, giving each a chance to empty its queue.
+
+        Args:
+            timeout: Maximum time (seconds) to wait for each worker.
+
+        """
+        for worker in self.workers:
+            worker.stop(timeout)
@@ -0,0 +1,224 @@
+"""Stop re-reading AirPi sensors which keep failing.
+
+Each sensor has a circuit breaker with three states:
+
+- healthy: the last reading succeeded.
+- degraded: recent readings have failed, but the sensor is still read
+  every time it is due.
+- open: the sensor has failed too many times in a row, so it is skipped
+  (not read at all) until its next probe. If the probe fails, the wait
+  until the next one doubles, up to a maximum; if it succeeds, the
+  sensor is healthy again.
+
+A dead sensor then costs nothing on most ticks, rather than a timeout
+on every one. Failure counts and the time spent in each state are kept
+for every sensor.
+
+"""
+from scheduler import monotonic
+
+HEALTHY = "healthy"
+DEGRADED = "degraded"
+OPEN = "open"
+STATES = [HEALTHY, DEGRADED, OPEN]
+
+class SensorHealth(object):
+    """The circuit breaker for one sensor.
+
+    """
+
+    def __init__(self, openafter=3, backoff=60, maxbackoff=3600):
+        """Initialise.
+
+        Args:
+            openafter: How many failures in a row open the breaker. 0
+                       means never open it.
+            backoff: How long (seconds) to wait before the first probe
+                     after the breaker opens.
+            maxbackoff: The longest wait (seconds) between probes.
+
+        """
+        self.openafter = openafter
+        self.initialbackoff = backoff
+        self.maxbackoff = maxbackoff
+        self.state = HEALTHY
+        self.since = monotonic()
+        self.timein = dict((state, 0.0) for state in STATES)
+        self.failures = 0
+        self.consecutive = 0
+        self.successes = 0
+        self.skipped = 0
+        self.backoff = backoff
+        self.nextprobe = None
+
+    def setstate(self, state, now):
+        """Move to a new state, recording the time spent in the old one.
+
+        Args:
+            state: One of STATES.
+            now: The monotonic time.
+
+        Returns:
+            boolean True if the state changed.
+
+        """
+        if state == self.state:
+            return False
+        self.timein[self.state] += now - self.since
+        self.state = state
+        self.since = now
+        return True
+
+    def allow(self, now):
+        """Check whether the sensor should be read.
+
+        Args:
+            now: The monotonic time.
+
+        Returns:
+            boolean False if the breaker is open and the next probe
+                    isn't due yet.
+
+        """
+        if self.state == OPEN and now < self.nextprobe:
+            self.skipped += 1
+            return False
+        return True
+
+    def record(self, success, now):
+        """Record the outcome of reading the sensor.
+
+        Args:
+            success: Whether the reading succeeded.
+            now: The monotonic time.
+
+        Returns:
+            boolean True if the state changed.
+
+        """
+        if success:
+            self.successes += 1
+            self.consecutive = 0
+            self.backoff = self.initialbackoff
+            self.nextprobe = None
+            return self.setstate(HEALTHY, now)
+        self.failures += 1
+        self.consecutive += 1
+        if self.state == OPEN:
+            # A failed probe; wait longer before the next one
+            self.backoff = min(self.backoff * 2, self.maxbackoff)
+            self.nextprobe = now + self.backoff
+            return False
+        if self.openafter and self.consecutive >= self.openafter:
+            self.nextprobe = now + self.backoff
+            return self.setstate(OPEN, now)
+        return self.setstate(DEGRADED, now)
+
+    def stats(self, now=None):
+        """Get the sensor's health statistics.
+
+        Args:
+            now: The monotonic time; defaults to now.
+
+        Returns:
+            dict The state, the time in it so far, the total time in each
+                 state, and the numbers of successes, failures (in total
+                 and in a row) and skipped reads.
+
+        """
+        if now is None:
+            now = monotonic()
+        timein = dict(self.timein)
+        timein[self.state] += now - self.since
+        return {
+            "state": self.state,
+            "timeinstate": now - self.since,
+            "timein": timein,
+            "successes": self.successes,
+            "failures": self.failures,
+            "consecutive": self.consecutive,
+            "skipped": self.skipped
+            }
+
+class HealthMonitor(object):
+    """The circuit breakers for a set of sensors.
+
+    """
+
+    def __init__(self, sensors, openafter=3, backoff=60, maxbackoff=3600):
+        """Initialise.
+
+        Args:
+            sensors: List of sensor plugins.
+            openafter: See SensorHealth.
+            backoff: See SensorHealth.
+            maxbackoff: See SensorHealth.
+
+        """
+        self.health = dict((sensorplugin, SensorHealth(openafter, backoff,
+                                                       maxbackoff))
+                           for sensorplugin in sensors)
+
+    def filter(self, sensors):
+        """Split sensors into those to read and those to skip.
+
+        Args:
+            sensors: The sensors which are due.
+
+        Returns:
+            list, list The sensors to read and the sensors to skip, each
+                       in their original order.
+
+        """
+        now = monotonic()
+        read = []
+        skip = []
+        for sensorplugin in sensors:
+            if self.health[sensorplugin].allow(now):
+                read.append(sensorplugin)
+            else:
+                skip.append(sensorplugin)
+        return read, skip
+
+    def record(self, sensorplugin, success):
+        """Record the outcome of reading a sensor.
+
+        Args:
+            sensorplugin: The sensor which was read.
+            success: Whether the reading succeeded.
+
+        Returns:
+            string The sensor's new state if it changed, otherwise None.
+
+        """
+        health = self.health[sensorplugin]
+        if health.record(success, monotonic()):
+            return health.state
+        return None
+
+    def nextprobe(self, sensorplugin):
+        """Get how long until an open sensor is next probed.
+
+        Args:
+            sensorplugin: The sensor.
+
+        Returns:
+            float The time (seconds), or None if the breaker isn't open.
+
+        """
+        health = self.health[sensorplugin]
+        if health.nextprobe is None:
+            return None
+        return max(health.nextprobe - monotonic(), 0)
+
+    def stats(self):
+        """Get the health statistics for every sensor.
+
+        Returns:
+            dict The statistics (see SensorHealth.stats()) for each
+                 sensor plugin.
+
+        """
+        now = monotonic()
+        return dict((sensorplugin, health.stats(now))
+                    for sensorplugin, health in self.health.iteritems())
@@ -228,10 +228,13 @@ class HTTP(output.Output):
 
         # take average reading etc
         for i, r in enumerate(self.tempHistory[0]):
-            if self.readingtypes[i] == "sample":
-                t[i+1] = numpy.mean(self.tempHistory[:self.tempHistoryAt,i])
-            elif self.readingtypes[i] == "pulseCount":
+            if self.readingtypes[i] == "pulseCount":
                 t[i+1] = numpy.sum(self.tempHistory[:self.tempHistoryAt,i])
+            elif self.readingtypes[i] == "direction":
+                angles = numpy.radians(self.tempHistory[:self.tempHistoryAt,i])
+                t[i+1] = numpy.degrees(numpy.arctan2(numpy.mean(numpy.sin(angles)), numpy.mean(numpy.cos(angles)))) % 360
+            else:
+                t[i+1] = numpy.mean(self.tempHistory[:self.tempHistoryAt,i])
         self.tempHistoryAt = 0 #reset
 
         self.historicData[self.historicAt] = t
@@ -18,7 +18,8 @@ class Output(Plugin):
     """
 
     requiredGenericParams = ["target"]
-    optionalGenericParams = ["calibration", "metadata", "limits"]
+    optionalGenericParams = ["calibration", "metadata", "limits", "queuesize",
+                             "overflow"]
 
     def __init__(self, config):
         super(Output, self).__init__(config, "outputs")
@@ -0,0 +1,207 @@
+"""Compact records of AirPi sensor readings.
+
+Most of what describes a reading (the sensor name, units, symbol,
+description, etc.) never changes from one sample to the next, so it is
+held once per sensor in a SensorInfo. Each Reading then only carries
+what does change: the value, the time it was read, some flags, and any
+extra data for that reading. Readings behave like the dicts which were
+used previously (r["value"], r["name"], r.get(...), dict(r), etc.), so
+existing output plugins work unchanged.
+
+"""
+
+# Flags
+BREACH = 1  # The value breaches a limit (see the 'limits' support plugin)
+MISSING = 2 # The sensor could not be read
+SKIPPED = 4 # The sensor wasn't read, because it keeps failing (see health.py)
+STALE = 8   # The value is older than the sensor's 'ttl' (see AsyncSensor)
+
+class SensorInfo(object):
+    """The static description of a sensor's readings.
+
+    """
+    __slots__ = ["unit", "symbol", "name", "sensor", "description",
+                 "readingtype"]
+
+    # One SensorInfo per sensor plugin
+    interned = {}
+
+    def __init__(self, sensorplugin):
+        self.unit = sensorplugin.valunit
+        self.symbol = sensorplugin.valsymbol
+        self.name = sensorplugin.valname
+        self.sensor = sensorplugin.sensorname
+        self.description = sensorplugin.description
+        self.readingtype = sensorplugin.readingtype
+
+    @classmethod
+    def get(cls, sensorplugin):
+        """Get the (shared) SensorInfo for a sensor.
+
+        Args:
+            sensorplugin: The sensor plugin.
+
+        Returns:
+            SensorInfo The description of the sensor's readings.
+
+        """
+        info = cls.interned.get(sensorplugin)
+        if info is None:
+            info = cls(sensorplugin)
+            cls.interned[sensorplugin] = info
+        return info
+
+# Keys which are stored in the SensorInfo, and on the Reading itself
+STATICKEYS = SensorInfo.__slots__
+DYNAMICKEYS = ["value", "timestamp", "breach", "skipped", "stale"]
+
+class Reading(object):
+    """One reading from a sensor.
+
+    Can be used like a dict with the keys 'value', 'unit', 'symbol',
+    'name', 'sensor', 'description', 'readingtype', 'breach', 'skipped',
+    'stale' and 'timestamp', plus any extra keys which have been set. Setting a
+    static key (e.g. 'unit') only affects this reading.
+
+    """
+    __slots__ = ["info", "value", "timestamp", "flags", "extras"]
+
+    def __init__(self, info, value, timestamp=None, flags=0, extras=None):
+        """Initialise.
+
+        Args:
+            info: The SensorInfo for the sensor.
+            value: The value read from the sensor.
+            timestamp: When the sensor was read (seconds since the epoch).
+            flags: Any of BREACH, MISSING, SKIPPED, etc. combined with '|'.
+            extras: dict of any other data for this reading.
+
+        """
+        self.info = info
+        self.value = value
+        self.timestamp = timestamp
+        self.flags = flags
+        self.extras = extras
+
+    def __getitem__(self, key):
+        if self.extras is not None and key in self.extras:
+            return self.extras[key]
+        if key == "value":
+            return self.value
+        if key == "breach":
+            return bool(self.flags & BREACH)
+        if key == "skipped":
+            return bool(self.flags & SKIPPED)
+        if key == "stale":
+            return bool(self.flags & STALE)
+        if key == "timestamp":
+            return self.timestamp
+        if key in STATICKEYS:
+            return getattr(self.info, key)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == "value":
+            self.value = value
+        elif key == "breach":
+            if value:
+                self.flags |= BREACH
+            else:
+                self.flags &= ~BREACH
+        elif key == "skipped":
+            if value:
+                self.flags |= SKIPPED
+            else:
+                self.flags &= ~SKIPPED
+        elif key == "stale":
+            if value:
+                self.flags |= STALE
+            else:
+                self.flags &= ~STALE
+        elif key == "timestamp":
+            self.timestamp = value
+        else:
+            if self.extras is None:
+                self.extras = {}
+            self.extras[key] = value
+
+    def __contains__(self, key):
+        return (key in DYNAMICKEYS or key in STATICKEYS or
+                (self.extras is not None and key in self.extras))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def keys(self):
+        """Get the keys of the reading, as for a dict.
+
+        Returns:
+            list The keys.
+
+        """
+        keys = STATICKEYS + DYNAMICKEYS
+        if self.extras:
+            keys = keys + [key for key in self.extras if key not in keys]
+        return keys
+
+    def get(self, key, default=None):
+        """Get a value from the reading, as for a dict.
+
+        Args:
+            key: The key to get.
+            default: What to return if the key doesn't exist.
+
+        Returns:
+            object The value.
+
+        """
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def items(self):
+        """Get the (key, value) pairs of the reading, as for a dict.
+
+        Returns:
+            list The pairs.
+
+        """
+        return [(key, self[key]) for key in self.keys()]
+
+    def iteritems(self):
+        """Iterate over the (key, value) pairs of the reading."""
+        return iter(self.items())
+
+    def copy(self):
+        """Copy the reading; the SensorInfo is shared.
+
+        Returns:
+            Reading The copy.
+
+        """
+        extras = None
+        if self.extras is not None:
+            extras = dict(self.extras)
+        return Reading(self.info, self.value, self.timestamp, self.flags, extras)
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def hasflag(self, flag):
+        """Check whether a flag is set.
+
+        Args:
+            flag: The flag (e.g. MISSING).
+
+        Returns:
+            boolean True if it is set.
+
+        """
+        return bool(self.flags & flag)
@@ -0,0 +1,291 @@
+"""Schedule AirPi samples on a steady, wall-clock aligned beat.
+
+Samples are timed against a monotonic clock, so that they don't drift
+or jump when the system clock is adjusted, but are aligned to absolute
+wall-clock boundaries (e.g. every sample with a 60-second frequency is
+taken at zero seconds past the minute). This means data from several
+AirPis can be joined by timestamp. Overruns (a sample which takes longer
+than the sample frequency) are counted, and the scheduler either catches
+up by running the missed samples back-to-back, or skips them, depending
+on its policy. Jitter (how late each sample actually starts) is recorded
+too.
+
+Sensors can be read at different rates to each other; the scheduler
+then ticks at the base period of all of the rates, and a RateSchedule
+decides which sensors are due on each tick.
+
+"""
+import ctypes
+import ctypes.util
+import fractions
+import math
+import time
+
+CLOCK_MONOTONIC = 1 # From <linux/time.h>
+
+POLICIES = ["skip", "catchup"]
+
+# The shortest period the scheduler will tick at (seconds)
+MINPERIOD = 0.1
+# How close to its due time (seconds) an item must be to be due
+TOLERANCE = 0.001
+# How far (as a fraction of the period) each tick can be moved to follow
+# gradual adjustments to the system clock
+MAXSLEW = 0.05
+
+def get_monotonic():
+    """Find a monotonic clock.
+
+    Python 2 doesn't provide a monotonic clock, so call clock_gettime()
+    from librt directly where we can. Fall back on time.time() if we
+    can't.
+
+    Returns:
+        function A function which returns the monotonic time in seconds.
+
+    """
+    if hasattr(time, "monotonic"):
+        return time.monotonic
+
+    class Timespec(ctypes.Structure):
+        """struct timespec from <time.h>."""
+        _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+    try:
+        librt = ctypes.CDLL(ctypes.util.find_library("rt") or "librt.so.1",
+                            use_errno=True)
+        clock_gettime = librt.clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(Timespec)]
+    except (OSError, AttributeError):
+        return time.time
+
+    def monotonic():
+        """Get the time from CLOCK_MONOTONIC, in seconds."""
+        spec = Timespec()
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(spec)) != 0:
+            raise OSError(ctypes.get_errno(), "clock_gettime failed")
+        return spec.tv_sec + spec.tv_nsec * 1e-9
+
+    return monotonic
+
+monotonic = get_monotonic()
+
+def next_boundary(period, now=None):
+    """Find the next wall-clock boundary for a period.
+
+    For example, with a period of 60 this is the start of the next
+    minute.
+
+    Args:
+        period: The period (seconds).
+        now: The wall-clock time to start from; defaults to now.
+
+    Returns:
+        float The wall-clock time (seconds since the epoch).
+
+    """
+    if now is None:
+        now = time.time()
+    return (math.floor(now / period) + 1) * period
+
+class TickScheduler(object):
+    """Schedule samples on a steady, wall-clock aligned beat.
+
+    """
+
+    def __init__(self, period, align=True, policy="skip", alignto=None):
+        """Initialise.
+
+        Args:
+            period: Time between ticks (seconds).
+            align: Whether ticks should fall on multiples of 'period'
+                   in wall-clock time.
+            policy: What to do after an overrun: 'skip' missed ticks, or
+                    'catchup' by running them back-to-back.
+            alignto: If aligning, the first tick falls on a multiple of
+                     this (seconds); defaults to 'period'.
+
+        """
+        if policy not in POLICIES:
+            raise ValueError("Unknown overrun policy '" + str(policy) + "'")
+        self.period = float(period)
+        self.align = align
+        self.alignto = alignto or self.period
+        self.policy = policy
+        # The next tick, in wall-clock and monotonic time
+        self.nexttick = None
+        self.nextmono = None
+        self.clocksteps = 0
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.lastlate = 0.0
+        self.jitterticks = 0
+        self.totaljitter = 0.0
+        self.maxjitter = 0.0
+
+    def start(self, at=None):
+        """Set the time of the first tick.
+
+        Args:
+            at: Wall-clock time of the first tick. Defaults to the next
+                'alignto' boundary if aligning, or now if not.
+
+        """
+        if at is None:
+            if self.align:
+                at = next_boundary(self.alignto)
+            else:
+                at = time.time()
+        self.nexttick = at
+        self.nextmono = monotonic() + (at - time.time())
+
+    def wait(self):
+        """Wait for the next tick.
+
+        Sleep (against the monotonic clock) until the next tick is due,
+        then work out when the one after should be, allowing for any
+        overrun according to the policy.
+
+        Ticks are timed from the monotonic time of the first tick, and
+        only follow the wall clock gradually: each tick moves by at most
+        MAXSLEW of the period towards its wall-clock time. If the system
+        time is stepped (by a period or more, e.g. when NTP first sets
+        it after boot), the beat carries on unchanged, and the tick
+        times are moved to the new clock by whole periods.
+
+        Returns:
+            float The scheduled wall-clock time of this tick.
+
+        """
+        if self.nexttick is None:
+            self.start()
+        # How far the wall clock has moved against the monotonic clock
+        drift = (self.nexttick - time.time()) - (self.nextmono - monotonic())
+        if abs(drift) >= self.period:
+            steps = round(drift / self.period)
+            self.nexttick -= steps * self.period
+            drift -= steps * self.period
+            self.clocksteps += 1
+        slew = self.period * MAXSLEW
+        self.nextmono += max(-slew, min(drift, slew))
+        remaining = self.nextmono - monotonic()
+        # If the tick is already due, the previous one overran
+        overrun = remaining <= 0 and self.ticks > 0
+        while remaining > 0:
+            time.sleep(remaining)
+            remaining = self.nextmono - monotonic()
+        late = -remaining
+        ticktime = self.nexttick
+        self.ticks += 1
+        self.lastlate = late
+        self.nexttick = ticktime + self.period
+        self.nextmono += self.period
+        if overrun:
+            self.overruns += 1
+            if self.policy == "skip":
+                missed = int(late / self.period)
+                self.skipped += missed
+                self.nexttick += missed * self.period
+                self.nextmono += missed * self.period
+        else:
+            self.jitterticks += 1
+            self.totaljitter += late
+            self.maxjitter = max(self.maxjitter, late)
+        return ticktime
+
+    def stats(self):
+        """Get timing statistics for the ticks so far.
+
+        Jitter is how late a tick starts; ticks which follow an overrun
+        are not included in the mean and maximum.
+
+        Returns:
+            dict The number of ticks, overruns, skipped ticks and steps
+                 in the system time ('clocksteps'), and the mean, maximum
+                 and latest jitter (seconds).
+
+        """
+        stats = {
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "clocksteps": self.clocksteps,
+            "lastjitter": self.lastlate,
+            "maxjitter": self.maxjitter,
+            "meanjitter": 0.0
+            }
+        if self.jitterticks:
+            stats["meanjitter"] = self.totaljitter / self.jitterticks
+        return stats
+
+def base_period(intervals):
+    """Find the tick period which fits a set of intervals.
+
+    This is the largest period which divides exactly into all of the
+    intervals (to the nearest millisecond), so that every interval falls
+    on a tick. It is never less than MINPERIOD.
+
+    Args:
+        intervals: List of intervals (seconds).
+
+    Returns:
+        float The tick period (seconds).
+
+    """
+    period = 0
+    for interval in intervals:
+        period = fractions.gcd(period, int(round(interval * 1000)))
+    return max(period / 1000.0, MINPERIOD)
+
+class RateSchedule(object):
+    """Decide which sensors are due to be read at each tick.
+
+    Each sensor is read at its own interval, on a beat which starts at
+    the first tick. The scheduler ticks at the base period of all of the
+    intervals, so on any given tick only some sensors may be due.
+
+    """
+
+    def __init__(self, items, intervals, default):
+        """Initialise.
+
+        Args:
+            items: List of the things (usually sensor plugins) to schedule.
+            intervals: dict of the interval (seconds) for each item.
+                       Items which are missing, or None, use 'default'.
+            default: The default interval (seconds).
+
+        """
+        self.items = list(items)
+        self.intervals = {}
+        for item in self.items:
+            self.intervals[item] = intervals.get(item) or default
+        self.period = base_period(self.intervals.values() + [default])
+        self.nextdue = dict((item, None) for item in self.items)
+
+    def due(self, ticktime):
+        """Get the items which are due at a tick.
+
+        Items which are due are moved on to their next due time. If an
+        item has missed any of its due times (because of an overrun),
+        they are skipped.
+
+        Args:
+            ticktime: The scheduled wall-clock time of the tick.
+
+        Returns:
+            list The items which are due, in their original order.
+
+        """
+        due = []
+        for item in self.items:
+            nextdue = self.nextdue[item]
+            if nextdue is None:
+                nextdue = ticktime
+            if ticktime + TOLERANCE >= nextdue:
+                due.append(item)
+                while nextdue <= ticktime + TOLERANCE:
+                    nextdue += self.intervals[item]
+            self.nextdue[item] = nextdue
+        return due
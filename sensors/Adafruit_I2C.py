@@ -1,4 +1,5 @@
-import smbus
+import struct
+import i2cbus
 
 # ===========================================================================
 # Adafruit_I2C Base Class
@@ -8,25 +9,19 @@ class Adafruit_I2C:
 
     def __init__(self, address, bus=0, debug=False):
         self.address = address
-        self.bus = smbus.SMBus(bus)
+        # Shared with every other device on the same bus
+        self.device = i2cbus.get_device(bus, address)
         self.debug = debug
 
-    def reversebyteorder(self, data):
-        "Reverses the byte order of an int (16-bit) or long (32-bit) value"
-        # Courtesy Vishal Sapre
-        dstr = hex(data)[2:].replace('L', '')
-        bytecount = len(dstr[::2])
-        val = 0
-        for i, n in enumerate(range(bytecount)):
-            d = data & 0xFF
-            val |= (d << (8 * (bytecount - i - 1)))
-            data >>= 8
-        return val
+    def reversebyteorder(self, data, bytecount=2):
+        "Reverses the byte order of a 16-bit (or, with bytecount=4, 32-bit) value"
+        fmt = {2: "H", 4: "I"}[bytecount]
+        return struct.unpack("<" + fmt, struct.pack(">" + fmt, data))[0]
 
     def write8(self, reg, value):
         "Writes an 8-bit value to the specified register/address"
         try:
-            self.bus.write_byte_data(self.address, reg, value)
+            self.device.write8(reg, value)
             if self.debug:
                 print("I2C: Wrote 0x%02X to register 0x%02X" % (value, reg))
         except IOError:
@@ -36,7 +31,26 @@ class Adafruit_I2C:
     def writelist(self, reg, list):
         "Writes an array of bytes using I2C format"
         try:
-            self.bus.write_i2c_block_data(self.address, reg, list)
+            self.device.writelist(reg, list)
+        except IOError:
+            print("Error accessing 0x%02X: Check your I2C address" % self.address)
+            return -1
+
+    def readlist(self, reg, length):
+        "Reads consecutive registers from the I2C device in one transaction"
+        try:
+            results = self.device.readblock(reg, length)
+            if self.debug:
+                print("I2C: Device 0x%02X returned %s from reg 0x%02X" % (self.address, [hex(r) for r in results], reg))
+            return results
+        except IOError:
+            print("Error accessing 0x%02X: Check your I2C address" % self.address)
+            return -1
+
+    def readstruct(self, reg, fmt):
+        "Reads consecutive registers from the I2C device and decodes them with struct"
+        try:
+            return self.device.readstruct(reg, fmt)
         except IOError:
             print("Error accessing 0x%02X: Check your I2C address" % self.address)
             return -1
@@ -44,7 +58,7 @@ class Adafruit_I2C:
     def readu8(self, reg):
         "Read an unsigned byte from the I2C device"
         try:
-            result = self.bus.read_byte_data(self.address, reg)
+            result = self.device.readu8(reg)
             if self.debug:
                 print("I2C: Device 0x%02X returned 0x%02X from reg 0x%02X" % (self.address, result & 0xFF, reg))
             return result
@@ -55,13 +69,10 @@ class Adafruit_I2C:
     def reads8(self, reg):
         "Reads a signed byte from the I2C device"
         try:
-            result = self.bus.read_byte_data(self.address, reg)
+            result = self.device.reads8(reg)
             if self.debug:
                 print("I2C: Device 0x%02X returned 0x%02X from reg 0x%02X" % (self.address, result & 0xFF, reg))
-            if result > 127:
-                return result - 256
-            else:
-                return result
+            return result
         except IOError:
             print("Error accessing 0x%02X: Check your I2C address" % self.address)
             return -1
@@ -69,8 +80,7 @@ class Adafruit_I2C:
     def readu16(self, reg):
         "Reads an unsigned 16-bit value from the I2C device"
         try:
-            hibyte = self.bus.read_byte_data(self.address, reg)
-            result = (hibyte << 8) + self.bus.read_byte_data(self.address, reg+1)
+            result = self.device.readu16(reg)
             if self.debug:
                 print("I2C: Device 0x%02X returned 0x%04X from reg 0x%02X" % (self.address, result & 0xFFFF, reg))
             return result
@@ -81,10 +91,18 @@ class Adafruit_I2C:
     def reads16(self, reg):
         "Reads a signed 16-bit value from the I2C device"
         try:
-            hibyte = self.bus.read_byte_data(self.address, reg)
-            if hibyte > 127:
-                hibyte -= 256
-            result = (hibyte << 8) + self.bus.read_byte_data(self.address, reg+1)
+            result = self.device.reads16(reg)
+            if self.debug:
+                print("I2C: Device 0x%02X returned 0x%04X from reg 0x%02X" % (self.address, result & 0xFFFF, reg))
+            return result
+        except IOError:
+            print("Error accessing 0x%02X: Check your I2C address" % self.address)
+            return -1
+
+    def readu16le(self, reg):
+        "Reads an unsigned little-endian 16-bit value from the I2C device"
+        try:
+            result = self.device.readu16le(reg)
             if self.debug:
                 print("I2C: Device 0x%02X returned 0x%04X from reg 0x%02X" % (self.address, result & 0xFFFF, reg))
             return result
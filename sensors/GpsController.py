@@ -1,108 +1,405 @@
-from gps import *
-from time import sleep
-import subprocess
+""" Collect GPS fixes in the background.
+
+A GpsController thread reads reports from a source (normally gpsd) as
+they arrive, and keeps a short, timestamped history of fixes: position,
+mode (2D/3D), estimated errors, speed, track and the number of
+satellites used. The thread blocks on the source rather than polling
+it, so it costs almost nothing between reports. The GPS sensor asks the
+controller for the position at the time of each sample, which is
+interpolated between fixes (or projected on from the latest one, using
+its speed and track).
+
+Sources yield reports as dicts in gpsd's JSON format (with 'time'
+already converted to seconds since the epoch):
+- GpsdSource talks to gpsd over its socket.
+- FileSource replays a recorded gpsd JSON log or NMEA log, for testing
+  without a GPS.
+
+"""
+import calendar
+import collections
+import json
+import math
+import socket
 import sys
 import threading
+import time
+
+# Modes from gpsd's TPV reports
+MODE_NO_FIX = 1
+MODE_2D = 2
+MODE_3D = 3
+
+# Metres per degree of latitude (approximately)
+METRESPERDEGREE = 111320.0
+
+# One fix from the GPS. 'time' is the time of the fix (seconds since the
+# epoch); values the GPS didn't report are None.
+Fix = collections.namedtuple("Fix", ["time", "latitude", "longitude",
+                                     "altitude", "mode", "eph", "epv", "speed",
+                                     "track", "climb", "satellites"])
 
 class GpsSocketError(Exception):
-    """Exception to raise when the GPS sock at /var/run/gpsd.sock does
-    not exist.
+    """Exception to raise when gpsd can't be reached.
 
     """
     pass
 
-class GpsController(threading.Thread):
+def parse_time(value):
+    """Convert a gpsd (ISO 8601) time to seconds since the epoch.
 
-    def __new__(cls):
-        """Create new object if socket exists.
-        
-        Create a new GpsController object. Abort creation of the instance if the
-        GPS socket hasn't been set up at /var/run/gpsd.sock.
+    Args:
+        value: The time (e.g. "2015-03-01T12:00:01.000Z"), or a number
+               of seconds since the epoch.
 
-        """
-        if subprocess.call(['test', '-S', '/var/run/gpsd.sock']) != 1:
-            return super(GpsController, cls).__new__(cls)
+    Returns:
+        float The time, or None if it can't be parsed.
+
+    """
+    if value is None or isinstance(value, (int, long, float)):
+        return value
+    try:
+        seconds = calendar.timegm(time.strptime(value[:19], "%Y-%m-%dT%H:%M:%S"))
+    except ValueError:
+        return None
+    fraction = value[19:].rstrip("Z")
+    if fraction.startswith("."):
+        seconds += float(fraction)
+    return float(seconds)
+
+def parse_nmea(sentence, date=None):
+    """Convert an NMEA GGA or RMC sentence to a gpsd-style report.
+
+    Args:
+        sentence: The sentence (e.g. "$GPGGA,...*47").
+        date: The UTC date ("ddmmyy") for sentences which don't include
+              it (GGA); defaults to today.
+
+    Returns:
+        dict The report, or None if the sentence isn't GGA or RMC (or is
+             malformed).
+
+    """
+    fields = sentence.strip().split("*")[0].split(",")
+    kind = fields[0][-3:]
+    try:
+        if kind == "GGA":
+            lat = nmea_degrees(fields[2], fields[3])
+            lon = nmea_degrees(fields[4], fields[5])
+            quality = int(fields[6] or 0)
+            report = {"class": "TPV", "lat": lat, "lon": lon,
+                      "mode": MODE_3D if quality else MODE_NO_FIX}
+            if fields[9]:
+                report["alt"] = float(fields[9])
+            if fields[7]:
+                report["satellites"] = int(fields[7])
+            fixtime = fields[1]
+        elif kind == "RMC":
+            lat = nmea_degrees(fields[3], fields[4])
+            lon = nmea_degrees(fields[5], fields[6])
+            report = {"class": "TPV", "lat": lat, "lon": lon,
+                      "mode": MODE_2D if fields[2] == "A" else MODE_NO_FIX}
+            if fields[7]:
+                # Knots to m/s
+                report["speed"] = float(fields[7]) * 0.514444
+            if fields[8]:
+                report["track"] = float(fields[8])
+            fixtime = fields[1]
+            date = fields[9]
         else:
+            return None
+    except (IndexError, ValueError):
+        return None
+    if date is None:
+        date = time.strftime("%d%m%y", time.gmtime())
+    stamp = time.strptime(date + fixtime[:6], "%d%m%y%H%M%S")
+    report["time"] = calendar.timegm(stamp) + float("0" + fixtime[6:])
+    return report
+
+def nmea_degrees(value, hemisphere):
+    """Convert an NMEA (d)ddmm.mmmm position to decimal degrees.
+
+    Args:
+        value: The position.
+        hemisphere: "N", "S", "E" or "W".
+
+    Returns:
+        float The position in degrees (negative for S and W).
+
+    """
+    point = value.index(".")
+    degrees = float(value[:point - 2]) + float(value[point - 2:]) / 60
+    if hemisphere in ["S", "W"]:
+        degrees = -degrees
+    return degrees
+
+class GpsdSource(object):
+    """ Read reports from gpsd over its socket.
+
+    """
+
+    def __init__(self, host="127.0.0.1", port=2947):
+        try:
+            self.sock = socket.create_connection((host, port), 10)
+        except socket.error as excep:
             print("ERROR:   GPS does not appear to be set up.")
-            print("         Unable to find socket at /dev/ttyAMA0")
+            print("         Unable to connect to gpsd at " + host + ":" + str(port))
             print("         Try running: \"sudo gpsd /dev/ttyAMA0 -F /var/run/gpsd.sock\"")
-            raise GpsSocketError
+            raise GpsSocketError(str(excep))
+        # Block until each report arrives
+        self.sock.settimeout(None)
+        self.sock.sendall('?WATCH={"enable":true,"json":true};\n')
+        self.stream = self.sock.makefile("r")
+
+    def reports(self):
+        """Yield reports as gpsd sends them, until the socket closes."""
+        while True:
+            try:
+                line = self.stream.readline()
+            except (socket.error, ValueError):
+                # ValueError if the stream was closed by close()
+                return
+            if not line:
+                return
+            try:
+                report = json.loads(line)
+            except ValueError:
+                continue
+            report["time"] = parse_time(report.get("time"))
+            yield report
+
+    def close(self):
+        """Close the connection to gpsd."""
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        self.sock.close()
+
+class FileSource(object):
+    """ Replay a recorded gpsd JSON log or NMEA log.
+
+    """
+
+    def __init__(self, path, realtime=True):
+        """Initialise.
+
+        Args:
+            path: The log file. Lines starting with '$' are NMEA
+                  sentences; anything else should be gpsd JSON.
+            realtime: Whether to replay the reports at the rate they were
+                      recorded, with their times moved to now. If False,
+                      they are replayed as fast as possible, unchanged.
+
+        """
+        self.path = path
+        self.realtime = realtime
+        self.stopping = threading.Event()
+
+    def reports(self):
+        """Yield the reports from the log."""
+        offset = None
+        date = None
+        with open(self.path) as logfile:
+            for line in logfile:
+                if self.stopping.isSet():
+                    return
+                line = line.strip()
+                if line.startswith("$"):
+                    report = parse_nmea(line, date)
+                    if report is not None and line[3:6] == "RMC":
+                        date = line.split(",")[9]
+                else:
+                    try:
+                        report = json.loads(line)
+                    except ValueError:
+                        report = None
+                    if report is not None:
+                        report["time"] = parse_time(report.get("time"))
+                if report is None:
+                    continue
+                if self.realtime and report.get("time") is not None:
+                    if offset is None:
+                        offset = time.time() - report["time"]
+                    report["time"] += offset
+                    self.stopping.wait(max(report["time"] - time.time(), 0))
+                yield report
+
+    def close(self):
+        """Stop replaying."""
+        self.stopping.set()
 
-    def __init__(self):
-        """Initialise GpsController class.
+class GpsController(threading.Thread):
+    """ Collect GPS fixes in the background.
+
+    """
 
-        Initialise the GpsController class using parameters passed in
-        'data'.
+    def __init__(self, source, history=120):
+        """Initialise.
 
         Args:
-            self: self.
-            data: A dict containing the parameters to be used during
-                  setup.
+            source: Where reports come from (e.g. a GpsdSource).
+            history: The number of fixes to keep.
 
         """
-        threading.Thread.__init__(self)
-        self.gpsd = gps(mode=WATCH_ENABLE) # starting the stream of info
+        threading.Thread.__init__(self, name="gps")
+        self.daemon = True
+        self.source = source
+        self.fixes = collections.deque(maxlen=history)
+        self.lock = threading.Lock()
+        self.satellites = None
+        self.reports = 0
         self.running = False
 
     def run(self):
-        """Continually get data from gpsd.
+        """Record reports from the source as they arrive."""
+        self.running = True
+        for report in self.source.reports():
+            if not self.running:
+                break
+            self.reports += 1
+            self.record(report)
+        self.running = False
+
+    def record(self, report):
+        """Record one report.
 
-        Continually get the data from gpsd, clearing the buffer in the
-        process. If we don't do it continually, the buffer will fill up
-        and then we're in trouble.
+        TPV (position) reports with a fix are added to the history; if
+        several reports share the same time (e.g. NMEA GGA and RMC
+        sentences), they are merged into one fix. SKY reports update
+        the number of satellites used.
+
+        Args:
+            report: The report, as a gpsd-style dict.
 
         """
-        self.running = True
-        while self.running:
-            self.gpsd.next()
+        if report.get("class") == "SKY" and "satellites" in report:
+            self.satellites = len([s for s in report["satellites"]
+                                   if s.get("used")])
+            return
+        if report.get("class") != "TPV" or report.get("time") is None:
+            return
+        if report.get("mode", MODE_NO_FIX) < MODE_2D:
+            return
+        if report.get("lat") is None or report.get("lon") is None:
+            return
+        fix = Fix(report["time"], report["lat"], report["lon"],
+                  report.get("alt"), report["mode"], report.get("eph"),
+                  report.get("epv"), report.get("speed"),
+                  report.get("track"), report.get("climb"),
+                  report.get("satellites", self.satellites))
+        with self.lock:
+            if self.fixes and self.fixes[-1].time == fix.time:
+                merged = dict((field, value) for field, value in
+                              fix._asdict().iteritems() if value is not None)
+                merged["mode"] = max(fix.mode, self.fixes[-1].mode)
+                fix = self.fixes[-1]._replace(**merged)
+                self.fixes[-1] = fix
+            else:
+                self.fixes.append(fix)
+
+    def latest(self):
+        """Get the latest fix.
+
+        Returns:
+            Fix, float The fix and its age (seconds), or None, None if
+                       there hasn't been one.
+
+        """
+        with self.lock:
+            if not self.fixes:
+                return None, None
+            fix = self.fixes[-1]
+        return fix, time.time() - fix.time
+
+    def at(self, when):
+        """Get the position at a particular time.
+
+        If 'when' falls between two fixes, the position is interpolated
+        between them. If it is after the latest fix, the position is
+        projected on from that fix using its speed and track (if
+        known). If it is before the earliest fix, that fix is used.
+
+        Args:
+            when: The time (seconds since the epoch).
+
+        Returns:
+            Fix The position, with 'time' set to 'when', or None if there
+                are no fixes.
+
+        """
+        with self.lock:
+            fixes = list(self.fixes)
+        if not fixes:
+            return None
+        if when <= fixes[0].time:
+            return fixes[0]._replace(time=when)
+        after = None
+        for before in reversed(fixes):
+            if before.time <= when:
+                break
+            after = before
+        if after is not None:
+            fraction = (when - before.time) / (after.time - before.time)
+            return before._replace(
+                time=when,
+                latitude=interpolate(before.latitude, after.latitude, fraction),
+                longitude=interpolate(before.longitude, after.longitude, fraction),
+                altitude=interpolate(before.altitude, after.altitude, fraction))
+        return project(before, when)
 
     def stopController(self):
         """Stop the controller.
 
-        Stop this GPS Controller.
+        Stop this GPS Controller, closing the source so that the thread
+        isn't left waiting for a report.
 
         """
         self.running = False
+        self.source.close()
 
-    @property
-    def fix(self):
-        return self.gpsd.fix
+def interpolate(start, end, fraction):
+    """Interpolate linearly between two values, either of which may be None."""
+    if start is None or end is None:
+        return start
+    return start + (end - start) * fraction
 
-    @property
-    def utc(self):
-        return self.gpsd.utc
+def project(fix, when):
+    """Project a fix forward in time using its speed and track.
 
-    @property
-    def satellites(self):
-        return self.gpsd.satellites
+    Args:
+        fix: The Fix.
+        when: The time to project it to.
+
+    Returns:
+        Fix The projected position.
+
+    """
+    if fix.speed is None or fix.track is None:
+        return fix._replace(time=when)
+    distance = fix.speed * (when - fix.time)
+    track = math.radians(fix.track)
+    latitude = fix.latitude + distance * math.cos(track) / METRESPERDEGREE
+    longitude = fix.longitude + (distance * math.sin(track) /
+                                 (METRESPERDEGREE * math.cos(math.radians(fix.latitude))))
+    return fix._replace(time=when, latitude=latitude, longitude=longitude)
 
 if __name__ == '__main__':
-    gpsc = GpsController()
+    if len(sys.argv) > 1:
+        gpsc = GpsController(FileSource(sys.argv[1]))
+    else:
+        gpsc = GpsController(GpsdSource())
     try:
         gpsc.start()
         while True:
-            print "latitude ", gpsc.fix.latitude
-            print "longitude ", gpsc.fix.longitude
-            print "time utc ", gpsc.utc, " + ", gpsc.fix.time
-            print "altitude (m)", gpsc.fix.altitude
-            print "eps ", gpsc.fix.eps
-            print "epx ", gpsc.fix.epx
-            print "epv ", gpsc.fix.epv
-            print "ept ", gpsc.fix.ept
-            print "speed (m/s) ", gpsc.fix.speed
-            print "climb ", gpsc.fix.climb
-            print "track ", gpsc.fix.track
-            print "mode ", gpsc.fix.mode
-            print "sats ", gpsc.satellites
-            sleep(0.5)
+            fix, age = gpsc.latest()
+            print fix, age
+            time.sleep(1)
     except KeyboardInterrupt:
         print("User cancelled")
-    except:
-        print("Unexpected error:", sys.exc_info()[0])
-        raise
     finally:
         gpsc.stopController()
         # wait for the thread to finish
-        gpsc.join()
+        gpsc.join(5)
 
     print("Done")
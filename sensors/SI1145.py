@@ -1,13 +1,21 @@
-""" Read data from SI1145 sensor. """
+""" Read data from SI1145 sensor.
+
+The chip is set up (which involves resetting it and waiting for it to
+come back) and read in the background (see sensor.AsyncSensor), so
+neither holds up the other sensors.
+
+"""
 import sensor
 import SI1145Backend
 
-class SI1145(sensor.Sensor):
+class SI1145(sensor.AsyncSensor):
     """ Read data from SI1145 sensor. """
 
     siClass = None
     requiredData = ["measurement", "i2cbus"]
     optionalData = ["unit", "description"]
+    # The chip measures continuously; there's no point reading it more often
+    mininterval = 1
 
     def __init__(self, data):
         self.readingtype = "sample"
@@ -17,11 +25,30 @@ class SI1145(sensor.Sensor):
             self.valunit = "UVI*100"
             self.valsymbol = "UVI"
         self.description = data["description"]
-        if SI1145.siClass == None:
-            SI1145.siClass = SI1145Backend.SI1145(bus=int(data["i2cbus"]))
+        self.i2cbus = int(data["i2cbus"])
+        self.bus = "i2c-" + str(self.i2cbus)
+        self.startacquiring()
         return
 
-    def getval(self):
+    def acquirerkey(self):
+        """Share one acquirer between all instances on a bus."""
+        return ("SI1145", self.i2cbus)
+
+    def setup(self):
+        """Reset and calibrate the chip, if that hasn't been done."""
+        if SI1145.siClass == None:
+            SI1145.siClass = SI1145Backend.SI1145(bus=self.i2cbus)
+
+    def acquire(self):
+        """Read every measurement the chip makes.
+
+        Returns:
+            dict The UV index * 100 ('uvi').
+
+        """
+        return {"uvi": SI1145.siClass.readUV()}
+
+    def select(self, value):
+        """Get this instance's measurement from a reading."""
         if self.valname == "UVI-SI1145":
-            temp = SI1145.siClass.readUV()
-            return temp
+            return value["uvi"]
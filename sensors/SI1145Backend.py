@@ -25,8 +25,7 @@
 import logging
 import time
 
-import Adafruit_GPIO.I2C as I2C
-#import Adafruit_I2C as I2C
+import i2cbus
 
 # COMMANDS
 SI1145_PARAM_QUERY                      = 0x80
@@ -159,7 +158,7 @@ class SI1145(object):
                 self._logger = logging.getLogger('SI1145')
 
                 # Create I2C device.
-                self._device = I2C.Device(address, bus)
+                self._device = i2cbus.get_device(bus, address)
 
                 #reset device
                 self._reset()
@@ -184,9 +183,10 @@ class SI1145(object):
 
         # write Param
         def writeParam(self, p, v):
-                self._device.write8(SI1145_REG_PARAMWR, v)
-                self._device.write8(SI1145_REG_COMMAND, p | SI1145_PARAM_SET)
-                paramVal = self._device.readU8(SI1145_REG_PARAMRD)
+                with self._device.lock:
+                        self._device.write8(SI1145_REG_PARAMWR, v)
+                        self._device.write8(SI1145_REG_COMMAND, p | SI1145_PARAM_SET)
+                        paramVal = self._device.readu8(SI1145_REG_PARAMRD)
                 return paramVal
 
         # load calibration to sensor
@@ -250,19 +250,19 @@ class SI1145(object):
 
         # returns the UV index * 100 (divide by 100 to get the index)
         def readUV(self):
-                return self._device.readU16LE(0x2C)
+                return self._device.readu16le(0x2C)
 
         #returns visible + IR light levels
         def readVisible(self):
-                return self._device.readU16LE(0x22)
+                return self._device.readu16le(0x22)
 
         #returns IR light levels
         def readIR(self):
-                return self._device.readU16LE(0x24)
+                return self._device.readu16le(0x24)
 
         # Returns "Proximity" - assumes an IR LED is attached to LED
         def readProx(self):
-                return self._device.readU16LE(0x26)
+                return self._device.readu16le(0x26)
 
 if __name__ == "__main__":
     while 1==1:
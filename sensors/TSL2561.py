@@ -17,11 +17,15 @@ class TSL2561(sensor.Sensor):
             self.valunit = "Lux"
             self.valsymbol = "Lux"
         self.description = data["description"]
+        self.bus = "i2c-" + str(int(data["i2cbus"]))
         if TSL2561.tslClass == None:
             TSL2561.tslClass = TSL2561Backend.TSL2561(bus=int(data["i2cbus"]))
         return
 
+    def start(self):
+        TSL2561.tslClass.start()
+
     def getval(self):
         if self.valname == "Lux-TSL2561":
-            temp = TSL2561.tslClass.readLux()
+            temp = TSL2561.tslClass.collect()
             return temp
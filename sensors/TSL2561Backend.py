@@ -18,9 +18,33 @@ from Adafruit_I2C import Adafruit_I2C
 ### Now I'm a guy building cool stuff.
 ### If any of this code proves useful, drop me a line at medicforlife.blogspot.com
 
-# TODO: Strip out values into constants. 
+# Integration time (seconds) for each setting of the timing register's
+# INTEG bits
+INTEGRATIONS = {0: 0.0137, 1: 0.101, 2: 0.402}
+# The highest count each integration time can give; a channel at this
+# count is saturated
+SATURATION = {0: 5047, 1: 37177, 2: 65535}
+# The timing register's gain bit (16x gain if set, 1x if not)
+HIGHGAIN = 0x10
+# The ranges used when auto-ranging, as (gain, integration) pairs, from
+# most to least sensitive
+RANGES = [(16, 2), (1, 2), (1, 1), (1, 0)]
+# Only move to a more sensitive range if the readings would then be
+# below this fraction of saturation, so that the range doesn't flap
+HEADROOM = 0.8
 
 class TSL2561:
+    """ Read data from the TSL2561 light sensor.
+
+    The TSL2561 integrates continuously once enabled, so a new result is
+    ready every integration period without having to ask for one. The
+    gain and integration time (the 'range') are remembered between
+    reads, and only changed when a reading saturates or is too small to
+    be accurate. Changing the range is done by start(), and the result
+    picked up by collect(); if there is time between the two (e.g. while
+    other sensors are read) collect() doesn't have to wait at all.
+
+    """
     i2c = None
 
     def __init__(self, address=0x39, debug=0, pause=0.8, bus=0):
@@ -29,35 +53,57 @@ class TSL2561:
         self.pause = pause
         self.debug = debug
         self.gain = 0 # no gain preselected
+        self.range = None # no range preselected
+        self.ready = 0 # time a result at the current range is ready
         self.i2c.write8(0x80, 0x03)     # enable the device
 
+    def setRange(self, index):
+        """Set the gain and integration time.
+
+        This doesn't wait for a result; the time when one will be ready
+        is stored in self.ready.
+
+        Args:
+            index: The index of the range in RANGES.
+
+        """
+        if index == self.range:
+            return
+        gain, integration = RANGES[index]
+        timing = integration
+        if gain == 16:
+            timing |= HIGHGAIN
+        self.i2c.write8(0x81, timing)
+        if (self.debug):
+            print "Setting gain %dx, integration %.1f ms" % (gain, INTEGRATIONS[integration] * 1000)
+        self.range = index
+        self.gain = gain
+        # The conversion under way when the range changes finishes at the
+        # old range, so allow for two integration periods
+        self.ready = time.time() + 2 * INTEGRATIONS[integration]
 
     def setGain(self,gain=1):
-        """ Set the gain """
-        if (gain != self.gain):
-            if (gain==1):
-                self.i2c.write8(0x81, 0x02)     # set gain = 1X and timing = 402 mSec
-                if (self.debug):
-                    print "Setting low gain"
+        """ Set the gain (with 402 ms integration), and wait for a result """
+        if (gain != self.gain or self.range is None):
+            if gain == 1:
+                self.setRange(RANGES.index((1, 2)))
             else:
-                self.i2c.write8(0x81, 0x12)     # set gain = 16X and timing = 402 mSec
-                if (self.debug):
-                    print "Setting high gain"
-            self.gain=gain;                     # safe gain for calculation
-            time.sleep(self.pause)              # pause for integration (self.pause must be bigger than integration time)
+                self.setRange(RANGES.index((16, 2)))
+            self.wait()
 
+    def wait(self):
+        """Wait until a result at the current range is ready."""
+        remaining = self.ready - time.time()
+        if remaining > 0:
+            time.sleep(remaining)
 
     def readWord(self, reg):
-        """Reads a word from the I2C device"""
-        try:
-            wordval = self.i2c.readu16(reg)
-            newval = self.i2c.reversebyteorder(wordval)
-            if (self.debug):
-                print("I2C: Device 0x%02X returned 0x%04X from reg 0x%02X" % (self.address, wordval & 0xFFFF, reg))
-            return newval
-        except IOError:
-            print("Error accessing 0x%02X: Check your I2C address" % self.address)
-            return -1
+        """Reads a (little-endian) word from the I2C device, in one transaction"""
+        # Setting the WORD bit makes the register address auto-increment
+        wordval = self.i2c.readu16le(reg | 0x20)
+        if (self.debug and wordval >= 0):
+            print("I2C: Device 0x%02X returned 0x%04X from reg 0x%02X" % (self.address, wordval, reg))
+        return wordval
 
 
     def readFull(self, reg=0x8C):
@@ -68,29 +114,85 @@ class TSL2561:
         """Reads IR only diode from the I2C device"""
         return self.readWord(reg);
 
-    def readLux(self, gain = 0):
-        """Grabs a lux reading either with autoranging (gain=0) or with a specified gain (1, 16)"""
-        if (gain == 1 or gain == 16):
-            self.setGain(gain) # low/highGain
+    def chooseRange(self, ambient, IR):
+        """Choose the best range for a pair of readings.
+
+        Args:
+            ambient: The full-spectrum (visible+IR) count.
+            IR: The IR count.
+
+        Returns:
+            int The index of the range in RANGES.
+
+        """
+        gain, integration = RANGES[self.range]
+        highest = max(ambient, IR)
+        if highest >= SATURATION[integration]:
+            return min(self.range + 1, len(RANGES) - 1)
+        if self.range > 0:
+            moregain, moreintegration = RANGES[self.range - 1]
+            scale = (moregain * INTEGRATIONS[moreintegration]) / (gain * INTEGRATIONS[integration])
+            if highest * scale < HEADROOM * SATURATION[moreintegration]:
+                return self.range - 1
+        return self.range
+
+    def start(self):
+        """Start a conversion, if the range has changed.
+
+        The first call selects the most sensitive range. After that,
+        the range is only changed by collect().
+
+        """
+        if self.range is None:
+            self.setRange(0)
+
+    def collect(self):
+        """Get the lux from the latest conversion.
+
+        If the readings saturate, the range is changed and the sensor is
+        read again once a result at the new range is ready, since the
+        saturated readings are no use. If they are merely on the small
+        side, they are used, and the range is changed for next time.
+
+        Returns:
+            float The lux, or None if the sensor couldn't be read.
+
+        """
+        self.start()
+        for attempt in range(len(RANGES)):
+            self.wait()
             ambient = self.readFull()
             IR = self.readIR()
-        elif (gain==0): # auto gain
-            self.setGain(16) # first try highGain
-            ambient = self.readFull()
-            if (ambient < 65535):
-                IR = self.readIR()
-            if (ambient >= 65535 or IR >= 65535): # value(s) exeed(s) datarange
-                self.setGain(1) # set lowGain
-                ambient = self.readFull()
-                IR = self.readIR()
-
-        if (self.gain==1):
-           ambient *= 16    # scale 1x to 16x
-           IR *= 16         # scale 1x to 16x
+            if ambient < 0 or IR < 0:
+                return None
+            current = self.range
+            best = self.chooseRange(ambient, IR)
+            self.setRange(best)
+            if best <= current:
+                break
+        return self.calculateLux(ambient, IR, RANGES[current])
+
+    def calculateLux(self, ambient, IR, setting):
+        """Calculate the lux from a pair of readings.
+
+        Args:
+            ambient: The full-spectrum (visible+IR) count.
+            IR: The IR count.
+            setting: The (gain, integration) the readings were taken at.
+
+        Returns:
+            float The lux.
+
+        """
+        gain, integration = setting
+        # scale to 16x gain and 402 ms integration
+        scale = (16 * INTEGRATIONS[2]) / (gain * INTEGRATIONS[integration])
+        ambient *= scale
+        IR *= scale
         if (ambient == 0):
-	    ratio = 0
-	else:
-    	    ratio = (IR / float(ambient)) # changed to make it run under python 2
+            ratio = 0
+        else:
+            ratio = (IR / float(ambient)) # changed to make it run under python 2
 
         if (self.debug):
             print "IR Result", IR
@@ -109,9 +211,18 @@ class TSL2561:
 
         return lux
 
+    def readLux(self, gain = 0):
+        """Grabs a lux reading either with autoranging (gain=0) or with a specified gain (1, 16)"""
+        if (gain == 1 or gain == 16):
+            self.setGain(gain) # low/highGain
+            ambient = self.readFull()
+            IR = self.readIR()
+            return self.calculateLux(ambient, IR, RANGES[self.range])
+        return self.collect()
+
 if __name__ == "__main__":
-    tsl=TSL2561()
-    print tsl.readLux(bus=1)
+    tsl=TSL2561(bus=1)
+    print tsl.readLux()
 #print "LUX HIGH GAIN ", tsl.readLux(16)
 #print "LUX LOW GAIN ", tsl.readLux(1)
 #print "LUX AUTO GAIN ", tsl.readLux()
@@ -8,9 +8,43 @@ either Ohms or millivolts depending on the exact sensor in question.
 import mcp3008
 import sensor
 import time
-import operator
 import dustBackend
+import reducers
 import microphone
+import aggregation
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Resistance (Ohms) of the wind vane at each direction (degrees)
+VANETABLE = { 9700: 22.5, 12450: 45, 1185: 67.5, 1390: 90, 980: 112.5, 3200: 135, 1990: 157.5, 5680: 180, 4600: 202.5, 25000: 225, 21800: 247.5, 385000: 270, 76000: 292.5, 133000: 315, 35000: 337.5, 56500: 360 }
+
+# The ways wind directions can be combined: 'mean'/'avg' is the circular
+# mean; the other reducers don't make sense for angles
+DIRECTIONREDUCERS = ["mean", "avg", "most"]
+
+# The Microphone's weighted noise levels which are output as readings of
+# their own: the extra, the symbol and the weighting
+WEIGHTINGS = [("dba", "dBA", "A-weighted"), ("dbc", "dBC", "C-weighted"),
+              ("dbz", "dBZ", "Unweighted")]
+
+def parse_vane_table(text):
+    """Parse a wind vane table from sensors.cfg.
+
+    Args:
+        text: Comma-separated 'ohms:degrees' pairs.
+
+    Returns:
+        dict The direction (degrees) for each resistance (Ohms).
+
+    """
+    table = {}
+    for pair in text.split(","):
+        ohms, degrees = pair.split(":")
+        table[float(ohms)] = float(degrees)
+    return table
 
 class Analogue(sensor.Sensor):
     """ The MCP3008 ADC is used by this class, and output can be in
@@ -18,7 +52,7 @@ class Analogue(sensor.Sensor):
 
     """
     requiredData = ["adcpin", "measurement", "sensorname"]
-    optionalData = ["pullupResistance", "pulldownResistance", "sensorvoltage", "description", "averagingAttemps", "averagingTimeout", "averagingMethod", "digpin"]
+    optionalData = ["pullupResistance", "pulldownResistance", "sensorvoltage", "description", "averagingAttemps", "averagingTimeout", "averagingMethod", "digpin", "oversample", "reducer", "trim", "vanetable", "vanetolerance", "samplerate", "noiseframe", "dboffset", "fftsize", "burstsize", "burstinterval", "pulses", "pulsedelay", "pulsetolerance"]
 
     def __init__(self, data):
         """Initialise.
@@ -31,8 +65,11 @@ class Analogue(sensor.Sensor):
             data: A dict containing the parameters to be used during setup.
 
         """
-        self.adc = mcp3008.MCP3008.sharedClass
+        self.adc = mcp3008.MCP3008.getshared()
         self.adcpin = int(data["adcpin"])
+        self.adc.register(self.adcpin)
+        # All analogue sensors are read through the one MCP3008
+        self.bus = "spi-mcp3008"
         self.valname = data["measurement"]
         self.sensorname = data["sensorname"]
         self.digpin = 0
@@ -47,7 +84,25 @@ class Analogue(sensor.Sensor):
         self.averagingMethod = "avg"
         if "averagingMethod" in data:
             self.averagingMethod = data["averagingMethod"]
+        self.oversample = 0
+        if "oversample" in data:
+            self.oversample = int(data["oversample"])
+        self.reducer = "mean"
+        if self.sensorname == "Dust":
+            # Robust to the occasional stray reading from a pulse train
+            self.reducer = "hampel"
+        if "reducer" in data:
+            self.reducer = data["reducer"].lower()
+        self.trim = 0.1
+        if "trim" in data:
+            self.trim = float(data["trim"])
+        for method in [self.averagingMethod, self.reducer]:
+            if method not in reducers.REDUCERS:
+                raise ValueError("Unknown averaging method '" + method + "'")
+        self.extras = None
         self.readingtype = "sample"
+        if self.sensorname == "WindDirection":
+            self.readingtype = "direction"
         self.pullup, self.pulldown = None, None
         if "pullupResistance" in data:
             self.pullup = int(data["pullupResistance"])
@@ -77,6 +132,78 @@ class Analogue(sensor.Sensor):
             self.description = data["description"]
         else:
             self.description = "An analogue sensor."
+        if self.sensorname == "WindDirection":
+            if self.pullup is None:
+                raise ValueError("WindDirection needs a pullupResistance")
+            self.vanetable = VANETABLE
+            if "vanetable" in data:
+                self.vanetable = parse_vane_table(data["vanetable"])
+            self.vanetolerance = 0.1
+            if "vanetolerance" in data:
+                self.vanetolerance = float(data["vanetolerance"])
+            self.directions, self.ambiguous = self.build_direction_table()
+            self.ambiguouscount = 0
+            for method in [self.averagingMethod, self.reducer]:
+                if method not in DIRECTIONREDUCERS:
+                    raise ValueError("Averaging method '" + method + "' can't"
+                                     + " be used for WindDirection")
+        # Sensors which need more than a single ADC reading have a backend,
+        # which is set up once here rather than on every reading
+        self.backend = None
+        if self.sensorname == "Dust":
+            pulses = 50
+            if "pulses" in data:
+                pulses = int(data["pulses"])
+            pulsedelay = 280.0
+            if "pulsedelay" in data:
+                pulsedelay = float(data["pulsedelay"])
+            pulsetolerance = 20.0
+            if "pulsetolerance" in data:
+                pulsetolerance = float(data["pulsetolerance"])
+            # Delays are given in microseconds
+            self.backend = dustBackend.DustBackend(self.adcpin, self.digpin,
+                                                   self.adc, pulses,
+                                                   pulsedelay / 1e6,
+                                                   pulsetolerance / 1e6)
+        elif self.sensorname == "Microphone":
+            samplerate = 200
+            if "samplerate" in data:
+                samplerate = float(data["samplerate"])
+            noiseframe = 1.0
+            if "noiseframe" in data:
+                noiseframe = float(data["noiseframe"])
+            dboffset = 0.0
+            if "dboffset" in data:
+                dboffset = float(data["dboffset"])
+            fftsize = 0
+            if "fftsize" in data:
+                fftsize = int(data["fftsize"])
+            burstsize = 1024
+            if "burstsize" in data:
+                burstsize = int(data["burstsize"])
+            burstinterval = 10.0
+            if "burstinterval" in data:
+                burstinterval = float(data["burstinterval"])
+            self.backend = microphone.Microphone(self.adcpin, self.adc,
+                                                 samplerate, noiseframe,
+                                                 dboffset, fftsize, burstsize,
+                                                 burstinterval,
+                                                 self.sensorvoltage)
+        if self.backend is not None:
+            self.backend.open()
+        if self.sensorname == "Microphone" and self.backend.sampling():
+            self.valunit = "Decibels"
+            self.valsymbol = "dB"
+
+    def close(self):
+        """Release the sensor's backend, if it has one.
+
+        Args:
+            self: self.
+
+        """
+        if self.backend is not None:
+            self.backend.close()
 
     def getval(self):
         """Get the current sensor value.
@@ -85,6 +212,19 @@ class Analogue(sensor.Sensor):
         on the exact sensor. Includes a 'sense check' to identify
         potential errors with full or no voltage.
 
+        If 'oversample' is set, that many raw readings are taken as fast
+        as the ADC allows and combined using 'reducer'. Otherwise, if
+        'averagingAttemps' is set, that many readings are taken
+        'averagingTimeout' seconds apart and combined using
+        'averagingMethod'. Either way, the spread of the readings is
+        available from getextras().
+
+        The Microphone is normally read in the background instead, and
+        its value is the equivalent continuous noise level (dB) since it
+        was last read. The Dust sensor is normally read with a train of
+        'pulses' LED pulses, and the reads which were on time are
+        combined using 'reducer' (by default 'hampel').
+
         Args:
             self: self.
 
@@ -93,37 +233,38 @@ class Analogue(sensor.Sensor):
             None If there is potentially an error with the data.
 
         """
-        
-        if self.averagingAttemps > 1:
-            result = 0.0
-            readings = 0.0
-            readingsc = 0.0
-	    readings_array = {}
+        self.extras = None
+        if self.sensorname == "Microphone" and self.backend.sampling():
+            # Noise levels over the whole interval, from the background
+            # sampler
+            result, self.extras = self.backend.collect()
+            return result
+        if self.sensorname == "WindDirection":
+            self.ambiguouscount = 0
+        if self.sensorname == "Dust" and self.backend.pulses >= 1:
+            # Only the reads which were on time, combined using 'reducer'
+            readings = self.backend.train()
+            if not readings:
+                print("Error: No Dust readings within the timing window")
+                return None
+            result = self.reduce(readings, self.reducer)
+            if self.extras is not None:
+                self.extras.update(self.backend.stats)
+        elif self.oversample > 1:
+            if self.backend is None:
+                readings = self.adc.readburst(self.adcpin, self.oversample)
+                if self.sensorname == "WindDirection":
+                    readings = self.todirections(readings)
+            else:
+                readings = [self.getReading(True)
+                            for i in xrange(self.oversample)]
+            result = self.reduce(readings, self.reducer)
+        elif self.averagingAttemps > 1:
+            readings = []
             for i in range(0, self.averagingAttemps):
-                reading = self.getReading()
-                if (reading != 0 and reading != 1023):
-                    if self.averagingMethod == "max":
-                        if reading > readings:
-			    """print(str(reading) + " higher as " + str(readings))"""
-                            readings = reading
-                    else:
-                        readings = readings + reading
-                    readingsc = readingsc + 1
-		    if reading in readings_array:
-		        readings_array[reading] = readings_array[reading] + 1
-		    else:
-			readings_array[reading] = 1
+                readings.append(self.getReading(True))
                 time.sleep(self.averagingTimeout)
-            if readingsc == 0:
-                result = self.getReading()
-            else:
-		if self.averagingMethod == "most":
-		    sorted_x = sorted(readings_array.items(), key=operator.itemgetter(1), reverse=True)
-		    result = sorted_x[0][0]
-                elif self.averagingMethod == "max":
-                    result = readings
-                else:
-                    result = readings / readingsc
+            result = self.reduce(readings, self.averagingMethod)
         else:
             result = self.getReading()
         
@@ -144,11 +285,32 @@ class Analogue(sensor.Sensor):
                 print(msg)
                 return None
 
-	if self.sensorname == "WindDirection":
-	    return result
+        if self.sensorname == "WindDirection":
+            # Flag readings which fell between the vane's directions
+            if self.extras is None:
+                self.extras = {}
+            self.extras["ambiguous"] = self.ambiguouscount
+            return result
 
-	"""print(self.sensorname + " " + str(self.sensorvoltage))"""
+        if self.extras is not None:
+            # Express the spread in the same units as the value
+            spread = self.extras["spread"]
+            low = self.convert(max(result - spread, 1))
+            high = self.convert(min(result + spread, 1022))
+            self.extras["spread"] = abs(high - low) / 2
+        return self.convert(result)
 
+    def convert(self, result):
+        """Convert a raw ADC reading to Ohms or millivolts.
+
+        Args:
+            self: self.
+            result: The raw reading (1 to 1022).
+
+        Returns:
+            float The value for the sensor.
+
+        """
         vout = float(result)/1023 * self.sensorvoltage
         if self.pulldown != None:
             resout = (self.pulldown * self.sensorvoltage) / vout - self.pulldown
@@ -158,32 +320,209 @@ class Analogue(sensor.Sensor):
             resout = vout * 1000
         return resout
 
+    def reduce(self, readings, reducer):
+        """Combine several readings into one.
+
+        Args:
+            self: self.
+            readings: The readings.
+            reducer: How to combine them; see reducers.REDUCERS.
+
+        Returns:
+            float The combined reading. If none of the readings were
+                  valid, a fresh reading instead.
+
+        """
+        if self.sensorname == "WindDirection" and reducer != "most":
+            return self.reducedirections(readings)
+        result, spread, used = reducers.reduce_readings(readings, reducer,
+                                                        self.trim)
+        if result is None:
+            return self.getReading(True)
+        self.extras = {"spread": spread, "samples": used}
+        return result
+
+    def reducedirections(self, readings):
+        """Combine several wind directions into their circular mean.
+
+        A linear mean would put e.g. 337.5, 360 and 22.5 degrees at 120
+        degrees rather than north.
+
+        Args:
+            self: self.
+            readings: The directions (degrees).
+
+        Returns:
+            float The mean direction (degrees, above 0 and up to 360).
+                  If none of the readings were valid, a fresh reading
+                  instead.
+
+        """
+        aggregator = aggregation.CircularAggregator()
+        for reading in readings:
+            if reading not in reducers.RAILS:
+                aggregator.add(reading)
+        stats = aggregator.result()
+        if stats["value"] is None:
+            return self.getReading(True)
+        self.extras = {"spread": stats["stddev"], "samples": stats["count"]}
+        # 0 is reserved for wiring errors; north is 360
+        return stats["value"] or 360.0
+
+    def getextras(self):
+        """Get the spread of the readings behind the latest value.
+
+        Args:
+            self: self.
+
+        Returns:
+            dict The standard deviation ('spread', in the same units as
+                 the value) and number ('samples') of the readings which
+                 were combined, or None for a single reading. For the
+                 Microphone, the noise levels (see microphone.py); for
+                 the Dust sensor, also the timing of its pulse train
+                 (see DustBackend.train()).
+
+        """
+        return self.extras
+
+    def getderived(self):
+        """Output the Microphone's weighted noise levels as readings.
+
+        Args:
+            self: self.
+
+        Returns:
+            dict A virtual sensor for each of WEIGHTINGS, if spectral
+                 analysis is on (see Sensor.getderived()).
+
+        """
+        if self.sensorname != "Microphone" or self.backend.analyser is None:
+            return {}
+        derived = {}
+        for key, symbol, weighting in WEIGHTINGS:
+            derived[str(self.section) + "-" + symbol] = {
+                "formula": "x[0]",
+                "inputs": str(self.section) + "." + key,
+                "sensorname": self.sensorname + "-" + symbol,
+                "name": "Noise_" + weighting,
+                "unit": "Decibels",
+                "symbol": symbol,
+                "description": weighting + " noise level"
+                }
+        return derived
+
     def getWindDirection(self, ohm):
-        directions = { 9700: 22.5, 12450: 45, 1185: 67.5, 1390: 90, 980: 112.5, 3200: 135, 1990: 157.5, 5680: 180, 4600: 202.5, 25000: 225, 21800: 247.5, 385000: 270, 76000: 292.5, 133000: 315, 35000: 337.5, 56500: 360 }
+        """Find the direction whose resistance is closest to a reading.
+
+        Args:
+            self: self.
+            ohm: The resistance of the vane (Ohms).
 
+        Returns:
+            float, boolean The direction (degrees), and whether the
+                           reading is ambiguous: i.e. it is not within
+                           'vanetolerance' of exactly one direction. The
+                           direction is 0 (reported as a wiring error) if
+                           the resistance is more than 1 MOhm from any of
+                           them; north is always given as 360.
+
+        """
         bestDiff = 1000000
-        bestVal = 0
+        bestVal = None
+        matches = 0
 
-        for key, value in directions.iteritems():
+        for key, value in self.vanetable.iteritems():
             diff = abs(key - ohm)
             if diff < bestDiff:
                 bestDiff = diff
                 bestVal = value
+            if diff <= key * self.vanetolerance:
+                matches += 1
+
+        if bestVal is not None:
+            # 0 is reserved for wiring errors, so north is always 360
+            bestVal = bestVal % 360 or 360.0
+        return bestVal or 0, matches != 1
 
-        return bestVal
+    def build_direction_table(self):
+        """Work out the direction for every possible ADC reading.
 
-    def getReading(self):
-	if self.sensorname == "Dust":
-	    dus = dustBackend.DustBackend(self.adcpin, self.digpin)
-	    return dus.Fetch()
-	elif self.sensorname == "Microphone":
-	    mic = microphone.Microphone(self.adcpin)
-	    return mic.Fetch()
+        The direction only depends on the raw reading, 'pullup' and
+        'sensorvoltage', so it is worked out once here, leaving a single
+        lookup per reading. Readings of 0 and 1023 are left as they are,
+        so that getval() reports them as wiring errors.
+
+        Args:
+            self: self.
 
-	reading = self.adc.readadc(self.adcpin)
+        Returns:
+            list, list The direction for each reading (0 to 1023), and
+                       whether each is ambiguous. These are NumPy arrays
+                       if NumPy is installed.
 
-	if (self.sensorname == "WindDirection" and reading != 0 and reading != 1023):
+        """
+        directions = [0.0] * 1024
+        ambiguous = [False] * 1024
+        directions[1023] = 1023.0
+        for reading in range(1, 1023):
             vout = float(reading)/1023 * 3.3
-            return self.getWindDirection(self.pullup / ((self.sensorvoltage / vout) - 1))
+            if vout >= self.sensorvoltage:
+                # Can only happen if sensorvoltage is below 3.3V; treat
+                # it as an open circuit (the highest resistance)
+                directions[reading] = self.vanetable[max(self.vanetable)]
+                ambiguous[reading] = True
+                continue
+            ohm = self.pullup / ((self.sensorvoltage / vout) - 1)
+            directions[reading], ambiguous[reading] = self.getWindDirection(ohm)
+        if numpy is not None:
+            return numpy.array(directions), numpy.array(ambiguous)
+        return directions, ambiguous
+
+    def todirections(self, readings):
+        """Look up the directions for raw ADC readings.
+
+        Args:
+            self: self.
+            readings: The raw readings (list or NumPy array).
+
+        Returns:
+            list The directions (a NumPy array if NumPy is installed).
+
+        """
+        if numpy is not None:
+            readings = numpy.asarray(readings, dtype=numpy.intp)
+            self.ambiguouscount += int(self.ambiguous[readings].sum())
+            return self.directions[readings]
+        self.ambiguouscount += sum(1 for r in readings if self.ambiguous[r])
+        return [self.directions[r] for r in readings]
+
+    def getReading(self, fresh=False):
+        """Get a raw reading from the ADC.
+
+        Unless a fresh conversion is requested (e.g. when averaging
+        several readings), the value comes from the MCP3008's scan of all
+        channels for this tick.
+
+        Args:
+            self: self.
+            fresh: Whether to make a new conversion.
+
+        Returns:
+            float The raw reading.
+
+        """
+        if self.backend is not None:
+            return self.backend.Fetch()
+
+        if fresh:
+            reading = self.adc.readadc(self.adcpin)
+        else:
+            reading = self.adc.scan()[self.adcpin]
+
+        if self.sensorname == "WindDirection":
+            if self.ambiguous[reading]:
+                self.ambiguouscount += 1
+            return self.directions[reading]
 
-	return reading
\ No newline at end of file
+        return reading
\ No newline at end of file
@@ -2,22 +2,31 @@
 
 Work with a (Maplin) anemometer, i.e. read data and pulse counts, i.e. rotations.
 The anemometer is connected directly to a GPIO pin (and ground).
+Rotations are recorded by a PulseRecorder, so wind speed and gusts can
+be worked out too.
 
 """
 import RPi.GPIO as GPIO
 import sensor
+import pulses
+
+# Gusts are the highest wind speed over any period this long (seconds)
+GUSTWINDOW = 3
 
 class Anemometer(sensor.Sensor):
     """ Work with a anemometer.
 
     """
     requiredData = ["pinnumber"]
-    optionalData = ["description"]
+    optionalData = ["description", "speedfactor", "speedwindow"]
 
     def __init__(self, data):
         """Initialise.
 
         Initialise the anemometer sensor Class using parameters passed in 'data'.
+        data["speedfactor"] is the wind speed (km/h) which gives one pulse
+        per second (default 2.4), and data["speedwindow"] is the time
+        (seconds) the wind speed is averaged over (default 60).
 
         Args:
             self: self.
@@ -29,7 +38,14 @@ class Anemometer(sensor.Sensor):
         GPIO.setmode(GPIO.BCM)
         GPIO.setwarnings(False)
         self.pinnum = int(data["pinnumber"])
-        self.rotations = 0.00000001
+        self.speedfactor = 2.4
+        if "speedfactor" in data:
+            self.speedfactor = float(data["speedfactor"])
+        self.speedwindow = 60
+        if "speedwindow" in data:
+            self.speedwindow = float(data["speedwindow"])
+        self.recorder = pulses.PulseRecorder(history=max(self.speedwindow, 3600))
+        self.period = None
         GPIO.setup(self.pinnum, GPIO.IN, pull_up_down=GPIO.PUD_UP)
 #        GPIO.setup(self.pinnum, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
 #        GPIO.setup(self.pinnum, GPIO.IN)
@@ -60,14 +76,40 @@ class Anemometer(sensor.Sensor):
             self: self.
 
         Returns:
-            float The current value for the sensor.
+            int The current value for the sensor.
 
         """
-
-        rotations = self.rotations
-        self.rotations = 0.0000001
+        rotations, start, end = self.recorder.swap()
+        self.period = (start, end)
         return rotations
 
+    def getextras(self):
+        """Get the wind speed, gust speed and pulse intervals.
+
+        Returns:
+            dict 'windspeed' (km/h, averaged over the last 'speedwindow'
+                 seconds), 'gust' (km/h, the highest speed over any
+                 GUSTWINDOW seconds since the last reading), and the
+                 minimum, mean and maximum time between pulses since the
+                 last reading ('intervalmin', 'intervalmean' and
+                 'intervalmax', in seconds).
+
+        """
+        if self.period is None:
+            return None
+        start, end = self.period
+        extras = {
+            "windspeed": self.recorder.rate(self.speedwindow, end) * self.speedfactor,
+            "gust": self.recorder.maxrate(GUSTWINDOW, start, end) * self.speedfactor
+            }
+        for stat, value in self.recorder.intervals(start, end).iteritems():
+            extras["interval" + stat] = value
+        return extras
+
+    def close(self):
+        """Stop listening for rotations."""
+        GPIO.remove_event_detect(self.pinnum)
+
     def rotate(self, channel):
         """Record a rotations
 
@@ -75,8 +117,7 @@ class Anemometer(sensor.Sensor):
         function, for reasons which aren't particularly clear in the docs:
         http://raspi.tv/2013/how-to-use-interrupts-with-python-on-the-raspberry-pi-and-rpi-gpio-part-3#comment-18986
         http://sourceforge.net/p/raspberry-gpio-python/wiki/Inputs/
+        This runs in RPi.GPIO's callback thread, so must be quick.
 
         """
-
-        self.rotations += 1
-        print("rotate",self.rotations,self.pinnum)
+        self.recorder.pulse()
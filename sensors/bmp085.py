@@ -8,6 +8,9 @@ the bmpBackend Class to read the raw data from the sensor.
 import sensor
 import bmpBackend
 
+# Pressure oversampling modes; the index is the BMP085's 'oss' setting
+OVERSAMPLING = ["ultralowpower", "standard", "highres", "ultrahighres"]
+
 class BMP085(sensor.Sensor):
     """ Read data from BMP085 sensor.
 
@@ -19,7 +22,7 @@ class BMP085(sensor.Sensor):
 
     bmpClass = None
     requiredData = ["measurement", "i2cbus"]
-    optionalData = ["altitude", "mslp", "unit", "description"]
+    optionalData = ["altitude", "mslp", "unit", "description", "oversampling"]
 
     def __init__(self, data):
         """Initialise BMP085 sensor class.
@@ -35,7 +38,10 @@ class BMP085(sensor.Sensor):
         can be set to "F" to return readings in Fahrenheit instead if required.
         Pressures are returned in Hectopascals. If data["altitude"] is provided,
         and data["mslp"] is true, then Mean Sea Level Pressure will be returned
-        by getval() instead of absolute local pressure.
+        by getval() instead of absolute local pressure. data["oversampling"]
+        sets the pressure oversampling mode (one of OVERSAMPLING, or 0 to 3);
+        the default is 'standard'. Both instances share one backend, so this
+        can be set for either of them.
 
         Args:
             self: self.
@@ -75,15 +81,53 @@ class BMP085(sensor.Sensor):
             self.description = data["description"]
         else:
             self.description = "BOSCH combined temperature and pressure sensor."
+        self.bus = "i2c-" + str(int(data["i2cbus"]))
         if BMP085.bmpClass == None:
             BMP085.bmpClass = bmpBackend.BMP085(bus=int(data["i2cbus"]))
+        if "oversampling" in data:
+            BMP085.bmpClass.setmode(self.getmode(data["oversampling"]))
         return
 
+    @staticmethod
+    def getmode(oversampling):
+        """Get the BMP085 operating mode for an oversampling setting.
+
+        Args:
+            oversampling: One of OVERSAMPLING, or its index (0 to 3).
+
+        Returns:
+            int The mode.
+
+        """
+        oversampling = str(oversampling).strip().lower()
+        if oversampling in OVERSAMPLING:
+            return OVERSAMPLING.index(oversampling)
+        if oversampling in ["0", "1", "2", "3"]:
+            return int(oversampling)
+        raise ValueError("Unknown BMP085 oversampling '" + oversampling + "'")
+
+    def start(self):
+        """Start a temperature conversion, so it overlaps other reads."""
+        BMP085.bmpClass.start()
+
+    def ready(self):
+        """Check whether this instance's conversion is ready.
+
+        The pressure conversion is only started once the temperature has
+        been read, so the pressure instance is read after the other
+        sensors on the bus while it converts.
+
+        """
+        if self.valname == "Temperature-BMP":
+            return BMP085.bmpClass.tempisready()
+        return BMP085.bmpClass.pressureisready()
+
     def getval(self):
         """Get the current sensor value.
 
         Get the current sensor value, for either temperature or pressure
-        (whichever is appropriate to this instance of the class).
+        (whichever is appropriate to this instance of the class). Both
+        come from one read of the sensor per tick.
 
         Args:
             self: self.
@@ -108,7 +152,7 @@ class BMP085(sensor.Sensor):
             return temp
         elif self.valname == "Pressure":
             # Multiply by 0.01 to convert to Hectopascals
+            pressure = BMP085.bmpClass.readpressure()
             if self.mslp:
-                return BMP085.bmpClass.readmslpressure(self.altitude) * 0.01
-            else:
-                return BMP085.bmpClass.readpressure() * 0.01
+                pressure = BMP085.bmpClass.mslpressure(pressure, self.altitude)
+            return pressure * 0.01
@@ -9,6 +9,7 @@ import time
 import math
 
 from Adafruit_I2C import Adafruit_I2C
+from sensor import TickCache
 
 # ===========================================================================
 # BMP085 Class
@@ -47,6 +48,11 @@ class BMP085:
     __BMP085_READTEMPCMD = 0x2E
     __BMP085_readpressureCMD = 0x34
 
+    # Conversion times (seconds) for temperature, and for pressure in
+    # each operating mode
+    TEMPTIME = 0.005
+    PRESSURETIMES = [0.005, 0.008, 0.014, 0.026]
+
     # Private Fields
     _cal_AC1 = 0
     _cal_AC2 = 0
@@ -66,6 +72,22 @@ class BMP085:
 
         self.address = address
         self.debug = debug
+        # Temperature and pressure sensors share one reading per tick
+        self.cache = TickCache()
+        # When the temperature conversion started by start() will be
+        # ready; None if there isn't one under way
+        self.tempready = None
+        # When the pressure conversion started after reading the
+        # temperature will be ready; None if there isn't one under way
+        self.pressureready = None
+        # MSLP conversion factor for each altitude
+        self.mslpfactors = {}
+        self.setmode(mode)
+        # Read the calibration data
+        self.readcalibrationdata()
+
+    def setmode(self, mode):
+        "Sets the operating (pressure oversampling) mode"
         # Make sure the specified mode is in the appropriate range
         if (mode < 0) or (mode > 3):
             if self.debug:
@@ -73,25 +95,28 @@ class BMP085:
             self.mode = self.__BMP085_STANDARD
         else:
             self.mode = mode
-        # Read the calibration data
-        self.readcalibrationdata()
+        self._b7scale = 50000 >> self.mode
 
     def readcalibrationdata(self):
-        "Reads the calibration data from the IC"
-        self._cal_AC1 = self.i2c.reads16(self.__BMP085_CAL_AC1)   # INT16
-        self._cal_AC2 = self.i2c.reads16(self.__BMP085_CAL_AC2)   # INT16
-        self._cal_AC3 = self.i2c.reads16(self.__BMP085_CAL_AC3)   # INT16
-        self._cal_AC4 = self.i2c.readu16(self.__BMP085_CAL_AC4)   # UINT16
-        self._cal_AC5 = self.i2c.readu16(self.__BMP085_CAL_AC5)   # UINT16
-        self._cal_AC6 = self.i2c.readu16(self.__BMP085_CAL_AC6)   # UINT16
-        self._cal_B1 = self.i2c.reads16(self.__BMP085_CAL_B1)     # INT16
-        self._cal_B2 = self.i2c.reads16(self.__BMP085_CAL_B2)     # INT16
-        self._cal_MB = self.i2c.reads16(self.__BMP085_CAL_MB)     # INT16
-        self._cal_MC = self.i2c.reads16(self.__BMP085_CAL_MC)     # INT16
-        self._cal_MD = self.i2c.reads16(self.__BMP085_CAL_MD)     # INT16
+        "Reads the calibration data from the IC, in one transaction"
+        # AC1-AC3 are INT16, AC4-AC6 UINT16 and B1-MD INT16, in
+        # consecutive registers from __BMP085_CAL_AC1 to __BMP085_CAL_MD
+        calibration = self.i2c.readstruct(self.__BMP085_CAL_AC1, ">hhhHHHhhhhh")
+        if calibration == -1:
+            raise IOError("Unable to read BMP085 calibration data")
+        (self._cal_AC1, self._cal_AC2, self._cal_AC3,
+         self._cal_AC4, self._cal_AC5, self._cal_AC6,
+         self._cal_B1, self._cal_B2, self._cal_MB,
+         self._cal_MC, self._cal_MD) = calibration
+        self.precompute()
         if self.debug:
             self.showcalibrationdata()
 
+    def precompute(self):
+        "Works out the parts of the compensation which only depend on the calibration data"
+        self._MC11 = self._cal_MC << 11
+        self._AC1x4 = self._cal_AC1 * 4
+
     def showcalibrationdata(self):
         "Displays the calibration values for debugging purposes"
         print("DBG: AC1 = %6d" % (self._cal_AC1))
@@ -106,107 +131,112 @@ class BMP085:
         print("DBG: MC  = %6d" % (self._cal_MC))
         print("DBG: MD  = %6d" % (self._cal_MD))
 
-    def readrawtemp(self):
-        "Reads the raw (uncompensated) temperature from the sensor"
+    def wait(self, ready):
+        "Waits until a conversion is ready"
+        remaining = ready - time.time()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def start(self):
+        "Starts a temperature conversion, unless there is one under way or this tick has already been read"
+        if self.tempready is None and not self.cache.has("rawtemp"):
+            self.__starttemp()
+
+    def __starttemp(self):
+        "Starts a temperature conversion"
         self.i2c.write8(self.__BMP085_CONTROL, self.__BMP085_READTEMPCMD)
-        time.sleep(0.005)  # Wait 5ms
+        self.tempready = time.time() + self.TEMPTIME
+        # A new conversion overwrites any pressure waiting to be read
+        self.pressureready = None
+
+    def __startpressure(self):
+        "Starts a pressure conversion"
+        self.i2c.write8(self.__BMP085_CONTROL, self.__BMP085_readpressureCMD + (self.mode << 6))
+        self.pressureready = time.time() + self.PRESSURETIMES[self.mode]
+
+    def tempisready(self):
+        "Checks whether this tick's temperature can be read without waiting"
+        if self.cache.has("rawtemp"):
+            return True
+        return self.tempready is not None and time.time() >= self.tempready
+
+    def pressureisready(self):
+        "Checks whether this tick's pressure can be read without waiting"
+        if self.cache.has("rawpressure"):
+            return True
+        if not self.cache.has("rawtemp"):
+            # The pressure conversion hasn't been started yet
+            return False
+        return self.pressureready is not None and time.time() >= self.pressureready
+
+    def readrawtemp(self):
+        "Reads the raw (uncompensated) temperature from the sensor, then starts a pressure conversion"
+        if self.tempready is None:
+            self.__starttemp()
+        self.wait(self.tempready)
+        self.tempready = None
         raw = self.i2c.readu16(self.__BMP085_TEMPDATA)
+        if raw == -1:
+            raise IOError("Unable to read BMP085 temperature")
         if self.debug:
             print("DBG: Raw Temp: 0x%04X (%d)" % (raw & 0xFFFF, raw))
+        # Don't wait for it; it converts while other sensors are read
+        self.__startpressure()
         return raw
 
     def readrawpressure(self):
-        "Reads the raw (uncompensated) pressure level from the sensor"
-        self.i2c.write8(self.__BMP085_CONTROL, self.__BMP085_readpressureCMD + (self.mode << 6))
-        if self.mode == self.__BMP085_ULTRALOWPOWER:
-            time.sleep(0.005)
-        elif self.mode == self.__BMP085_HIGHRES:
-            time.sleep(0.014)
-        elif self.mode == self.__BMP085_ULTRAHIGHRES:
-            time.sleep(0.026)
-        else:
-            time.sleep(0.008)
-        msb = self.i2c.readu8(self.__BMP085_PRESSUREDATA)
-        lsb = self.i2c.readu8(self.__BMP085_PRESSUREDATA+1)
-        xlsb = self.i2c.readu8(self.__BMP085_PRESSUREDATA+2)
+        "Reads the raw (uncompensated) pressure level from the sensor, finishing the conversion started by readrawtemp()"
+        if self.pressureready is None:
+            self.__startpressure()
+        self.wait(self.pressureready)
+        self.pressureready = None
+        data = self.i2c.readlist(self.__BMP085_PRESSUREDATA, 3)
+        if data == -1:
+            raise IOError("Unable to read BMP085 pressure")
+        msb, lsb, xlsb = data
         raw = ((msb << 16) + (lsb << 8) + xlsb) >> (8 - self.mode)
         if self.debug:
             print("DBG: Raw Pressure: 0x%04X (%d)" % (raw & 0xFFFF, raw))
         return raw
 
-    def readtemperature(self):
-        "Gets the compensated temperature in degrees celcius"
-        UT = 0
-        X1 = 0
-        X2 = 0
-        B5 = 0
-        temp = 0.0
-
-        # Read raw temp before aligning it with the calibration values
-        UT = self.readrawtemp()
-        X1 = ((UT - self._cal_AC6) * self._cal_AC5) >> 15
-        X2 = (self._cal_MC << 11) / (X1 + self._cal_MD)
-        B5 = X1 + X2
-        temp = ((B5 + 8) >> 4) / 10.0
-        if self.debug:
-            print("DBG: Calibrated temperature = %f C" % temp)
-        return temp
+    def collecttemp(self):
+        "Gets the raw temperature, once per tick"
+        return self.cache.get("rawtemp", self.readrawtemp)
 
-    def readpressure(self):
-        "Gets the compensated pressure in pascal"
-        UT = 0
-        UP = 0
-        B3 = 0
-        B5 = 0
-        B6 = 0
-        X1 = 0
-        X2 = 0
-        X3 = 0
-        p = 0
-        B4 = 0
-        B7 = 0
-
-        UT = self.readrawtemp()
-        UP = self.readrawpressure()
-
-        # You can use the datasheet values to test the conversion results
-        # dsvalues = True
-        dsvalues = False
-
-        if dsvalues:
-            UT = 27898
-            UP = 23843
-            self._cal_AC1 = 408
-            self._cal_AC2 = -72
-            self._cal_AC3 = -14383
-            self._cal_AC4 = 32741
-            self._cal_AC5 = 32757
-            self._cal_AC6 = 23153
-            self._cal_B1 = 6190
-            self._cal_B2 = 4
-            self._cal_MB = -32767
-            self._cal_MC = -8711
-            self._cal_MD = 2868
-            self.mode = self.__BMP085_ULTRALOWPOWER
-            if self.debug:
-                self.showcalibrationdata()
+    def collectpressure(self):
+        "Gets the raw pressure, once per tick (after the temperature, which it's compensated with)"
+        self.collecttemp()
+        return self.cache.get("rawpressure", self.readrawpressure)
 
-        # True Temperature Calculations
+    def read(self):
+        "Gets the compensated temperature (degrees celcius) and pressure (pascal), once per tick"
+        return self.compensate(self.collecttemp(), self.collectpressure())
+
+    def compensatetemp(self, UT):
+        "Calculates the temperature (degrees celcius) and B5 (which the pressure calculation needs) from a raw reading"
         X1 = ((UT - self._cal_AC6) * self._cal_AC5) >> 15
-        X2 = (self._cal_MC << 11) / (X1 + self._cal_MD)
+        X2 = self._MC11 / (X1 + self._cal_MD)
         B5 = X1 + X2
+        temp = ((B5 + 8) >> 4) / 10.0
         if self.debug:
             print("DBG: X1 = %d" % (X1))
             print("DBG: X2 = %d" % (X2))
             print("DBG: B5 = %d" % (B5))
-            print("DBG: True Temperature = %.2f C" % (((B5 + 8) >> 4) / 10.0))
+            print("DBG: True Temperature = %.2f C" % temp)
+        return temp, B5
+
+    def compensate(self, UT, UP):
+        "Calculates the temperature (degrees celcius) and pressure (pascal) from one pair of raw readings"
+        # True Temperature Calculations
+        temp, B5 = self.compensatetemp(UT)
 
         # Pressure Calculations
         B6 = B5 - 4000
-        X1 = (self._cal_B2 * ((B6 * B6) >> 12)) >> 11
+        B62 = (B6 * B6) >> 12
+        X1 = (self._cal_B2 * B62) >> 11
         X2 = (self._cal_AC2 * B6) >> 11
         X3 = X1 + X2
-        B3 = (((self._cal_AC1 * 4 + X3) << self.mode) + 2) / 4
+        B3 = (((self._AC1x4 + X3) << self.mode) + 2) / 4
         if self.debug:
             print("DBG: B6 = %d" % (B6))
             print("DBG: X1 = %d" % (X1))
@@ -214,10 +244,10 @@ class BMP085:
             print("DBG: B3 = %d" % (B3))
 
         X1 = (self._cal_AC3 * B6) >> 13
-        X2 = (self._cal_B1 * ((B6 * B6) >> 12)) >> 16
+        X2 = (self._cal_B1 * B62) >> 16
         X3 = ((X1 + X2) + 2) >> 2
         B4 = (self._cal_AC4 * (X3 + 32768)) >> 15
-        B7 = (UP - B3) * (50000 >> self.mode)
+        B7 = (UP - B3) * self._b7scale
         if self.debug:
             print("DBG: X1 = %d" % (X1))
             print("DBG: X2 = %d" % (X2))
@@ -241,7 +271,15 @@ class BMP085:
         if self.debug:
             print("DBG: Pressure = %d Pa" % (p))
 
-        return p
+        return temp, p
+
+    def readtemperature(self):
+        "Gets the compensated temperature in degrees celcius, without waiting for the pressure"
+        return self.compensatetemp(self.collecttemp())[0]
+
+    def readpressure(self):
+        "Gets the compensated pressure in pascal"
+        return self.read()[1]
 
     def readaltitude(self, sealevelpressure=101325):
         "Calculates the altitude in meters"
@@ -252,13 +290,16 @@ class BMP085:
             print("DBG: Altitude = %d" % (altitude))
         return altitude
 
+    def mslpressure(self, pressure, altitude):
+        "Converts a pressure to mean sea level pressure"
+        if altitude not in self.mslpfactors:
+            T0 = float(altitude) / 44330
+            self.mslpfactors[altitude] = 1 / math.pow(1 - T0, 5.255)
+        return pressure * self.mslpfactors[altitude]
+
     def readmslpressure(self, altitude):
         "Calculates the mean sea level pressure"
-        pressure = float(self.readpressure())
-        T0 = float(altitude) / 44330
-        T1 = math.pow(1 - T0, 5.255)
-        mslpressure = pressure / T1
-        return mslpressure
+        return self.mslpressure(float(self.readpressure()), altitude)
 
 if __name__ == "__main__":
     bmp = BMP085()
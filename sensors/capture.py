@@ -0,0 +1,301 @@
+""" Capture raw, high-rate data from an MCP3008 channel to a file.
+
+The normal per-sample readings can't show fast signals (vibration, the
+dust sensor's LED pulse, sound transients). A capture reads one ADC
+channel as fast as it can (see MCP3008.capture()) into a buffer which is
+allocated once, then writes it to a compact binary file:
+
+    header    HEADER (magic, version, channel, sample count, chunk size,
+              sample rate, start and end time)
+    chunks    the start and end time of each chunk (two float64s per
+              chunk)
+    samples   the 10-bit readings (little-endian uint16)
+
+Use load() to read a capture back as a NumPy memmap, without reading the
+whole file into memory, and sampletimes() for the time of each sample.
+
+Captures can be run from the command line (python capture.py --help),
+or in the background while sampling by adding a [Capture] section to
+sensors.cfg (see the Capture class), which triggers them on a schedule
+and/or when the channel crosses a threshold.
+
+"""
+import array
+import math
+import os
+import struct
+import sys
+import threading
+import time
+import mcp3008
+import sensor
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MAGIC = "AIRPICAP"
+VERSION = 1
+# Magic, version, channel, sample count, chunk size, sample rate (while
+# converting, i.e. not counting gaps between chunks), start time, end time
+HEADER = struct.Struct("<8sBBxxIIddd")
+
+def write_capture(path, channel, samples, chunks, chunk):
+    """Write a capture to a file.
+
+    Args:
+        path: The file to write.
+        channel: The ADC channel captured.
+        samples: The readings.
+        chunks: The (start, end) time of each chunk (seconds since the
+                epoch), as from MCP3008.capture().
+        chunk: The number of readings per chunk.
+
+    """
+    count = len(samples)
+    converting = sum(end - start for start, end in chunks)
+    rate = 0.0
+    if converting > 0:
+        rate = count / converting
+    times = [t for pair in chunks for t in pair]
+    with open(path, "wb") as capfile:
+        capfile.write(HEADER.pack(MAGIC, VERSION, channel, count, chunk, rate,
+                                  chunks[0][0], chunks[-1][1]))
+        capfile.write(struct.pack("<%dd" % len(times), *times))
+        if numpy is not None:
+            numpy.asarray(samples, dtype="<u2").tofile(capfile)
+        else:
+            data = array.array("H", samples)
+            if sys.byteorder != "little":
+                data.byteswap()
+            data.tofile(capfile)
+
+def read_header(path):
+    """Read the header of a capture file.
+
+    Args:
+        path: The file.
+
+    Returns:
+        dict The 'channel', 'count', 'chunk', 'rate', 'start', 'end',
+             the (start, end) time of each of the 'chunks', and the
+             'offset' of the samples in the file.
+
+    """
+    with open(path, "rb") as capfile:
+        fields = HEADER.unpack(capfile.read(HEADER.size))
+        if fields[0] != MAGIC:
+            raise ValueError(path + " is not an AirPi capture file")
+        if fields[1] != VERSION:
+            raise ValueError(path + " is capture version " + str(fields[1]))
+        header = dict(zip(["channel", "count", "chunk", "rate", "start",
+                           "end"], fields[2:]))
+        chunks = int(math.ceil(header["count"] / float(header["chunk"] or 1)))
+        times = struct.unpack("<%dd" % (2 * chunks),
+                              capfile.read(16 * chunks))
+        header["chunks"] = zip(times[::2], times[1::2])
+        header["offset"] = HEADER.size + 16 * chunks
+    return header
+
+def load(path):
+    """Load a capture file.
+
+    Args:
+        path: The file.
+
+    Returns:
+        dict, array The header (see read_header()), and the samples as a
+                    read-only NumPy memmap.
+
+    """
+    header = read_header(path)
+    samples = numpy.memmap(path, dtype="<u2", mode="r",
+                           offset=header["offset"], shape=(header["count"],))
+    return header, samples
+
+def sampletimes(header):
+    """Work out the time of each sample in a capture.
+
+    Samples are assumed to be evenly spaced within each chunk.
+
+    Args:
+        header: The header (see read_header()).
+
+    Returns:
+        array The time of each sample (seconds since the epoch).
+
+    """
+    count, chunk = header["count"], header["chunk"]
+    chunks = numpy.asarray(header["chunks"])
+    index = numpy.arange(count)
+    which = index // chunk
+    # The number of samples in each chunk (the last may be short)
+    sizes = numpy.minimum(count - numpy.arange(len(chunks)) * chunk, chunk)
+    spacing = (chunks[:, 1] - chunks[:, 0]) / sizes
+    return chunks[which, 0] + (index % chunk) * spacing[which]
+
+class Capture(sensor.Sensor):
+    """ Trigger captures in the background while sampling.
+
+    Not a real sensor: it gives no readings (so it is loaded as a
+    'support' for the sensors), but starts a thread which captures a
+    channel to a new file in 'directory' every 'interval' seconds and/or
+    whenever the channel crosses 'threshold'.
+
+    """
+    requiredData = ["adcpin", "directory"]
+    optionalData = ["samples", "chunk", "interval", "threshold", "edge",
+                    "holdoff", "pollinterval"]
+
+    def __init__(self, data):
+        """Initialise.
+
+        Initialise the capture trigger using parameters passed in 'data'.
+        Each capture is data["samples"] readings (default 4096) of
+        channel data["adcpin"], made in chunks of data["chunk"] (default
+        512) so that other analogue sensors aren't held up for long. A
+        capture is triggered every data["interval"] seconds if set, and
+        whenever the channel (polled every data["pollinterval"] seconds,
+        default 0.01) crosses data["threshold"] in the direction of
+        data["edge"] ('rising', the default, or 'falling'), but never
+        within data["holdoff"] seconds (default 60) of the last one.
+
+        Args:
+            self: self.
+            data: A dict containing the parameters to be used during setup.
+
+        """
+        self.sensorname = "Capture"
+        self.adc = mcp3008.MCP3008.getshared()
+        self.adcpin = int(data["adcpin"])
+        self.directory = data["directory"]
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self.count = int(data.get("samples", 4096))
+        self.chunk = int(data.get("chunk", 512))
+        self.interval = None
+        if "interval" in data:
+            self.interval = float(data["interval"])
+        self.threshold = None
+        if "threshold" in data:
+            self.threshold = int(data["threshold"])
+        self.edge = data.get("edge", "rising").lower()
+        if self.edge not in ["rising", "falling"]:
+            raise ValueError("Unknown capture edge '" + self.edge + "'")
+        self.holdoff = float(data.get("holdoff", 60))
+        self.pollinterval = float(data.get("pollinterval", 0.01))
+        # Allocated once, and re-used for every capture
+        if numpy is not None:
+            self.buffer = numpy.empty(self.count, dtype=numpy.uint16)
+        else:
+            self.buffer = [0] * self.count
+        self.captures = 0
+        self.failures = 0
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="capture")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def capture(self, reason):
+        """Make one capture and write it to a new file.
+
+        Args:
+            reason: Why it was triggered ('interval' or 'threshold'),
+                    which is included in the file name.
+
+        Returns:
+            string The file written.
+
+        """
+        samples, chunks = self.adc.capture(self.adcpin, self.count,
+                                           self.chunk, self.buffer)
+        # To the millisecond, and numbered if need be, so that captures
+        # close together don't overwrite each other
+        start = chunks[0][0]
+        name = time.strftime("%Y%m%d-%H%M%S", time.localtime(start))
+        name += "-%03d" % (int(start * 1000) % 1000)
+        name += "-ch" + str(self.adcpin) + "-" + reason
+        path = os.path.join(self.directory, name + ".cap")
+        number = 0
+        while os.path.exists(path):
+            number += 1
+            path = os.path.join(self.directory,
+                                name + "-" + str(number) + ".cap")
+        write_capture(path, self.adcpin, samples, chunks, self.chunk)
+        self.captures += 1
+        return path
+
+    def crossed(self, previous, value):
+        """Check whether the channel has crossed the threshold."""
+        if self.edge == "rising":
+            return previous < self.threshold <= value
+        return previous > self.threshold >= value
+
+    def run(self):
+        """Trigger captures until stopped.
+
+        A capture which fails (e.g. because the disk is full) is
+        reported and counted in self.failures, and triggering carries
+        on.
+
+        """
+        last = None
+        nextcapture = None
+        if self.interval:
+            nextcapture = time.time() + self.interval
+        previous = None
+        while not self.stopping.isSet():
+            now = time.time()
+            reason = None
+            if nextcapture is not None and now >= nextcapture:
+                reason = "interval"
+                nextcapture += self.interval
+            if self.threshold is not None:
+                value = self.adc.readadc(self.adcpin)
+                if previous is not None and self.crossed(previous, value):
+                    reason = "threshold"
+                previous = value
+            if reason is not None and (last is None or
+                                       now - last >= self.holdoff):
+                try:
+                    self.capture(reason)
+                except Exception as excep:
+                    self.failures += 1
+                    print("Error: Capture of ADC channel " + str(self.adcpin)
+                          + " failed: " + str(excep))
+                last = now
+                previous = None
+            if self.threshold is not None:
+                self.stopping.wait(self.pollinterval)
+            elif nextcapture is not None:
+                self.stopping.wait(max(nextcapture - time.time(), 0))
+            else:
+                return
+
+    def close(self):
+        """Stop triggering captures, after any capture in progress."""
+        self.stopping.set()
+        self.thread.join(5)
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Capture an MCP3008 channel at full speed to a file.")
+    parser.add_argument("channel", type=int, help="ADC channel (0 to 7)")
+    parser.add_argument("output", help="file to write")
+    parser.add_argument("-n", "--samples", type=int, default=4096,
+                        help="number of samples (default 4096)")
+    parser.add_argument("-c", "--chunk", type=int, default=None,
+                        help="samples per chunk (default: all in one)")
+    parser.add_argument("--transport", default="auto",
+                        choices=mcp3008.TRANSPORTS, help="SPI transport")
+    args = parser.parse_args()
+    adc = mcp3008.MCP3008({"transport": args.transport})
+    samples, chunks = adc.capture(args.channel, args.samples, args.chunk)
+    write_capture(args.output, args.channel, samples, chunks,
+                  args.chunk or args.samples)
+    header = read_header(args.output)
+    print("Captured " + str(header["count"]) + " samples at "
+          + "{0:.0f}".format(header["rate"]) + " per second to "
+          + args.output)
@@ -3,17 +3,21 @@
 A high-level Class to read data from the DHT22 sensor. An instance of
 the Class can read *either* temperature *or* pressure; see __init__()
 for more detail. Requires the low-level dhtreader.so (shared object) to
-read the raw data from the sensor.
+read the raw data from the sensor. The sensor itself is read in the
+background (see sensor.AsyncSensor), once per pin.
 
 """
 import sensor
 import dhtreader
-import time
-import threading
 
 # https://github.com/adafruit/Adafruit-Raspberry-Pi-Python-Code/blob/master/Adafruit_DHT_Driver_Python/dhtreader.c
 
-class DHT22(sensor.Sensor):
+# The range of each measurement the DHT22 can make; a reading outside
+# these is a bad read, even if the checksum was OK
+TEMPRANGE = (-40, 80)
+HUMIDRANGE = (0, 100)
+
+class DHT22(sensor.AsyncSensor):
     """ Read data from the DHT22 sensor.
 
     A high-level Class to read data from the DHT22 sensor. An instance of
@@ -23,7 +27,9 @@ class DHT22(sensor.Sensor):
 
     """
     requiredData = ["measurement", "pinnumber"]
-    optionalData = ["unit", "description"]
+    optionalData = ["unit", "description", "maxAge"]
+    # The DHT22 can't be read more than once every 2 seconds
+    mininterval = 2
 
     def __init__(self, data):
         """Initialise.
@@ -38,6 +44,9 @@ class DHT22(sensor.Sensor):
         the BMP). By default temperatures are read in Celsius; data["unit"]
         can be set to "F" to return readings in Fahrenheit instead if required.
         Humidity is returned as percentage relative humidity.
+        The sensor is read in the background, once for both instances;
+        readings older than data["maxAge"] seconds (default 10) are
+        treated as missing.
 
         Args:
             self: self.
@@ -46,11 +55,13 @@ class DHT22(sensor.Sensor):
         Return:
 
         """
-        dhtreader.init()
-        dhtreader.lastDataTime = 0
-        dhtreader.lastData = (None, None)
         self.readingtype = "sample"
         self.pinnum = int(data["pinnumber"])
+        # Both DHT22 instances share the pin (and its acquirer)
+        self.bus = "gpio-" + str(self.pinnum)
+        self.maxage = 10
+        if "maxAge" in data:
+            self.maxage = float(data["maxAge"])
         if "temp" in data["measurement"].lower():
             self.sensorname = "DHT22-temp"
             self.valname = "Temperature-DHT"
@@ -69,60 +80,55 @@ class DHT22(sensor.Sensor):
             self.description = data["description"]
         else:
             self.description = "A combined temperature and humidity sensor."
+        self.startacquiring()
         return
 
-    def getval(self):
-        """Get the current sensor value.
+    def acquirerkey(self):
+        """Share one acquirer between both instances on a pin."""
+        return ("dht22", self.pinnum)
+
+    def setup(self):
+        """Initialise dhtreader."""
+        dhtreader.init()
+
+    def acquire(self):
+        """Read and validate the sensor.
 
-        Get the current sensor value, for either temperature or humidity
-        (whichever is appropriate to this instance of the class). Don't
-        read more often than every two seconds (manufacturer says this
-        is the average sensing time).
+        dhtreader checks the checksum, and either raises an exception or
+        returns None if it doesn't match.
+
+        Returns:
+            tuple The temperature and humidity, or None if the read
+                  failed or the values are out of range.
+
+        """
+        result = dhtreader.read(22, self.pinnum)
+        if result is None:
+            return None
+        temp, humid = result
+        if temp is None or humid is None:
+            return None
+        if not TEMPRANGE[0] <= temp <= TEMPRANGE[1]:
+            return None
+        if not HUMIDRANGE[0] <= humid <= HUMIDRANGE[1]:
+            return None
+        return temp, humid
+
+    def select(self, value):
+        """Get either the temperature or the humidity from a reading.
 
         Args:
             self: self.
+            value: The temperature and humidity, from acquire().
 
         Returns:
-            float The current value for the sensor.
+            float The value for this instance of the class.
 
         """
-        if (time.time() - dhtreader.lastDataTime) > 2: # ok to do another reading
-            # launch & wait for thread
-            thread = DHTReadThread(self)
-            thread.start()
-            thread.join(2)
-            if thread.isAlive():
-                raise Exception('Timeout reading ' + self.sensorname)
-            dhtreader.lastDataTime = time.time()
-
-        temp, humid = dhtreader.lastData
+        temp, humid = value
         if self.valname == "Temperature-DHT":
-            temp = temp
             if self.valunit == "Fahrenheit":
-                try:
-                    temp = temp * 1.8 + 32
-                except TypeError:
-                    # This will be thrown if the sensor fails to read,
-                    # and so 'temp' has type 'None'. That usually
-                    # happens at the start of the run, and is dealt with
-                    # either by the fact that it's a dummy run and we're
-                    # ignoring readings anyway, or by sample() in the
-                    # main airpi.py script (~ line 908).
-                    pass
+                temp = temp * 1.8 + 32
             return temp
         elif self.valname == "Relative_Humidity":
             return humid
-
-# http://softwareramblings.com/2008/06/running-functions-as-threads-in-python.html
-# https://docs.python.org/2/library/threading.html
-class DHTReadThread(threading.Thread):
-    def __init__(self, parent):
-        self.parent = parent
-        threading.Thread.__init__(self)
-
-    def run(self):
-        try:
-            temp, humid = dhtreader.read(22, self.parent.pinnum)
-        except Exception:
-            temp, humid = dhtreader.lastData
-        dhtreader.lastData = (temp, humid)
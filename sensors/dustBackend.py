@@ -1,40 +1,208 @@
 """
-Generic class to support analogue sensors.
+Read the Sharp GP2Y1010 optical dust sensor.
 
-The MCP3008 ADC is used by this class, and output can be in
-either Ohms or millivolts depending on the exact sensor in question.
+The sensor's infrared LED is pulsed using a GPIO pin, and the output
+voltage is read via the MCP3008 ADC part way through the pulse: the
+datasheet calls for a 0.32ms pulse every 10ms, read 0.28ms after the LED
+switches on. Linux can't sleep for a few microseconds, so rather than
+sleeping, train() spins on a high-resolution monotonic clock until the
+read is due, and then measures when the conversion started and finished.
+The ADC samples somewhere in that window, so a read is only kept if the
+window brackets the target delay and is no longer than a normal
+conversion (measured by calibrate()); a read which landed outside the
+timing window (e.g. because the process was pre-empted, or the SPI
+transfer was held up) is thrown away, so the value is only made from
+reads at the right point on the pulse.
 
 """
-import RPi.GPIO as GPIO
 import mcp3008
-import sensor
 import time
-import operator
+from scheduler import monotonic
+
+try:
+    import RPi.GPIO as GPIO
+except ImportError:
+    # Not on a Pi; only needed once the sensor is opened
+    GPIO = None
+
+# Timings from the datasheet (seconds)
+PULSEWIDTH = 0.00032
+PULSEPERIOD = 0.01
+# The number of conversions calibrate() times
+CALIBRATIONS = 21
 
 class DustBackend:
 
-    def __init__(self, adcpin = 6, digital_pin = 7):
-	self.adc = mcp3008.MCP3008.sharedClass
-	self.analogue_pin = adcpin
-	self.digital_pin = digital_pin
-	GPIO.setmode(GPIO.BCM)
-	GPIO.setup(self.digital_pin, GPIO.OUT)
+    def __init__(self, adcpin = 6, digital_pin = 7, adc = None, pulses = 50,
+                 delay = 0.00028, tolerance = 0.00002):
+        """Initialise.
+
+        No hardware is touched until open() is called.
+
+        Args:
+            adcpin: The ADC channel the sensor output is connected to.
+            digital_pin: The GPIO pin which drives the sensor's LED.
+            adc: The MCP3008 to read from; defaults to the shared one.
+            pulses: The number of pulses in each train; 0 means read a
+                    single pulse with Fetch() instead (without checking
+                    its timing).
+            delay: How long (seconds) after switching on the LED to
+                   read the output.
+            tolerance: How far (seconds) the conversion window can be
+                       from 'delay', or longer than a normal conversion,
+                       before the read is thrown away.
+
+        """
+        self.adc = adc
+        self.analogue_pin = adcpin
+        self.digital_pin = digital_pin
+        self.pulses = pulses
+        self.delay = delay
+        self.tolerance = tolerance
+        # How long (seconds) a normal conversion takes; see calibrate()
+        self.convtime = None
+        self.stats = {}
+
+    def open(self):
+        """Set up the LED pin, and find the ADC if not given one."""
+        if GPIO is None:
+            raise ImportError("RPi.GPIO is needed for the Dust sensor's LED")
+        if self.adc is None:
+            self.adc = mcp3008.MCP3008.getshared()
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup(self.digital_pin, GPIO.OUT)
+        GPIO.output(self.digital_pin, GPIO.HIGH)
+        self.calibrate()
+
+    def calibrate(self):
+        """Measure how long a normal conversion takes (with the LED off).
+
+        The median of CALIBRATIONS conversions is kept in self.convtime,
+        so that the odd slow one doesn't count.
+
+        """
+        convert = self.adc.transport.convert
+        times = []
+        with self.adc.lock:
+            for i in xrange(CALIBRATIONS):
+                start = monotonic()
+                convert(self.analogue_pin)
+                times.append(monotonic() - start)
+        times.sort()
+        self.convtime = times[len(times) // 2]
+
+    def close(self):
+        """Leave the LED switched off (it is active low)."""
+        GPIO.output(self.digital_pin, GPIO.HIGH)
+
+    def pulse(self):
+        """Fire one pulse and read the sensor during it.
+
+        The ADC is locked for the whole pulse, so that another sensor
+        can't delay the read. The conversion is started half a normal
+        conversion early, so that its window is centred on 'delay'.
+
+        Returns:
+            int, float, float The raw reading, and how long (seconds)
+                              after the LED switched on the conversion
+                              started and finished.
+
+        """
+        convert = self.adc.transport.convert
+        lead = (self.convtime or 0) / 2
+        with self.adc.lock:
+            GPIO.output(self.digital_pin, GPIO.LOW)
+            on = monotonic()
+            due = on + self.delay - lead
+            while monotonic() < due:
+                pass
+            start = monotonic()
+            reading = convert(self.analogue_pin)
+            end = monotonic()
+            off = on + PULSEWIDTH
+            while monotonic() < off:
+                pass
+            GPIO.output(self.digital_pin, GPIO.HIGH)
+        return reading, start - on, end - on
+
+    def ontime(self, start, end):
+        """Check whether a conversion window was on time.
+
+        Args:
+            start: When (seconds after the LED switched on) the
+                   conversion started.
+            end: When it finished.
+
+        Returns:
+            boolean True if the window brackets 'delay' and is no longer
+                    than a normal conversion (both within 'tolerance').
+
+        """
+        if self.convtime is not None and end - start > self.convtime + self.tolerance:
+            return False
+        return (start <= self.delay + self.tolerance and
+                end >= self.delay - self.tolerance)
+
+    def train(self):
+        """Fire a train of pulses, keeping the reads which were on time.
+
+        Statistics for the train are left in self.stats: the number of
+        reads 'accepted' and 'mistimed', the mean and worst error in the
+        delay (from the middle of the conversion window) of the accepted
+        reads ('delayerror' and 'maxdelayerror'), the mean and longest
+        conversion window of the accepted reads ('window' and
+        'maxwindow') and the normal conversion time ('convtime'), all in
+        microseconds.
+
+        Returns:
+            list The raw readings which were within the timing window.
+
+        """
+        readings = []
+        errors = []
+        windows = []
+        mistimed = 0
+        nextpulse = monotonic()
+        for i in xrange(self.pulses):
+            reading, start, end = self.pulse()
+            if self.ontime(start, end):
+                readings.append(reading)
+                errors.append(abs((start + end) / 2 - self.delay))
+                windows.append(end - start)
+            else:
+                mistimed += 1
+            nextpulse += PULSEPERIOD
+            wait = nextpulse - monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            else:
+                nextpulse = monotonic()
+        self.stats = {"accepted": len(readings), "mistimed": mistimed,
+                      "delayerror": None, "maxdelayerror": None,
+                      "window": None, "maxwindow": None, "convtime": None}
+        if errors:
+            self.stats["delayerror"] = sum(errors) / len(errors) * 1e6
+            self.stats["maxdelayerror"] = max(errors) * 1e6
+            self.stats["window"] = sum(windows) / len(windows) * 1e6
+            self.stats["maxwindow"] = max(windows) * 1e6
+        if self.convtime is not None:
+            self.stats["convtime"] = self.convtime * 1e6
+        return readings
 
     def Run(self):
-	while 1 == 1:
-	    print(self.Fetch())
-	    time.sleep(0.1)
+        while 1 == 1:
+            print(self.Fetch())
+            time.sleep(0.1)
 
     def Fetch(self):
-	GPIO.output(self.digital_pin, GPIO.LOW)
-	time.sleep(0.000028)
-	voMeasured = self.adc.readadc(self.analogue_pin)
-	time.sleep(0.000004)
-	GPIO.output(self.digital_pin, GPIO.HIGH)
-	time.sleep(0.000968)
-	return voMeasured
-
-v = mcp3008.MCP3008({})
+        GPIO.output(self.digital_pin, GPIO.LOW)
+        time.sleep(0.000028)
+        voMeasured = self.adc.readadc(self.analogue_pin)
+        time.sleep(0.000004)
+        GPIO.output(self.digital_pin, GPIO.HIGH)
+        time.sleep(0.000968)
+        return voMeasured
 
 #d = DustBackend()
+#d.open()
 #d.Run()
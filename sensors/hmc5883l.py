@@ -35,9 +35,11 @@ class hmc5883l(sensor.Sensor):
         elif "direction" in data["measurement"].lower():
             self.sensorname = "hmc5883l-direction"
             self.valname = "Compass-hmc5883l"
+            self.readingtype = "direction"
             self.valunit = "Grad"
             self.valsymbol = "Grad"
         self.description = data["description"]
+        self.bus = "i2c-" + str(int(data["i2cbus"]))
         if hmc5883l.hmcClass == None:
             hmc5883l.hmcClass = hmc5883lBackend.hmc5883l(bus=int(data["i2cbus"]),declination=(int(data["declination_degrees"]),int(data["declination_minutes"])))
         return
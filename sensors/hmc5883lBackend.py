@@ -3,13 +3,14 @@
 
 # HMC5888L Magnetometer (Digital Compass) wrapper class
 # Based on https://bitbucket.org/thinkbowl/i2clibraries/src/14683feb0f96,
-# but uses smbus rather than quick2wire and sets some different init
-# params.
+# but uses smbus (via the shared i2cbus) rather than quick2wire and sets
+# some different init params.
 
-import smbus
 import math
 import time
 import sys
+from sensor import TickCache
+import i2cbus
 
 class hmc5883l:
 
@@ -25,8 +26,10 @@ class hmc5883l:
     }
 
     def __init__(self, bus=1, address=0x1E, gauss=1.3, declination=(0,0)):
-        self.bus = smbus.SMBus(bus)
+        self.device = i2cbus.get_device(bus, address)
         self.address = address
+        # The total/x/y/z/direction sensors share one read of the axes
+        self.cache = TickCache()
 
         (degrees, minutes) = declination
         self.__declDegrees = degrees
@@ -34,32 +37,25 @@ class hmc5883l:
         self.__declination = (degrees + minutes / 60) * math.pi / 180
 
         (reg, self.__scale) = self.__scales[gauss]
-        self.bus.write_byte_data(self.address, 0x00, 0b11110000) # 8 Average, 15 Hz, normal measurement
-#        self.bus.write_byte_data(self.address, 0x00, 0x70) # 8 Average, 15 Hz, normal measurement
-        self.bus.write_byte_data(self.address, 0x01, reg << 5) # Scale
-        self.bus.write_byte_data(self.address, 0x02, 0x00) # Continuous measurement
+        self.device.write8(0x00, 0b11110000) # 8 Average, 15 Hz, normal measurement
+#        self.device.write8(0x00, 0x70) # 8 Average, 15 Hz, normal measurement
+        self.device.write8(0x01, reg << 5) # Scale
+        self.device.write8(0x02, 0x00) # Continuous measurement
 
     def declination(self):
         return (self.__declDegrees, self.__declMinutes)
 
-    def twos_complement(self, val, len):
-        # Convert twos compliment to integer
-        if (val & (1 << len - 1)):
-            val = val - (1<<len)
-        return val
-
-    def __convert(self, data, offset):
-        val = self.twos_complement(data[offset] << 8 | data[offset+1], 16)
+    def __convert(self, val):
         if val == -4096: return None
         return round(val * self.__scale, 4)
 
     def axes(self):
-        data = self.bus.read_i2c_block_data(self.address, 0x00)
-        #print map(hex, data)
-        x = self.__convert(data, 3)
-        y = self.__convert(data, 7)
-        z = self.__convert(data, 5)
-        return (x,y,z)
+        return self.cache.get("axes", self.__readaxes)
+
+    def __readaxes(self):
+        # The data registers (from 0x03) are X, Z, Y; signed 16-bit, MSB first
+        (x, z, y) = self.device.readstruct(0x03, ">hhh")
+        return (self.__convert(x), self.__convert(y), self.__convert(z))
 
     def heading(self):
         (x, y, z) = self.axes()
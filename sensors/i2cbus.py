@@ -0,0 +1,230 @@
+""" Share I2C buses between AirPi sensors.
+
+Every I2C device on the AirPi talks through one I2CBus per bus number,
+rather than each opening its own smbus.SMBus. Transactions on a bus are
+serialised with a lock, so sensors can be read from several threads at
+once without their traffic interleaving. Devices get an I2CDevice
+handle, which can read a block of registers in one transaction and
+decode multi-byte values with struct, and which counts its
+transactions and errors.
+
+"""
+import struct
+import threading
+import smbus
+
+# The most bytes SMBus can read in one block transaction
+MAXBLOCK = 32
+
+class I2CDevice(object):
+    """ A handle on one device on a shared I2C bus.
+
+    Register reads and writes raise IOError if the device doesn't
+    respond. The bus lock is re-entrant, so a sequence of transactions
+    which must not be interleaved with others (e.g. write a command,
+    then read its result) can be wrapped in 'with device.lock:'.
+
+    """
+
+    def __init__(self, bus, address):
+        """Initialise.
+
+        Args:
+            bus: The I2CBus the device is on.
+            address: The device's 7-bit address.
+
+        """
+        self.bus = bus
+        self.address = address
+        self.lock = bus.lock
+        self.transactions = 0
+        self.errors = 0
+
+    def transaction(self, function, *args):
+        """Carry out one SMBus transaction with the bus locked.
+
+        Args:
+            function: The smbus.SMBus method to call.
+            args: Arguments for it, after the device address.
+
+        Returns:
+            object Whatever the method returns.
+
+        """
+        with self.lock:
+            self.transactions += 1
+            try:
+                return function(self.address, *args)
+            except IOError:
+                self.errors += 1
+                raise
+
+    def write8(self, reg, value):
+        """Write a byte to a register."""
+        self.transaction(self.bus.smbus.write_byte_data, reg, value)
+
+    def writelist(self, reg, data):
+        """Write a list of bytes, starting at a register."""
+        self.transaction(self.bus.smbus.write_i2c_block_data, reg, list(data))
+
+    def readu8(self, reg):
+        """Read an unsigned byte from a register."""
+        return self.transaction(self.bus.smbus.read_byte_data, reg)
+
+    def reads8(self, reg):
+        """Read a signed byte from a register."""
+        return self.readstruct(reg, "b")[0]
+
+    def readblock(self, reg, length):
+        """Read consecutive registers in one transaction.
+
+        Args:
+            reg: The first register.
+            length: The number of bytes to read (at most MAXBLOCK).
+
+        Returns:
+            bytearray The bytes read.
+
+        """
+        if length > MAXBLOCK:
+            raise ValueError("Can't read more than " + str(MAXBLOCK)
+                             + " bytes in one I2C transaction")
+        data = self.transaction(self.bus.smbus.read_i2c_block_data, reg,
+                                length)
+        return bytearray(data[:length])
+
+    def readstruct(self, reg, fmt):
+        """Read consecutive registers and decode them.
+
+        Args:
+            reg: The first register.
+            fmt: A struct format (e.g. ">hhh" for three big-endian
+                 signed 16-bit values).
+
+        Returns:
+            tuple The decoded values.
+
+        """
+        data = self.readblock(reg, struct.calcsize(fmt))
+        return struct.unpack(fmt, str(data))
+
+    def readu16(self, reg):
+        """Read an unsigned big-endian 16-bit value."""
+        return self.readstruct(reg, ">H")[0]
+
+    def reads16(self, reg):
+        """Read a signed big-endian 16-bit value."""
+        return self.readstruct(reg, ">h")[0]
+
+    def readu16le(self, reg):
+        """Read an unsigned little-endian 16-bit value."""
+        return self.readstruct(reg, "<H")[0]
+
+    def reads16le(self, reg):
+        """Read a signed little-endian 16-bit value."""
+        return self.readstruct(reg, "<h")[0]
+
+    def stats(self):
+        """Get the transaction counts for the device.
+
+        Returns:
+            dict The number of transactions and errors.
+
+        """
+        return {"transactions": self.transactions, "errors": self.errors}
+
+class I2CBus(object):
+    """ One I2C bus, shared by every device on it.
+
+    Use I2CBus.get() (or get_device()) rather than creating these
+    directly, so that there is only ever one per bus number.
+
+    """
+
+    buses = {}
+    lock = threading.Lock()
+
+    @classmethod
+    def get(cls, busnum):
+        """Get the shared bus for a bus number, opening it if need be.
+
+        Args:
+            busnum: The bus number (e.g. 1 for /dev/i2c-1).
+
+        Returns:
+            I2CBus The bus.
+
+        """
+        with cls.lock:
+            if busnum not in cls.buses:
+                cls.buses[busnum] = cls(busnum)
+            return cls.buses[busnum]
+
+    def __init__(self, busnum):
+        self.busnum = busnum
+        self.smbus = smbus.SMBus(busnum)
+        self.lock = threading.RLock()
+        self.devices = {}
+
+    def device(self, address):
+        """Get the handle for a device on this bus.
+
+        Args:
+            address: The device's 7-bit address.
+
+        Returns:
+            I2CDevice The device.
+
+        """
+        with self.lock:
+            if address not in self.devices:
+                self.devices[address] = I2CDevice(self, address)
+            return self.devices[address]
+
+    def probe(self, address):
+        """Check whether a device responds at an address.
+
+        Reads one byte from the device (as i2cdetect does for addresses
+        where a quick write isn't safe), which none of the supported
+        sensors treat as a command.
+
+        Args:
+            address: The 7-bit address.
+
+        Returns:
+            boolean True if the device acknowledged.
+
+        """
+        with self.lock:
+            try:
+                self.smbus.read_byte(address)
+            except IOError:
+                return False
+            return True
+
+def get_device(busnum, address):
+    """Get the handle for a device on a shared bus.
+
+    Args:
+        busnum: The bus number.
+        address: The device's 7-bit address.
+
+    Returns:
+        I2CDevice The device.
+
+    """
+    return I2CBus.get(busnum).device(address)
+
+def stats():
+    """Get the transaction counts for every device in use.
+
+    Returns:
+        dict The counts (see I2CDevice.stats()) for each device, keyed
+             by e.g. "i2c-1/0x77".
+
+    """
+    counts = {}
+    for busnum, bus in I2CBus.buses.items():
+        for address, device in bus.devices.items():
+            counts["i2c-%d/0x%02X" % (busnum, address)] = device.stats()
+    return counts
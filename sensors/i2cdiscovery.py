@@ -0,0 +1,145 @@
+""" Find which supported I2C sensors are connected.
+
+Each supported I2C sensor module answers at a fixed address, so probing
+those addresses on the buses named in sensors.cfg shows which sensors
+are actually fitted. The result (the 'topology') is cached in a file, so
+that later boots don't need to scan; the cache records the Pi's serial
+number and the buses scanned, and is ignored if either has changed (for
+example when the same SD card image is used on a different board).
+
+"""
+import json
+import os
+import i2cbus
+
+# The address of each sensor module (the 'filename' in sensors.cfg)
+# which can be discovered
+ADDRESSES = {
+    "bmp085": 0x77,
+    "TSL2561": 0x39,
+    "SI1145": 0x60,
+    "hmc5883l": 0x1E
+    }
+
+def board_id():
+    """Get the serial number of the Pi.
+
+    Returns:
+        string The serial number from /proc/cpuinfo, or None if it
+               can't be read.
+
+    """
+    try:
+        with open("/proc/cpuinfo") as cpuinfo:
+            for line in cpuinfo:
+                if line.startswith("Serial"):
+                    return line.split(":", 1)[1].strip()
+    except IOError:
+        pass
+    return None
+
+def scan(buses, addresses=None):
+    """Probe the known addresses on some I2C buses.
+
+    Args:
+        buses: The bus numbers to scan.
+        addresses: The addresses to probe; defaults to those in ADDRESSES.
+
+    Returns:
+        dict The addresses which responded (a sorted list) for each bus
+             number. Buses which can't be opened have an empty list.
+
+    """
+    if addresses is None:
+        addresses = ADDRESSES.values()
+    topology = {}
+    for busnum in buses:
+        try:
+            bus = i2cbus.I2CBus.get(busnum)
+        except (IOError, OSError):
+            topology[busnum] = []
+            continue
+        topology[busnum] = sorted(address for address in set(addresses)
+                                  if bus.probe(address))
+    return topology
+
+def load(path, buses):
+    """Load a cached topology.
+
+    Args:
+        path: The cache file.
+        buses: The bus numbers which need to be covered.
+
+    Returns:
+        dict The topology (as from scan()), or None if there is no
+             usable cache for this board and these buses.
+
+    """
+    try:
+        with open(path) as cachefile:
+            cache = json.load(cachefile)
+        if cache["board"] != board_id():
+            return None
+        topology = dict((int(busnum), addresses)
+                        for busnum, addresses in cache["buses"].items())
+    except (IOError, ValueError, KeyError, TypeError):
+        return None
+    if set(topology) != set(buses):
+        return None
+    return topology
+
+def save(path, topology):
+    """Cache a topology.
+
+    Args:
+        path: The cache file.
+        topology: The topology (as from scan()).
+
+    """
+    cache = {"board": board_id(),
+             "buses": dict((str(busnum), addresses)
+                           for busnum, addresses in topology.items())}
+    with open(path, "w") as cachefile:
+        json.dump(cache, cachefile, indent=2, sort_keys=True)
+
+def discover(buses, cachepath=None, rescan=False):
+    """Get the topology, from the cache if possible.
+
+    Args:
+        buses: The bus numbers to cover.
+        cachepath: The cache file, or None to always scan.
+        rescan: Whether to scan even if there's a usable cache.
+
+    Returns:
+        dict, boolean The topology (as from scan()), and whether it came
+                      from the cache.
+
+    """
+    if cachepath is not None and not rescan:
+        topology = load(cachepath, buses)
+        if topology is not None:
+            return topology, True
+    topology = scan(buses)
+    if cachepath is not None:
+        try:
+            save(cachepath, topology)
+        except IOError:
+            pass
+    return topology, False
+
+def present(topology, filename, busnum):
+    """Check whether a sensor module's device was found.
+
+    Args:
+        topology: The topology (as from discover()).
+        filename: The sensor module (the 'filename' in sensors.cfg).
+        busnum: The bus the sensor is configured on.
+
+    Returns:
+        boolean Whether the device responded, or None if the module
+                can't be discovered (or the bus wasn't scanned).
+
+    """
+    if filename not in ADDRESSES or busnum not in topology:
+        return None
+    return ADDRESSES[filename] in topology[busnum]
@@ -1,27 +1,166 @@
 """ Read data from MCP3008 inputs.
 
 A low-level Class to read data from inputs to the MCP3008
-analogue-to-digital converter (ADC) chip. This communicates using SPI.
+analogue-to-digital converter (ADC) chip. This communicates using SPI,
+either via the kernel's hardware SPI driver (spidev) or by 'bit-banging'
+the SPI protocol over GPIO pins.
 
 """
-import RPi.GPIO as GPIO
+import os
+import threading
+import time
 import sensor
 
+try:
+    import RPi.GPIO as GPIO
+except ImportError:
+    # Not on a Pi; only needed once a GPIO transport is made
+    GPIO = None
+try:
+    import Adafruit_GPIO.GPIO as AdafruitGPIO
+    import Adafruit_GPIO.SPI as SPI
+except ImportError:
+    SPI = None
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Transports
+TRANSPORTS = ["auto", "hardware", "bitbang", "adafruit"]
+# The pins used by the Pi's hardware SPI (SPI0), in BCM numbering
+HARDWAREPINS = {"mosi": 10, "miso": 9, "clk": 11, "cs": [8, 7]}
+
+def requiregpio(purpose):
+    """Check that RPi.GPIO could be imported.
+
+    Args:
+        purpose: What it is needed for, for the error message.
+
+    Raises:
+        ImportError If it couldn't.
+
+    """
+    if GPIO is None:
+        raise ImportError("RPi.GPIO is needed for " + purpose)
+
+class GpioTransport(object):
+    """ Talk to the MCP3008 by bit-banging SPI with RPi.GPIO.
+
+    This works with any four GPIO pins, but costs around 50 GPIO calls
+    per conversion.
+
+    """
+
+    def __init__(self, mosi, miso, clk, cs):
+        self.mosi = mosi
+        self.miso = miso
+        self.clk = clk
+        self.cs = cs
+        requiregpio("the 'bitbang' MCP3008 transport")
+        GPIO.setup(self.mosi, GPIO.OUT)
+        GPIO.setup(self.miso, GPIO.IN)
+        GPIO.setup(self.clk, GPIO.OUT)
+        GPIO.setup(self.cs, GPIO.OUT)
+
+    def convert(self, adcnum):
+        """Convert one channel.
+
+        Args:
+            adcnum: The channel (0 to 7).
+
+        Returns:
+            int The 10-bit result.
+
+        """
+        GPIO.output(self.cs, True)
+
+        GPIO.output(self.clk, False)  # start clock low
+        GPIO.output(self.cs, False)     # bring CS low
+
+        commandout = adcnum
+        commandout |= 0x18  # start bit + single-ended bit
+        commandout <<= 3    # we only need to send 5 bits here
+        for i in range(5):
+            if commandout & 0x80:
+                GPIO.output(self.mosi, True)
+            else:
+                GPIO.output(self.mosi, False)
+            commandout <<= 1
+            GPIO.output(self.clk, True)
+            GPIO.output(self.clk, False)
+
+        adcout = 0
+        # read in one empty bit, one null bit and 10 ADC bits
+        for i in range(11):
+            GPIO.output(self.clk, True)
+            GPIO.output(self.clk, False)
+            adcout <<= 1
+            if GPIO.input(self.miso):
+                adcout |= 0x1
+
+        GPIO.output(self.cs, True)
+        return adcout
+
+    def close(self):
+        """Release the transport (nothing to do for GPIO)."""
+        pass
+
+class SpiTransport(object):
+    """ Talk to the MCP3008 via an Adafruit_GPIO SPI device.
+
+    This is either Adafruit_GPIO.SPI.SpiDev (hardware SPI, which clocks
+    a whole conversion out in one system call) or Adafruit_GPIO.SPI.BitBang.
+
+    """
+
+    def __init__(self, spi):
+        self.spi = spi
+        self.spi.set_mode(0)
+        self.spi.set_bit_order(SPI.MSBFIRST)
+
+    def convert(self, adcnum):
+        """Convert one channel.
+
+        Args:
+            adcnum: The channel (0 to 7).
+
+        Returns:
+            int The 10-bit result.
+
+        """
+        # Start bit, then single-ended bit and channel, then clock out
+        # the 10-bit result
+        result = self.spi.transfer([0x01, (0x08 | adcnum) << 4, 0x00])
+        return ((result[1] & 0x03) << 8) | result[2]
+
+    def close(self):
+        """Release the SPI device."""
+        self.spi.close()
+
 class MCP3008(sensor.Sensor):
     """ Read data from MCP3008 inputs.
 
     A low-level Class to read data from inputs to the MCP3008
     analogue-to-digital converter (ADC) chip. This communicates using SPI.
 
+    Conversions are made through a 'transport': hardware SPI if it is
+    available (and the chip is wired to the hardware SPI pins), or
+    bit-banged SPI otherwise. Sensors which only need one reading per
+    tick should use scan(), which converts all of the channels in use in
+    one burst and shares the results for the rest of the tick.
+
     """
     requiredData = []
-    optionalData = ["mosiPin", "misoPin", "csPin", "clkPin"]
+    optionalData = ["mosiPin", "misoPin", "csPin", "clkPin", "transport",
+                    "spiPort", "spiDevice", "spiSpeed"]
 
     sharedClass = None
 
     def __init__(self, data):
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setwarnings(False)
+        if GPIO is not None:
+            GPIO.setmode(GPIO.BCM)
+            GPIO.setwarnings(False)
         # Default pins
         self.SPIMOSI = 23
         self.SPIMISO = 24
@@ -29,20 +168,107 @@ class MCP3008(sensor.Sensor):
         self.SPICS = 25
         # Optional custom pins
         if "mosiPin" in data:
-            self.SPIMOSI = data["mosiPin"]
+            self.SPIMOSI = int(data["mosiPin"])
         if "misoPin" in data:
-            self.SPIMISO = data["misoPin"]
+            self.SPIMISO = int(data["misoPin"])
         if "clkPin" in data:
-            self.SPICLK = data["clkPin"]
+            self.SPICLK = int(data["clkPin"])
         if "csPin" in data:
-            self.SPICS = data["csPin"]
-        GPIO.setup(self.SPIMOSI, GPIO.OUT)
-        GPIO.setup(self.SPIMISO, GPIO.IN)
-        GPIO.setup(self.SPICLK, GPIO.OUT)
-        GPIO.setup(self.SPICS, GPIO.OUT)
+            self.SPICS = int(data["csPin"])
+        self.spiport = 0
+        if "spiPort" in data:
+            self.spiport = int(data["spiPort"])
+        self.spidevice = 0
+        if "spiDevice" in data:
+            self.spidevice = int(data["spiDevice"])
+        self.spispeed = 1000000
+        if "spiSpeed" in data:
+            self.spispeed = int(data["spiSpeed"])
+        transport = "auto"
+        if "transport" in data:
+            transport = data["transport"].lower()
+        if transport not in TRANSPORTS:
+            raise ValueError("Unknown MCP3008 transport '" + transport + "'")
+        self.transport = self.make_transport(transport)
+        # The channels which are in use, and so included in scan()
+        self.channels = set()
+        self.lock = threading.Lock()
+        self.cache = sensor.TickCache()
         if MCP3008.sharedClass == None:
             MCP3008.sharedClass = self
 
+    @classmethod
+    def getshared(cls):
+        """Get the MCP3008 shared by all analogue sensors.
+
+        If there is no [MCP3008] section in sensors.cfg, one is created
+        with the default settings.
+
+        Returns:
+            MCP3008 The shared ADC.
+
+        """
+        if cls.sharedClass is None:
+            cls({})
+        return cls.sharedClass
+
+    def hashardwarespi(self):
+        """Check whether hardware SPI can be used.
+
+        Hardware SPI can only be used if the spidev driver is loaded and
+        the chip is wired to the Pi's hardware SPI pins.
+
+        Returns:
+            boolean True if hardware SPI can be used.
+
+        """
+        if SPI is None:
+            return False
+        device = "/dev/spidev" + str(self.spiport) + "." + str(self.spidevice)
+        return (os.path.exists(device) and
+                self.SPIMOSI == HARDWAREPINS["mosi"] and
+                self.SPIMISO == HARDWAREPINS["miso"] and
+                self.SPICLK == HARDWAREPINS["clk"] and
+                self.SPICS in HARDWAREPINS["cs"])
+
+    def make_transport(self, transport):
+        """Create the transport used to talk to the chip.
+
+        Args:
+            transport: One of TRANSPORTS. 'auto' uses hardware SPI if
+                       it can, and bit-banging if not.
+
+        Returns:
+            object The transport.
+
+        """
+        if transport == "auto":
+            transport = "bitbang"
+            if self.hashardwarespi():
+                transport = "hardware"
+        if transport in ["hardware", "adafruit"] and SPI is None:
+            raise ImportError("Adafruit_GPIO is needed for the '" + transport
+                              + "' MCP3008 transport")
+        if transport == "hardware":
+            return SpiTransport(SPI.SpiDev(self.spiport, self.spidevice,
+                                           max_speed_hz=self.spispeed))
+        if transport == "adafruit":
+            requiregpio("the 'adafruit' MCP3008 transport")
+            gpio = AdafruitGPIO.RPiGPIOAdapter(GPIO)
+            return SpiTransport(SPI.BitBang(gpio, self.SPICLK, self.SPIMOSI,
+                                            self.SPIMISO, self.SPICS))
+        return GpioTransport(self.SPIMOSI, self.SPIMISO, self.SPICLK,
+                             self.SPICS)
+
+    def register(self, adcnum):
+        """Register a channel as being in use, so it is included in scan().
+
+        Args:
+            adcnum: The channel (0 to 7).
+
+        """
+        self.channels.add(adcnum)
+
     def readadc(self, adcnum):
         """ Read SPI data from MCP3008.
 
@@ -51,31 +277,93 @@ class MCP3008(sensor.Sensor):
         if (adcnum > 7) or (adcnum < 0):
             # Invalid pin number
             return -1
-        GPIO.output(self.SPICS, True)
+        with self.lock:
+            return self.transport.convert(adcnum)
 
-        GPIO.output(self.SPICLK, False)  # start clock low
-        GPIO.output(self.SPICS, False)     # bring CS low
+    def readburst(self, adcnum, count):
+        """Convert one channel several times, as fast as possible.
 
-        commandout = adcnum
-        commandout |= 0x18  # start bit + single-ended bit
-        commandout <<= 3    # we only need to send 5 bits here
-        for i in range(5):
-            if commandout & 0x80:
-                GPIO.output(self.SPIMOSI, True)
+        The ADC is locked for the whole burst, so the conversions are
+        evenly spaced.
+
+        Args:
+            adcnum: The channel (0 to 7).
+            count: The number of conversions.
+
+        Returns:
+            array The 10-bit results; a NumPy array if NumPy is
+                  installed, otherwise a list.
+
+        """
+        if numpy is not None:
+            results = numpy.empty(count, dtype=numpy.uint16)
+        else:
+            results = [0] * count
+        with self.lock:
+            convert = self.transport.convert
+            for i in xrange(count):
+                results[i] = convert(adcnum)
+        return results
+
+    def capture(self, adcnum, count, chunk=None, out=None):
+        """Capture one channel at the highest rate the ADC allows.
+
+        The conversions are made in chunks, and the ADC is only locked
+        for one chunk at a time, so that other sensors can use it in
+        between; each chunk's start and end times are recorded, so the
+        time of every sample is known even if there are gaps between
+        chunks.
+
+        Args:
+            adcnum: The channel (0 to 7).
+            count: The number of conversions.
+            chunk: The most conversions per chunk; None for one chunk.
+            out: A preallocated array (or list) of at least 'count'
+                 elements to store the results in.
+
+        Returns:
+            array, list The 10-bit results (in 'out', if given), and the
+                        times (seconds since the epoch) each chunk
+                        started and finished, as (start, end) tuples.
+
+        """
+        if out is None:
+            if numpy is not None:
+                out = numpy.empty(count, dtype=numpy.uint16)
             else:
-                GPIO.output(self.SPIMOSI, False)
-            commandout <<= 1
-            GPIO.output(self.SPICLK, True)
-            GPIO.output(self.SPICLK, False)
+                out = [0] * count
+        chunk = chunk or count
+        times = []
+        convert = self.transport.convert
+        for first in xrange(0, count, chunk):
+            with self.lock:
+                start = time.time()
+                for i in xrange(first, min(first + chunk, count)):
+                    out[i] = convert(adcnum)
+                times.append((start, time.time()))
+        return out, times
 
-        adcout = 0
-        # read in one empty bit, one null bit and 10 ADC bits
-        for i in range(11):
-            GPIO.output(self.SPICLK, True)
-            GPIO.output(self.SPICLK, False)
-            adcout <<= 1
-            if GPIO.input(self.SPIMISO):
-                adcout |= 0x1
+    def scan(self):
+        """Read all of the channels in use, once per tick.
 
-        GPIO.output(self.SPICS, True)
-        return adcout
+        The channels registered with register() (or all 8, if none have
+        been) are converted back-to-back, and the results are shared by
+        everything which calls scan() during the same tick.
+
+        Returns:
+            dict The 10-bit result for each channel.
+
+        """
+        return self.cache.get("scan", self.readall)
+
+    def readall(self):
+        """Convert all of the channels in use, one after the other.
+
+        Returns:
+            dict The 10-bit result for each channel.
+
+        """
+        channels = sorted(self.channels) or range(8)
+        with self.lock:
+            return dict((adcnum, self.transport.convert(adcnum))
+                        for adcnum in channels)
@@ -1,45 +1,280 @@
 """
-Generic class to support analogue sensors.
+Measure noise levels with a microphone.
 
-The MCP3008 ADC is used by this class, and output can be in
-either Ohms or millivolts depending on the exact sensor in question.
+The microphone's output is read via the MCP3008 ADC. A MicrophoneSampler
+thread reads it at a fixed rate into a ring buffer, all through each
+sample interval. When the sensor is read, the samples since the last
+reading are split into short frames, and the level of each frame is
+worked out from its RMS. This gives:
+- Leq: the equivalent continuous level (the level of the mean power).
+- Lmax: the level of the loudest frame.
+- L10 and L90: the levels exceeded for 10% and 90% of the interval
+  (i.e. the noisy peaks and the background).
+Levels are in dB relative to a full-scale signal, plus 'dboffset' (so
+that they can be calibrated to dB SPL against a sound level meter).
+
+The sample rate is far below audio frequencies, but the RMS of samples
+taken at unrelated times through a sound is the same as the RMS of the
+whole waveform, so the levels are still fair; the rate only needs to
+give plenty of samples per frame.
+
+Optionally, the sampler also reads a short burst as fast as the ADC
+allows every few seconds, and passes it to a SpectrumAnalyser (see
+spectrum.py) for A- and C-weighted and octave band levels.
+
+The sampler needs NumPy. Without it (or with a sample rate of 0),
+Fetch() gives the peak-to-peak amplitude over 100ms instead.
 
 """
-import RPi.GPIO as GPIO
-import mcp3008
-import sensor
+import math
+import threading
 import time
-import operator
+import mcp3008
+from scheduler import monotonic
+
+try:
+    import numpy
+    import spectrum
+except ImportError:
+    numpy = None
+
+# The amplitude (ADC counts) of a full-scale signal
+FULLSCALE = 512.0
+# The mean square of the ADC's quantisation noise; the quietest level
+# which can be measured
+NOISEFLOOR = 1 / 12.0
+
+class MicrophoneSampler(threading.Thread):
+    """ Read the microphone at a fixed rate into a ring buffer.
+
+    """
+
+    def __init__(self, adc, adcpin, samplerate, history=600, analyser=None,
+                 burstsize=1024, burstinterval=10):
+        """Initialise.
+
+        Args:
+            adc: The MCP3008 to read from.
+            adcpin: The ADC channel the microphone is connected to.
+            samplerate: How many times per second to read the channel.
+            history: How long (seconds) the buffer holds. If the sensor
+                     isn't read for longer than this, the oldest samples
+                     are lost.
+            analyser: The SpectrumAnalyser to feed bursts to, or None
+                      for no bursts.
+            burstsize: The number of samples in each burst.
+            burstinterval: How often (seconds) to read a burst.
+
+        """
+        threading.Thread.__init__(self, name="microphone")
+        self.daemon = True
+        self.adc = adc
+        self.adcpin = adcpin
+        self.samplerate = samplerate
+        self.buffer = numpy.zeros(int(samplerate * history), dtype=numpy.uint16)
+        self.lock = threading.Lock()
+        # Samples written in total, and up to the last take()
+        self.written = 0
+        self.taken = 0
+        # Samples which were missed because a read was late, since the
+        # last take()
+        self.missed = 0
+        self.analyser = analyser
+        self.burstsize = burstsize
+        self.burstinterval = burstinterval
+        # Set by stop(); an Event, so that stopping before the thread
+        # has started still stops it
+        self.stopping = threading.Event()
+
+    def burst(self):
+        """Read a burst as fast as possible, and analyse its spectrum."""
+        start = monotonic()
+        samples = self.adc.readburst(self.adcpin, self.burstsize)
+        elapsed = monotonic() - start
+        if elapsed > 0:
+            self.analyser.feed(samples, self.burstsize / elapsed)
+
+    def run(self):
+        """Read the channel until stopped."""
+        period = 1.0 / self.samplerate
+        size = len(self.buffer)
+        due = monotonic()
+        nextburst = due
+        while not self.stopping.isSet():
+            if self.analyser is not None and due >= nextburst:
+                self.burst()
+                nextburst += self.burstinterval
+                # The burst stands in for the samples it held up
+                due = max(due, monotonic() - period)
+            value = self.adc.readadc(self.adcpin)
+            with self.lock:
+                self.buffer[self.written % size] = value
+                self.written += 1
+            due += period
+            delay = due - monotonic()
+            if delay > 0:
+                self.stopping.wait(delay)
+            elif delay < -period:
+                # Held up (e.g. by another sensor using the ADC); don't
+                # try to catch up, as the samples would be bunched
+                behind = int(-delay / period)
+                with self.lock:
+                    self.missed += behind
+                due += behind * period
+
+    def take(self):
+        """Take the samples since the last take().
+
+        Returns:
+            array, int, int The samples, oldest first, how many were lost
+                            because the buffer filled up, and how many
+                            were missed because a read was late.
+
+        """
+        size = len(self.buffer)
+        with self.lock:
+            lost = max(self.written - self.taken - size, 0)
+            start = self.taken + lost
+            indices = numpy.arange(start, self.written) % size
+            samples = self.buffer[indices]
+            self.taken = self.written
+            missed, self.missed = self.missed, 0
+        return samples, lost, missed
+
+    def stop(self):
+        """Stop reading."""
+        self.stopping.set()
 
 class Microphone:
 
-    def __init__(self, adcpin):
-	self.adc = mcp3008.MCP3008.sharedClass
-	self.analogue_pin = adcpin
+    def __init__(self, adcpin, adc = None, samplerate = 0, frame = 1.0,
+                 dboffset = 0.0, fftsize = 0, burstsize = 1024,
+                 burstinterval = 10, sensorvoltage = 3.3):
+        """Initialise.
 
-    def Run(self):
-	while 1 == 1:
-	    print(self.Fetch())
-	    time.sleep(0.1)
+        No hardware is touched until open() is called.
 
-    def Fetch(self):
+        Args:
+            adcpin: The ADC channel the microphone is connected to.
+            adc: The MCP3008 to read from; defaults to the shared one.
+            samplerate: How many times per second to read the microphone
+                        in the background; 0 means only read it in
+                        Fetch().
+            frame: The length (seconds) of the frames levels are
+                   worked out for.
+            dboffset: Added to every level (dB), to calibrate it.
+            fftsize: The FFT size for spectral analysis of bursts; 0
+                     means no spectral analysis.
+            burstsize: The number of samples in each burst.
+            burstinterval: How often (seconds) to read a burst.
+            sensorvoltage: The ADC's reference voltage (V), for the RMS
+                           in mV.
+
+        """
+        self.adc = adc
+        self.analogue_pin = adcpin
+        self.samplerate = samplerate
+        self.frame = frame
+        self.dboffset = dboffset
+        self.fftsize = fftsize
+        self.burstsize = burstsize
+        self.burstinterval = burstinterval
+        self.sensorvoltage = sensorvoltage
+        self.sampler = None
+        self.analyser = None
+
+    def open(self):
+        """Find the ADC if not given one, and start the sampler."""
+        if self.adc is None:
+            self.adc = mcp3008.MCP3008.getshared()
+        if self.samplerate and numpy is not None:
+            if self.fftsize:
+                self.analyser = spectrum.SpectrumAnalyser(self.fftsize,
+                                                          FULLSCALE,
+                                                          self.dboffset)
+            self.sampler = MicrophoneSampler(self.adc, self.analogue_pin,
+                                             self.samplerate,
+                                             analyser=self.analyser,
+                                             burstsize=self.burstsize,
+                                             burstinterval=self.burstinterval)
+            self.sampler.start()
+
+    def close(self):
+        """Stop the sampler, if there is one."""
+        if self.sampler is not None:
+            self.sampler.stop()
+            self.sampler.join(1)
+
+    def sampling(self):
+        """Check whether the microphone is read in the background.
 
-	signalMin = 1024
-	signalMax = 0
-	start = time.time()
+        Returns:
+            boolean True if collect() can be used.
 
-	while ((time.time() - start) * 1000) < 100:
-	    reading = self.adc.readadc(self.analogue_pin)
+        """
+        return self.sampler is not None
+
+    def level(self, meansquare):
+        """Convert a mean square (ADC counts squared) to a level (dB)."""
+        meansquare = max(meansquare, NOISEFLOOR)
+        return (10 * math.log10(meansquare / FULLSCALE ** 2) +
+                self.dboffset)
+
+    def collect(self):
+        """Work out the noise levels since the last collect().
+
+        Returns:
+            float, dict The equivalent continuous level (Leq, dB), and
+                        'rms' (mV), 'lmax', 'l10' and 'l90' (dB), plus
+                        the number of 'samples' used and of those which
+                        were 'clipped', 'missed' or 'lost'. If spectral
+                        analysis is on, also the levels from
+                        SpectrumAnalyser.result(). The level is None if
+                        there weren't enough samples for a frame.
+
+        """
+        samples, lost, missed = self.sampler.take()
+        framesize = max(int(self.frame * self.samplerate), 1)
+        count = len(samples) // framesize * framesize
+        extras = {"samples": count, "lost": lost, "missed": missed,
+                  "clipped": int(((samples == 0) | (samples == 1023)).sum())}
+        if self.analyser is not None:
+            extras.update(self.analyser.result() or {})
+        if not count:
+            return None, extras
+        signal = samples[-count:].astype(numpy.float64)
+        # Remove the microphone's bias, leaving the sound
+        signal -= signal.mean()
+        meansquares = (signal.reshape(-1, framesize) ** 2).mean(axis=1)
+        levels = (10 * numpy.log10(numpy.maximum(meansquares, NOISEFLOOR) /
+                                   FULLSCALE ** 2) + self.dboffset)
+        power = meansquares.mean()
+        extras["rms"] = math.sqrt(power) / 1023 * self.sensorvoltage * 1000
+        extras["lmax"] = float(levels.max())
+        extras["l10"] = float(numpy.percentile(levels, 90))
+        extras["l90"] = float(numpy.percentile(levels, 10))
+        return self.level(power), extras
+
+    def Run(self):
+        while 1 == 1:
+            print(self.Fetch())
+            time.sleep(0.1)
+
+    def Fetch(self):
 
-	    if reading >= 1023:
-		continue
+        signalMin = 1024
+        signalMax = 0
+        start = time.time()
 
-	    if signalMin > reading:
-	        signalMin = reading
-	    if signalMax < reading:
-	        signalMax = reading
+        while ((time.time() - start) * 1000) < 100:
+            reading = self.adc.readadc(self.analogue_pin)
 
-	return (signalMax - signalMin)
+            if reading >= 1023:
+                continue
 
-v = mcp3008.MCP3008({})
+            if signalMin > reading:
+                signalMin = reading
+            if signalMax < reading:
+                signalMax = reading
 
+        return (signalMax - signalMin)
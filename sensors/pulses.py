@@ -0,0 +1,144 @@
+""" Record pulses from switch-type sensors.
+
+The raingauge and anemometer each close a switch once per bucket tip or
+rotation, which raises a GPIO interrupt. The interrupt callback runs in
+RPi.GPIO's own thread, so it should do as little as possible: a
+PulseRecorder just increments an integer and appends a timestamp under
+a lock. The count is taken (and reset) atomically when the sensor is
+read, and rates are worked out from the timestamps on demand.
+
+"""
+import collections
+import threading
+from scheduler import monotonic
+
+class PulseRecorder(object):
+    """ Count pulses, and keep a ring buffer of when they happened.
+
+    """
+
+    def __init__(self, history=600, maxpulses=16384):
+        """Initialise.
+
+        Args:
+            history: How long (seconds) to keep pulse timestamps for.
+            maxpulses: The most timestamps to keep, however recent.
+
+        """
+        self.history = history
+        self.lock = threading.Lock()
+        self.count = 0
+        self.total = 0
+        self.times = collections.deque(maxlen=maxpulses)
+        self.started = monotonic()
+        self.lastswap = self.started
+
+    def pulse(self, channel=None):
+        """Record a pulse; use as a GPIO event callback.
+
+        Args:
+            channel: The GPIO channel (passed by RPi.GPIO, but not used).
+
+        """
+        now = monotonic()
+        with self.lock:
+            self.count += 1
+            self.times.append(now)
+
+    def swap(self):
+        """Take the count since the last swap, and reset it.
+
+        Returns:
+            int, float, float The count, and the monotonic times the
+                              period it covers started and ended.
+
+        """
+        now = monotonic()
+        with self.lock:
+            count = self.count
+            self.count = 0
+            self.total += count
+            started = self.lastswap
+            self.lastswap = now
+            # Forget timestamps we no longer need
+            while self.times and self.times[0] < now - self.history:
+                self.times.popleft()
+        return count, started, now
+
+    def between(self, start, end):
+        """Get the timestamps of the pulses in a period.
+
+        Args:
+            start: Monotonic time at the start of the period.
+            end: Monotonic time at the end of the period.
+
+        Returns:
+            list The timestamps, oldest first.
+
+        """
+        with self.lock:
+            times = list(self.times)
+        return [t for t in times if start <= t <= end]
+
+    def rate(self, window, end=None):
+        """Get the mean pulse rate over a window.
+
+        If the recorder hasn't been running for the whole window, the
+        rate is over the time it has been running.
+
+        Args:
+            window: The length of the window (seconds).
+            end: Monotonic time at the end of the window; defaults to now.
+
+        Returns:
+            float Pulses per second.
+
+        """
+        if end is None:
+            end = monotonic()
+        start = max(end - window, self.started)
+        if end <= start:
+            return 0.0
+        return len(self.between(start, end)) / (end - start)
+
+    def maxrate(self, window, start, end):
+        """Get the highest pulse rate over any window within a period.
+
+        For example, a wind gust is the highest rate over any 3 seconds.
+
+        Args:
+            window: The length of the sliding window (seconds).
+            start: Monotonic time at the start of the period.
+            end: Monotonic time at the end of the period.
+
+        Returns:
+            float Pulses per second.
+
+        """
+        times = self.between(start, end)
+        most = 0
+        first = 0
+        for last in range(len(times)):
+            while times[last] - times[first] >= window:
+                first += 1
+            most = max(most, last - first + 1)
+        return most / float(window)
+
+    def intervals(self, start, end):
+        """Get statistics for the intervals between pulses in a period.
+
+        Args:
+            start: Monotonic time at the start of the period.
+            end: Monotonic time at the end of the period.
+
+        Returns:
+            dict The minimum, mean and maximum interval (seconds); all
+                 None if there were fewer than two pulses.
+
+        """
+        times = self.between(start, end)
+        gaps = [b - a for a, b in zip(times, times[1:])]
+        if not gaps:
+            return {"min": None, "mean": None, "max": None}
+        return {"min": min(gaps), "mean": sum(gaps) / len(gaps),
+                "max": max(gaps)}
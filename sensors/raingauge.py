@@ -1,7 +1,8 @@
 """ Work with a raingauge.
 
 Work with a (Maplin) raingauge, i.e. read data and record bucket tips.
-The gauge is connected directly to a GPIO pin (and ground).
+The gauge is connected directly to a GPIO pin (and ground). Tips are
+recorded by a PulseRecorder, so the rainfall rate can be worked out too.
 
 Originally written by Fred Sonnenwald <f.sonnenwald@sheffield.ac.uk>
 https://pi.gate.ac.uk/posts/2014/04/21/airpisoftware/
@@ -11,6 +12,7 @@ http://www.maplin.co.uk/p/maplin-replacement-rain-gauge-for-n25frn96fyn96gy-n77n
 """
 import RPi.GPIO as GPIO
 import sensor
+import pulses
 
 class Raingauge(sensor.Sensor):
     """ Work with a raingauge.
@@ -25,12 +27,15 @@ class Raingauge(sensor.Sensor):
 
     """
     requiredData = ["pinnumber"]
-    optionalData = ["description"]
+    optionalData = ["description", "mmpertip", "ratewindow"]
 
     def __init__(self, data):
         """Initialise.
 
         Initialise the raingauge sensor Class using parameters passed in 'data'.
+        data["mmpertip"] is the rainfall (mm) per bucket tip (default
+        0.2794), and data["ratewindow"] is the time (seconds) the rainfall
+        rate is averaged over (default 600).
 
         Args:
             self: self.
@@ -42,9 +47,16 @@ class Raingauge(sensor.Sensor):
         GPIO.setmode(GPIO.BCM)
         GPIO.setwarnings(False)
         self.pinnum = int(data["pinnumber"])
+        self.mmpertip = 0.2794
+        if "mmpertip" in data:
+            self.mmpertip = float(data["mmpertip"])
+        self.ratewindow = 600
+        if "ratewindow" in data:
+            self.ratewindow = float(data["ratewindow"])
+        self.recorder = pulses.PulseRecorder(history=max(self.ratewindow, 3600))
+        self.period = None
         GPIO.setup(self.pinnum, GPIO.IN, pull_up_down=GPIO.PUD_UP)
         GPIO.add_event_detect(self.pinnum, GPIO.FALLING, callback=self.buckettip, bouncetime=300)
-        self.rain = 0.0000001
         self.sensorname = "Raingauge"
         self.readingtype = "pulseCount"
         self.valname = "Bucket_tips"
@@ -67,13 +79,31 @@ class Raingauge(sensor.Sensor):
             self: self.
 
         Returns:
-            float The current value for the sensor.
+            int The current value for the sensor.
 
         """
+        tips, start, end = self.recorder.swap()
+        self.period = (tips, start, end)
+        return tips
 
-        rain = self.rain
-        self.rain = 0.0000001
-        return rain
+    def getextras(self):
+        """Get the rainfall and rainfall rate.
+
+        Returns:
+            dict 'rainfall' (mm since the last reading) and 'rainrate'
+                 (mm/h over the last 'ratewindow' seconds).
+
+        """
+        if self.period is None:
+            return None
+        tips, start, end = self.period
+        rate = self.recorder.rate(self.ratewindow, end)
+        return {"rainfall": tips * self.mmpertip,
+                "rainrate": rate * 3600 * self.mmpertip}
+
+    def close(self):
+        """Stop listening for bucket tips."""
+        GPIO.remove_event_detect(self.pinnum)
 
     def buckettip(self, channel):
         """Record a bucket tip.
@@ -82,7 +112,7 @@ class Raingauge(sensor.Sensor):
         function, for reasons which aren't particularly clear in the docs:
         http://raspi.tv/2013/how-to-use-interrupts-with-python-on-the-raspberry-pi-and-rpi-gpio-part-3#comment-18986
         http://sourceforge.net/p/raspberry-gpio-python/wiki/Inputs/
+        This runs in RPi.GPIO's callback thread, so must be quick.
 
         """
-        self.rain += 1.0
-        print("rain",self.rain,self.pinnum)
+        self.recorder.pulse()
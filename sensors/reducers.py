@@ -0,0 +1,159 @@
+""" Reduce a set of raw ADC readings to a single value.
+
+Analogue sensors (particularly the gas sensors) are noisy, so several
+raw readings are often taken and combined. The readings are held in a
+NumPy array if NumPy is installed, so that each reducer is a handful of
+vectorised operations; otherwise plain Python is used. Readings at the
+extremes of the ADC's range (0 and 1023) indicate a wiring problem
+rather than a measurement, so they are left out.
+
+Reducers:
+- mean (or avg): the arithmetic mean.
+- median: the middle reading; robust to occasional spikes.
+- trimmed: the mean after discarding a fraction of the highest and
+  lowest readings.
+- most: the most common reading (the mode).
+- max: the highest reading.
+- hampel: the mean after discarding outliers: readings more than
+  HAMPEL scaled median absolute deviations from the median. The scale
+  is at least MINMAD, so that a steady signal (where more than half of
+  the readings are the same, and the MAD is 0) doesn't lose every
+  reading which is one ADC step away from the median.
+- decimate: oversample and decimate. Sum 4^n readings and shift right
+  by n bits, which gives n extra bits of resolution provided there is
+  some noise on the signal. The result is scaled back to the 0-1023
+  range, so has a fractional part.
+
+"""
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+REDUCERS = ["mean", "avg", "median", "trimmed", "most", "max", "decimate",
+            "hampel"]
+
+# How many (scaled) median absolute deviations from the median a reading
+# can be before 'hampel' discards it
+HAMPEL = 3.0
+# Scales the median absolute deviation to match the standard deviation
+# of normally-distributed readings
+MADSCALE = 1.4826
+# The smallest scaled median absolute deviation 'hampel' uses: one ADC
+# step
+MINMAD = 1.0
+
+# The ADC readings which indicate a wiring fault
+RAILS = (0, 1023)
+
+def valid_readings(readings):
+    """Remove readings at the extremes of the ADC's range.
+
+    Args:
+        readings: Sequence (or NumPy array) of raw readings.
+
+    Returns:
+        array/list The valid readings.
+
+    """
+    if numpy is not None:
+        readings = numpy.asarray(readings)
+        return readings[(readings != RAILS[0]) & (readings != RAILS[1])]
+    return [r for r in readings if r not in RAILS]
+
+def reduce_readings(readings, reducer="mean", trim=0.1):
+    """Reduce a set of raw readings to one value.
+
+    Args:
+        readings: Sequence (or NumPy array) of raw readings.
+        reducer: One of REDUCERS.
+        trim: For 'trimmed', the fraction of readings to discard from
+              each end.
+
+    Returns:
+        float, float, int The value, the standard deviation of the
+                          readings used, and the number of readings used.
+                          The value and spread are None if there were no
+                          valid readings.
+
+    """
+    if reducer not in REDUCERS:
+        raise ValueError("Unknown reducer '" + str(reducer) + "'")
+    readings = valid_readings(readings)
+    if not len(readings):
+        return None, None, 0
+    if numpy is not None:
+        return reduce_array(readings, reducer, trim)
+    return reduce_list(readings, reducer, trim)
+
+def reduce_array(readings, reducer, trim):
+    """Reduce a NumPy array of valid readings; see reduce_readings()."""
+    readings = readings.astype(numpy.float64)
+    if reducer == "trimmed":
+        cut = int(len(readings) * trim)
+        if cut and len(readings) > 2 * cut:
+            readings = numpy.sort(readings)[cut:len(readings) - cut]
+    elif reducer == "decimate":
+        bits = int(math.log(len(readings), 4))
+        readings = readings[:4 ** bits]
+    elif reducer == "hampel":
+        median = numpy.median(readings)
+        mad = max(MADSCALE * numpy.median(numpy.abs(readings - median)),
+                  MINMAD)
+        readings = readings[numpy.abs(readings - median) <= HAMPEL * mad]
+    spread = float(readings.std())
+    if reducer in ["mean", "avg", "trimmed", "hampel"]:
+        value = readings.mean()
+    elif reducer == "median":
+        value = numpy.median(readings)
+    elif reducer == "most":
+        # numpy.unique() rather than bincount(), since the readings may
+        # already have been converted (e.g. to wind directions)
+        values, counts = numpy.unique(readings, return_counts=True)
+        value = values[counts.argmax()]
+    elif reducer == "max":
+        value = readings.max()
+    else:
+        value = (int(readings.sum()) >> bits) / float(2 ** bits)
+    return float(value), spread, len(readings)
+
+def reduce_list(readings, reducer, trim):
+    """Reduce a list of valid readings; see reduce_readings()."""
+    readings = [float(r) for r in readings]
+    if reducer == "trimmed":
+        cut = int(len(readings) * trim)
+        if cut and len(readings) > 2 * cut:
+            readings = sorted(readings)[cut:len(readings) - cut]
+    elif reducer == "decimate":
+        bits = int(math.log(len(readings), 4))
+        readings = readings[:4 ** bits]
+    elif reducer == "hampel":
+        median = median_list(readings)
+        mad = max(MADSCALE * median_list([abs(r - median) for r in readings]),
+                  MINMAD)
+        readings = [r for r in readings if abs(r - median) <= HAMPEL * mad]
+    count = len(readings)
+    mean = sum(readings) / count
+    spread = math.sqrt(sum((r - mean) ** 2 for r in readings) / count)
+    if reducer in ["mean", "avg", "trimmed", "hampel"]:
+        value = mean
+    elif reducer == "median":
+        value = median_list(readings)
+    elif reducer == "most":
+        # Ties go to the lowest reading, as in reduce_array()
+        value = max(sorted(set(readings)), key=readings.count)
+    elif reducer == "max":
+        value = max(readings)
+    else:
+        value = (int(sum(readings)) >> bits) / float(2 ** bits)
+    return value, spread, count
+
+def median_list(readings):
+    """Find the median of a (non-empty) list of readings."""
+    ordered = sorted(readings)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2
@@ -7,6 +7,88 @@ so there are not too many common properties/functions contained here.
 
 """
 from abc import ABCMeta, abstractmethod
+import collections
+import threading
+import time
+from scheduler import monotonic
+
+# A value acquired in the background, and when its acquisition started
+# (seconds since the epoch)
+Acquired = collections.namedtuple("Acquired", ["value", "timestamp"])
+
+class TickCache(object):
+    """Cache backend reads for the duration of one tick.
+
+    Some chips provide several measurements (e.g. the BMP085 provides
+    temperature and pressure), and each measurement is a separate
+    sensor. A backend can use a TickCache so that the chip is only read
+    once per tick, with all of the measurements served from that one
+    read. The tick is advanced (by the main AirPi script) at the start
+    of every pass over the sensors; until the first tick, nothing is
+    cached.
+
+    """
+
+    # The current tick; None until sampling starts
+    tick = None
+    # The scheduled (wall-clock) time of the current tick, if known
+    ticktime = None
+
+    @classmethod
+    def advance(cls, ticktime=None):
+        """Start a new tick, so that all cached reads expire.
+
+        Args:
+            ticktime: The scheduled time of the tick (seconds since the
+                      epoch), for sensors which need to know when the
+                      sample is for.
+
+        """
+        if cls.tick is None:
+            cls.tick = 0
+        else:
+            cls.tick += 1
+        cls.ticktime = ticktime
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def has(self, key):
+        """Check whether a value has already been read this tick.
+
+        Args:
+            key: What is being read (e.g. "rawtemp").
+
+        Returns:
+            boolean True if the value is cached for this tick.
+
+        """
+        with self.lock:
+            tick = TickCache.tick
+            return (tick is not None and key in self.values and
+                    self.values[key][0] == tick)
+
+    def get(self, key, read):
+        """Get a value, reading it if it hasn't been read this tick.
+
+        Args:
+            key: What is being read (e.g. "rawtemp").
+            read: Function to call to read the value.
+
+        Returns:
+            object The value.
+
+        """
+        with self.lock:
+            tick = TickCache.tick
+            if tick is not None and key in self.values:
+                readtick, value = self.values[key]
+                if readtick == tick:
+                    return value
+            value = read()
+            self.values[key] = (tick, value)
+            return value
 
 class Sensor(object):
     """Generic Sensor plugin description (abstract) for sub-classing.
@@ -21,6 +103,28 @@ class Sensor(object):
 
     __metaclass__ = ABCMeta
 
+    # The bus this sensor is read over (e.g. "i2c-1"). Sensors on the same
+    # bus are never read at the same time; None means the sensor doesn't
+    # share a bus with anything. Can be overridden with 'bus' in sensors.cfg.
+    bus = None
+    # How long (seconds) to wait for a reading before marking it as
+    # missing; None means use the default. Set with 'deadline' in
+    # sensors.cfg.
+    deadline = None
+    # How often (seconds) to read this sensor; None means every sample.
+    # Set with 'sampleinterval' in sensors.cfg.
+    sampleinterval = None
+    # The shortest interval (seconds) at which this sensor can be read.
+    mininterval = 0
+    # The sensor's section in sensors.cfg (set when it is loaded).
+    section = None
+    # When the value last returned by getval() was measured (seconds
+    # since the epoch); None means when getval() was called.
+    valuetime = None
+    # Whether the value last returned by getval() is older than it
+    # should be (see AsyncSensor).
+    stale = False
+
     @abstractmethod
     def __init__(self, data):
         """Error if sub-class doesn't init itself.
@@ -34,6 +138,68 @@ class Sensor(object):
         """
         pass
 
+    def start(self):
+        """Start a measurement, ready to be read by getval().
+
+        Called for every sensor in a bus group before any of them is
+        read, so sensors which take a while to convert (e.g. the
+        TSL2561's integration time) can be converting while the others
+        on the bus are read. Must not wait for the measurement.
+
+        """
+        pass
+
+    def ready(self):
+        """Check whether the measurement started by start() is ready.
+
+        Members of a bus group which are ready are read before those
+        still converting, so the bus isn't idle while waiting for them.
+        Sensors which can't tell can leave this as it is; getval() must
+        still wait for the measurement if it's called early.
+
+        Returns:
+            bool Whether getval() can be called without waiting.
+
+        """
+        return True
+
+    def getextras(self):
+        """Get extra data about the latest reading.
+
+        Sensors can use this to report more than just a value (e.g. the
+        spread of the raw readings it was calculated from). Called
+        straight after getval(), in the same thread.
+
+        Returns:
+            dict Extra data to add to the reading, or None.
+
+        """
+        return None
+
+    def getderived(self):
+        """Get virtual sensors calculated from this sensor's extras.
+
+        Sensors whose extras include measurements which are worth
+        outputting in their own right (e.g. the Microphone's A-weighted
+        level) can provide virtual sensors for them (see virtual.py), so
+        that they don't have to be set up in sensors.cfg.
+
+        Returns:
+            dict The parameters (as in sensors.cfg) of each virtual
+                 sensor, by section name.
+
+        """
+        return {}
+
+    def close(self):
+        """Release any hardware or threads used by the sensor.
+
+        Called when sampling stops. Sensors which hold resources (open
+        devices, background threads, etc.) should override this.
+
+        """
+        pass
+
     def getname(self):
         """Get Class name (not human-friendly).
 
@@ -60,3 +226,216 @@ class Sensor(object):
 
         """
         return self.valname
+
+class Acquirer(threading.Thread):
+    """ Acquire a value repeatedly in the background.
+
+    Calls an acquisition function every 'interval' seconds (timed from
+    the start of the previous call, on the monotonic clock so that
+    changes to the system time don't stretch or skip intervals) and
+    keeps the latest value it returned, so getting the value never
+    blocks. A call which raises an exception or returns None counts as a
+    failure, and the previous value is kept. The latest exception is kept in 'lasterror', and the
+    first of each run of failures is printed.
+
+    """
+
+    def __init__(self, acquire, interval, name, setup=None):
+        """Initialise.
+
+        Args:
+            acquire: Function which reads the sensor and returns the
+                     value.
+            interval: Time between acquisitions (seconds).
+            name: The name of the thread.
+            setup: Function to call (in the background) before the
+                   first acquisition, e.g. to reset the chip. If it
+                   raises an exception, it is tried again instead of the
+                   next acquisition.
+
+        """
+        threading.Thread.__init__(self, name=name)
+        self.daemon = True
+        self.acquire = acquire
+        self.interval = interval
+        self.setup = setup
+        self.acquired = None
+        self.reads = 0
+        self.failures = 0
+        self.lasterror = None
+        # Whether the latest acquisition failed
+        self.failing = False
+        self.stopping = threading.Event()
+
+    def run(self):
+        """Acquire the value until stopped."""
+        while not self.stopping.isSet():
+            started = monotonic()
+            # When the value was acquired, for Acquired.timestamp
+            startedat = time.time()
+            self.reads += 1
+            value = None
+            error = None
+            try:
+                if self.setup is not None:
+                    self.setup()
+                    self.setup = None
+                value = self.acquire()
+            except Exception as excep:
+                error = excep
+                self.lasterror = excep
+            if value is None:
+                self.failures += 1
+                if not self.failing:
+                    msg = "Error: Background read of " + self.name + " failed"
+                    if error is not None:
+                        msg += ": " + str(error)
+                    print(msg)
+                self.failing = True
+            else:
+                self.acquired = Acquired(value, startedat)
+                self.failing = False
+            self.stopping.wait(max(self.interval - (monotonic() - started), 0))
+
+    def latest(self):
+        """Get the latest value.
+
+        Returns:
+            Acquired The value and when it was acquired, or None if
+                     there hasn't been one yet.
+
+        """
+        return self.acquired
+
+    def stop(self):
+        """Stop acquiring (after the current acquisition has finished)."""
+        self.stopping.set()
+
+class AsyncSensor(Sensor):
+    """Sensor plugin which is read in the background (abstract).
+
+    For sensors which are slow to read (long conversions, sleeps between
+    commands, etc.). A sub-class sets 'mininterval', implements
+    acquire() to read the sensor however slowly it needs to, and calls
+    startacquiring() at the end of __init__(). An Acquirer thread then
+    calls acquire() every 'mininterval' seconds, and getval() returns the
+    latest value straight away. A value older than 'ttl' seconds is
+    still returned, but is marked as stale; one older than 'maxage'
+    seconds is treated as missing.
+
+    Instances which measure different things from the same chip can
+    share one Acquirer by returning the same acquirerkey(): acquire()
+    then returns everything the chip measures, and select() picks out
+    each instance's measurement.
+
+    """
+
+    # The Acquirer for each key
+    acquirers = {}
+    lock = threading.Lock()
+    # Instances sharing an Acquirer use the same value within a tick
+    cache = TickCache()
+    # How long (seconds) a value is fresh for; None means twice the
+    # interval between acquisitions. Set with 'ttl' in sensors.cfg.
+    ttl = None
+    # How old (seconds) a value can be before it is treated as missing;
+    # None means it never is.
+    maxage = None
+
+    @abstractmethod
+    def acquire(self):
+        """Read the sensor (in the background).
+
+        Returns:
+            object The value, or None if the read failed.
+
+        """
+        pass
+
+    def setup(self):
+        """Prepare the sensor (in the background) before the first
+        acquire(), e.g. by resetting it.
+
+        """
+        pass
+
+    def acquirerkey(self):
+        """Get the key of the Acquirer to use.
+
+        Returns:
+            object The key; instances with the same key share one
+                   Acquirer. By default, each instance has its own.
+
+        """
+        return self
+
+    def select(self, value):
+        """Get this instance's measurement from an acquired value.
+
+        Args:
+            value: The value returned by acquire().
+
+        Returns:
+            object The measurement; by default, the value itself.
+
+        """
+        return value
+
+    def startacquiring(self):
+        """Start acquiring in the background (or join an Acquirer which
+        has already been started with the same key).
+
+        """
+        key = self.acquirerkey()
+        with AsyncSensor.lock:
+            acquirer = AsyncSensor.acquirers.get(key)
+            if acquirer is None or not acquirer.isAlive():
+                acquirer = Acquirer(self.acquire, self.mininterval,
+                                    self.getname().lower(), self.setup)
+                acquirer.start()
+                AsyncSensor.acquirers[key] = acquirer
+        self.acquirer = acquirer
+
+    def getval(self):
+        """Get the latest value, without waiting for the sensor.
+
+        Also sets 'valuetime' and 'stale' for the value.
+
+        Returns:
+            object The value, or None if there is no recent value
+                   (which usually happens at the start of the run).
+
+        """
+        acquired = AsyncSensor.cache.get(self.acquirerkey(),
+                                         self.acquirer.latest)
+        self.valuetime = None
+        self.stale = False
+        if acquired is None:
+            return None
+        age = time.time() - acquired.timestamp
+        if self.maxage is not None and age > self.maxage:
+            return None
+        ttl = self.ttl
+        if ttl is None:
+            ttl = 2 * self.acquirer.interval
+        self.valuetime = acquired.timestamp
+        self.stale = age > ttl
+        return self.select(acquired.value)
+
+    def getextras(self):
+        """Get the number of failed acquisitions so far, and why the
+        latest one which raised an exception failed.
+
+        Returns:
+            dict 'acquirefailures', and 'acquireerror' if there has been
+                 an exception.
+
+        """
+        extras = {"acquirefailures": self.acquirer.failures}
+        if self.acquirer.lasterror is not None:
+            extras["acquireerror"] = str(self.acquirer.lasterror)
+        return extras
+
+    def close(self):
+        """Stop acquiring."""
+        self.acquirer.stop()
@@ -1,17 +1,31 @@
+""" Read location data from a GPS.
+
+A high-level Class to read location data from a GPS (usually the
+MTK3339 on the AirPi board, via gpsd). Fixes are collected in the
+background by a GpsController; each sample uses the position at the
+time the sample was scheduled for.
+
+"""
+import time
 import sensor
 import GpsController
 
-gpsc = None # define gps data structure
-
 class serial_gps(sensor.Sensor):
+    """ Read location data from a GPS.
+
+    """
     requiredData = []
-    optionalData = []
+    optionalData = ["description", "host", "port", "replay", "maxAge"]
 
     def __init__(self, data):
         """Initialise GPS sensor class.
 
         Initialise the serial_gps sensor class using parameters passed in
-        'data'.
+        'data'. By default fixes come from gpsd on data["host"] (default
+        127.0.0.1) and data["port"] (default 2947); if data["replay"] is
+        set, they are replayed from that gpsd JSON or NMEA log instead.
+        Positions older than data["maxAge"] seconds (default 10) are
+        treated as missing.
 
         Args:
             self: self.
@@ -20,10 +34,18 @@ class serial_gps(sensor.Sensor):
         """
         self.sensorname = "MTK3339"
         self.valname = "Location"
-        global gpsc
+        self.maxage = 10
+        if "maxAge" in data:
+            self.maxage = float(data["maxAge"])
+        self.fix = None
         try:
-            gpsc = GpsController.GpsController()
-            gpsc.start()
+            if "replay" in data:
+                source = GpsController.FileSource(data["replay"])
+            else:
+                source = GpsController.GpsdSource(data.get("host", "127.0.0.1"),
+                                                  int(data.get("port", 2947)))
+            self.controller = GpsController.GpsController(source)
+            self.controller.start()
         except Exception as e:
             print("Unable to start GpsController")
             print("Exception:", e)
@@ -35,22 +57,49 @@ class serial_gps(sensor.Sensor):
         Get the current sensor values. Actually returns five different values,
         because GPS data are multi-dimensional (i.e. x,y,z are represented by
         latitude, longitude and altitude), plus there is disposition and
-        exposure too.
+        exposure too. The position is for the time of the current sample.
 
         Args:
             self: self.
 
         Return:
             float, float, float, string, string
-                All of the current values for the sensor.
+                All of the current values for the sensor. The position is
+                NaN if there is no recent fix.
 
         """
-        global gpsc
+        when = sensor.TickCache.ticktime or time.time()
+        latest, age = self.controller.latest()
+        if latest is None or age > self.maxage:
+            self.fix = None
+            nan = float("nan")
+            return (nan, nan, nan, "unknown", "unknown")
+        self.fix = self.controller.at(when)
+        altitude = self.fix.altitude
+        if altitude is None:
+            altitude = float("nan")
         # Assume we're mobile and outside if speed is above 1.0 m/s
-        if gpsc.fix.speed > 1.0:
-            return (gpsc.fix.latitude, gpsc.fix.longitude, gpsc.fix.altitude, "mobile", "outdoor")
+        if (self.fix.speed or 0) > 1.0:
+            return (self.fix.latitude, self.fix.longitude, altitude, "mobile", "outdoor")
         else:
-            return (gpsc.fix.latitude, gpsc.fix.longitude, gpsc.fix.altitude, "fixed", "indoor")
+            return (self.fix.latitude, self.fix.longitude, altitude, "fixed", "indoor")
+
+    def getextras(self):
+        """Get the quality of the latest fix.
+
+        Returns:
+            dict The age of the latest fix ('fixage', seconds), its mode
+                 (2 for 2D, 3 for 3D), estimated horizontal and vertical
+                 errors ('eph' and 'epv', metres), speed (m/s) and the
+                 number of satellites used.
+
+        """
+        latest, age = self.controller.latest()
+        if latest is None:
+            return None
+        return {"fixage": age, "mode": latest.mode, "eph": latest.eph,
+                "epv": latest.epv, "speed": latest.speed,
+                "satellites": latest.satellites}
 
     def stopcontroller(self):
         """Stop the GPS controller.
@@ -62,9 +111,14 @@ class serial_gps(sensor.Sensor):
             self: self.
 
         """
-        global gpsc
+        if not self.controller.isAlive():
+            return
         print("[AirPi] GPS controller stopping...")
-        gpsc.stopController()
+        self.controller.stopController()
         # wait for the thread to finish
-        gpsc.join()
+        self.controller.join(5)
         print("[AirPi] GPS controller stopped.")
+
+    def close(self):
+        """Stop the GPS controller."""
+        self.stopcontroller()
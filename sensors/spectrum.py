@@ -0,0 +1,159 @@
+""" Frequency-weighted noise levels from bursts of microphone samples.
+
+A SpectrumAnalyser is fed blocks of samples (normally short bursts read
+from the microphone as fast as the ADC allows) and takes Hann-windowed
+FFTs of them, with half of each segment overlapping the next. Segments
+are analysed as the samples arrive, and only their power spectra are
+kept (summed), so each block is only processed once and the raw audio
+is never stored. When the result is taken, the mean power spectrum is
+reduced to:
+- dBA and dBC: levels with the standard A and C frequency weightings
+  (IEC 61672), which approximate how loud sounds seem to people.
+- dBZ: the unweighted level.
+- Octave band levels, for the bands which lie below half of the sample
+  rate.
+Levels use the same reference as microphone.py (dB relative to a
+full-scale signal, plus an offset).
+
+Needs NumPy.
+
+"""
+import math
+import threading
+import numpy
+
+# Octave band centre frequencies (Hz)
+OCTAVES = [31.5, 63, 125, 250, 500, 1000, 2000, 4000, 8000, 16000]
+
+def a_weighting(freqs):
+    """Get the A-weighting (dB) at some frequencies.
+
+    Args:
+        freqs: NumPy array of frequencies (Hz).
+
+    Returns:
+        array The weighting at each frequency.
+
+    """
+    f2 = numpy.maximum(freqs, 1e-3) ** 2
+    gain = (12194.0 ** 2 * f2 ** 2 /
+            ((f2 + 20.6 ** 2) * numpy.sqrt((f2 + 107.7 ** 2) * (f2 + 737.9 ** 2))
+             * (f2 + 12194.0 ** 2)))
+    return 20 * numpy.log10(gain) + 2.0
+
+def c_weighting(freqs):
+    """Get the C-weighting (dB) at some frequencies.
+
+    Args:
+        freqs: NumPy array of frequencies (Hz).
+
+    Returns:
+        array The weighting at each frequency.
+
+    """
+    f2 = numpy.maximum(freqs, 1e-3) ** 2
+    gain = 12194.0 ** 2 * f2 / ((f2 + 20.6 ** 2) * (f2 + 12194.0 ** 2))
+    return 20 * numpy.log10(gain) + 0.06
+
+class SpectrumAnalyser(object):
+    """ Accumulate the power spectrum of a signal, segment by segment.
+
+    """
+
+    def __init__(self, fftsize=256, fullscale=512.0, dboffset=0.0):
+        """Initialise.
+
+        Args:
+            fftsize: The number of samples in each FFT segment.
+            fullscale: The amplitude of a full-scale signal.
+            dboffset: Added to every level (dB).
+
+        """
+        self.fftsize = fftsize
+        self.hop = fftsize // 2
+        self.window = numpy.hanning(fftsize)
+        # Converts |FFT|^2 to each bin's share of the mean square (the
+        # one-sided spectrum, so doubled except for DC and Nyquist)
+        self.scale = numpy.full(fftsize // 2 + 1,
+                                2.0 / (fftsize * (self.window ** 2).sum()))
+        self.scale[0] /= 2
+        self.scale[-1] /= 2
+        self.reference = fullscale ** 2 / 10 ** (dboffset / 10.0)
+        self.lock = threading.Lock()
+        self.tail = numpy.zeros(0)
+        self.reset()
+
+    def reset(self):
+        """Forget the accumulated spectrum."""
+        self.power = numpy.zeros(self.fftsize // 2 + 1)
+        self.segments = 0
+        self.ratesum = 0.0
+
+    def feed(self, samples, rate, contiguous=False):
+        """Analyse a block of samples.
+
+        Args:
+            samples: The samples (any numeric sequence).
+            rate: The rate they were taken at (samples per second).
+            contiguous: Whether the block carries straight on from the
+                        previous one, so that segments can span the two.
+
+        """
+        samples = numpy.asarray(samples, dtype=numpy.float64)
+        with self.lock:
+            if contiguous:
+                samples = numpy.concatenate((self.tail, samples))
+            starts = range(0, len(samples) - self.fftsize + 1, self.hop)
+            for start in starts:
+                segment = samples[start:start + self.fftsize]
+                segment = (segment - segment.mean()) * self.window
+                self.power += numpy.abs(numpy.fft.rfft(segment)) ** 2
+            self.segments += len(starts)
+            self.ratesum += rate * len(starts)
+            # Keep whatever the next segment will need
+            if starts:
+                self.tail = samples[starts[-1] + self.hop:]
+            else:
+                self.tail = samples
+
+    def level(self, meansquare):
+        """Convert a mean square to a level (dB); None if it is zero."""
+        if meansquare <= 0:
+            return None
+        return 10 * math.log10(meansquare / self.reference)
+
+    def result(self):
+        """Get the levels since the last result, and start again.
+
+        Returns:
+            dict 'dba', 'dbc' and 'dbz' (dB), the level of each octave
+                 band (dB, keyed e.g. 'oct1000'), the mean sample rate
+                 ('spectrumrate') and the number of 'segments'
+                 analysed; None if no segments were analysed.
+
+        """
+        with self.lock:
+            if not self.segments:
+                return None
+            rate = self.ratesum / self.segments
+            bins = self.power * self.scale / self.segments
+            segments = self.segments
+            self.reset()
+        freqs = numpy.fft.rfftfreq(self.fftsize, 1.0 / rate)
+        # Ignore DC, which is just the microphone's bias
+        bins[0] = 0
+        levels = {
+            "dbz": self.level(bins.sum()),
+            "dba": self.level((bins * 10 ** (a_weighting(freqs) / 10)).sum()),
+            "dbc": self.level((bins * 10 ** (c_weighting(freqs) / 10)).sum()),
+            "spectrumrate": rate,
+            "segments": segments
+            }
+        for centre in OCTAVES:
+            low, high = centre / math.sqrt(2), centre * math.sqrt(2)
+            if high > rate / 2:
+                break
+            inband = (freqs >= low) & (freqs < high)
+            if inband.any():
+                levels["oct" + str(int(centre))] = self.level(bins[inband].sum())
+        return levels
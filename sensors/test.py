@@ -12,9 +12,8 @@ import time
 import operator
 import microphone
 
-v = mcp3008.MCP3008({})
-
 t = microphone.Microphone(2)
+t.open()
 
 t.Run()
 
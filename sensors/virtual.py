@@ -0,0 +1,265 @@
+""" Derive measurements from other sensors' readings.
+
+A virtual sensor doesn't read any hardware: its value is calculated
+from the latest readings of other sensors (its 'inputs', which are
+sections in sensors.cfg) using a formula. The formula is either one of
+the built-in ones in FORMULAS (dew point, heat index, etc.) or a Python
+expression in terms of x[0], x[1], etc. (the inputs, in order), which
+may use the functions from the math module.
+
+The main AirPi script evaluates every virtual sensor once per sample,
+after the real sensors have been read, using a Derivation. Inputs are
+resolved to sensor plugins once at startup and the virtual sensors are
+put in dependency order, so one virtual sensor can use another as an
+input, and each is handed its inputs' readings directly rather than
+looking them up by name. The results are output like any other
+readings.
+
+Built-in formulas expect temperatures in Celsius, humidity in % RH,
+pressure in hPa and wind speed in km/h.
+
+"""
+import math
+import sensor
+
+def dewpoint(temp, humidity):
+    """Dew point (Celsius), using the Magnus formula."""
+    gamma = math.log(humidity / 100.0) + 17.62 * temp / (243.12 + temp)
+    return 243.12 * gamma / (17.62 - gamma)
+
+def absolutehumidity(temp, humidity):
+    """Absolute humidity (grams of water per cubic metre of air)."""
+    vapour = 6.112 * math.exp(17.67 * temp / (temp + 243.5)) * humidity
+    return vapour * 2.1674 / (273.15 + temp)
+
+def heatindex(temp, humidity):
+    """Heat index ('feels like' temperature in hot weather, Celsius).
+
+    Uses the US National Weather Service's Rothfusz regression, or
+    Steadman's simpler formula where that gives less than 80F.
+
+    """
+    fahr = temp * 1.8 + 32
+    index = 0.5 * (fahr + 61.0 + (fahr - 68.0) * 1.2 + humidity * 0.094)
+    if (index + fahr) / 2 >= 80:
+        index = (-42.379 + 2.04901523 * fahr + 10.14333127 * humidity
+                 - 0.22475541 * fahr * humidity - 0.00683783 * fahr * fahr
+                 - 0.05481717 * humidity * humidity
+                 + 0.00122874 * fahr * fahr * humidity
+                 + 0.00085282 * fahr * humidity * humidity
+                 - 0.00000199 * fahr * fahr * humidity * humidity)
+        if humidity < 13 and 80 <= fahr <= 112:
+            index -= ((13 - humidity) / 4 *
+                      math.sqrt((17 - abs(fahr - 95)) / 17))
+        elif humidity > 85 and 80 <= fahr <= 87:
+            index += (humidity - 85) / 10 * (87 - fahr) / 5
+    return (index - 32) / 1.8
+
+def windchill(temp, windspeed):
+    """Wind chill ('feels like' temperature in cold wind, Celsius).
+
+    Uses the North American / UK formula, which only applies at or below
+    10C with wind above 4.8 km/h; otherwise the air temperature is
+    returned.
+
+    """
+    if temp > 10 or windspeed <= 4.8:
+        return temp
+    factor = windspeed ** 0.16
+    return 13.12 + 0.6215 * temp - 11.37 * factor + 0.3965 * temp * factor
+
+def mslp(pressure, temp, altitude=0):
+    """Pressure adjusted to mean sea level (hPa).
+
+    Args:
+        pressure: The pressure at the sensor (hPa).
+        temp: The air temperature (Celsius).
+        altitude: The sensor's height above sea level (metres).
+
+    """
+    lapse = 0.0065 * altitude
+    return pressure * (1 - lapse / (temp + lapse + 273.15)) ** -5.257
+
+# The built-in formulas: the function, the number of inputs, and the
+# default name, unit and symbol for the result
+FORMULAS = {
+    "dewpoint": (dewpoint, 2, "Dew_Point", "Celsius", "C"),
+    "absolutehumidity": (absolutehumidity, 2, "Absolute_Humidity",
+                         "Grams per cubic metre", "g/m3"),
+    "heatindex": (heatindex, 2, "Heat_Index", "Celsius", "C"),
+    "windchill": (windchill, 2, "Wind_Chill", "Celsius", "C"),
+    "mslp": (mslp, 2, "Sea_Level_Pressure", "Hectopascal", "hPa")
+    }
+
+class Virtual(sensor.Sensor):
+    """ A sensor calculated from other sensors' readings.
+
+    """
+
+    requiredData = ["formula", "inputs"]
+    optionalData = ["sensorname", "name", "unit", "symbol", "description",
+                    "altitude"]
+
+    def __init__(self, data):
+        """Initialise.
+
+        Initialise the virtual sensor using parameters passed in 'data'.
+        data["inputs"] is a comma-separated list of sections in
+        sensors.cfg; the value of each is used, unless the section is
+        followed by '.' and the name of one of its extras (e.g.
+        "Anemometer.windspeed"). data["formula"] is the name of a
+        built-in formula or an expression. The result's name, unit and
+        symbol default to those of the built-in formula, and can be
+        set with data["name"], data["unit"] and data["symbol"].
+        data["altitude"] (metres) is used by the 'mslp' formula.
+
+        Args:
+            self: self.
+            data: A dict containing the parameters to be used during setup.
+
+        """
+        self.readingtype = "sample"
+        self.inputs = []
+        for name in data["inputs"].split(","):
+            section, _, key = name.strip().partition(".")
+            self.inputs.append((section, key or "value"))
+        self.formula = data["formula"].strip()
+        self.params = {}
+        if self.formula in FORMULAS:
+            function, count, valname, valunit, valsymbol = FORMULAS[self.formula]
+            if len(self.inputs) != count:
+                raise ValueError("Formula '" + self.formula + "' needs "
+                                 + str(count) + " inputs")
+            self.function = function
+            if self.formula == "mslp" and "altitude" in data:
+                self.params["altitude"] = float(data["altitude"])
+        else:
+            expression = eval("lambda x: " + self.formula, vars(math).copy())
+            self.function = lambda *values: expression(values)
+            valname, valunit, valsymbol = "Virtual", "", ""
+        self.valname = data.get("name", valname)
+        self.valunit = data.get("unit", valunit)
+        self.valsymbol = data.get("symbol", valsymbol)
+        self.sensorname = data.get("sensorname", self.valname)
+        self.description = data.get("description",
+                                    "Calculated from " + data["inputs"])
+        self.value = None
+        # Set by Derivation: the sensor plugin for each input
+        self.sources = []
+
+    def compute(self, values):
+        """Calculate the value from the inputs' values.
+
+        Args:
+            values: The value of each input, in order.
+
+        Returns:
+            float The value, or None if any input is missing or the
+                  formula fails (e.g. zero humidity for 'dewpoint').
+
+        """
+        self.value = None
+        for value in values:
+            if value is None or (isinstance(value, float) and math.isnan(value)):
+                return None
+        try:
+            self.value = self.function(*values, **self.params)
+        except (ArithmeticError, ValueError, TypeError):
+            pass
+        return self.value
+
+    def getval(self):
+        """Get the value calculated for the current sample.
+
+        Returns:
+            float The value, or None if it couldn't be calculated.
+
+        """
+        return self.value
+
+class Derivation(object):
+    """ Evaluate the virtual sensors each sample.
+
+    """
+
+    def __init__(self, sensors):
+        """Initialise.
+
+        Add the virtual sensors provided by other sensors (see
+        Sensor.getderived()), resolve each virtual sensor's inputs to
+        sensor plugins, and put the virtual sensors in dependency order.
+        Virtual sensors whose inputs aren't enabled, or which depend on
+        themselves, are left out and listed in self.dropped.
+
+        Args:
+            sensors: All of the enabled sensor plugins, each with its
+                     'section' in sensors.cfg.
+
+        """
+        sensors = list(sensors)
+        for sensorplugin in list(sensors):
+            for section, params in sorted(sensorplugin.getderived().items()):
+                provided = Virtual(params)
+                provided.section = section
+                sensors.append(provided)
+        self.physical = [s for s in sensors if not isinstance(s, Virtual)]
+        virtuals = [s for s in sensors if isinstance(s, Virtual)]
+        bysection = dict((s.section, s) for s in sensors)
+        # (sensor plugin, reason) for each virtual sensor left out
+        self.dropped = []
+        pending = []
+        for virtual in virtuals:
+            missing = [section for section, _ in virtual.inputs
+                       if section not in bysection]
+            if missing:
+                self.dropped.append((virtual, "input(s) not enabled: "
+                                     + ", ".join(missing)))
+                continue
+            virtual.sources = [(bysection[section], key)
+                               for section, key in virtual.inputs]
+            pending.append(virtual)
+        # Repeatedly take the virtual sensors whose inputs are all ready
+        self.virtual = []
+        ready = set(self.physical)
+        while pending:
+            progress = [v for v in pending
+                        if all(source in ready for source, _ in v.sources)]
+            if not progress:
+                break
+            for virtual in progress:
+                self.virtual.append(virtual)
+                ready.add(virtual)
+                pending.remove(virtual)
+        for virtual in pending:
+            self.dropped.append((virtual, "inputs depend on each other, or "
+                                 "on a virtual sensor which was left out"))
+
+    def evaluate(self, current, make):
+        """Calculate the virtual sensors for a sample.
+
+        Args:
+            current: dict The reading to use for each sensor plugin; the
+                     virtual sensors' readings are added to it as they
+                     are made.
+            make: Function which makes a reading from a virtual sensor
+                  plugin, its value and its age (that of its oldest
+                  input).
+
+        Returns:
+            list The virtual sensors' readings, in dependency order.
+
+        """
+        results = []
+        for virtual in self.virtual:
+            values = []
+            age = 0
+            for source, key in virtual.sources:
+                reading = current[source]
+                try:
+                    values.append(reading[key])
+                except KeyError:
+                    values.append(None)
+                age = max(age, reading.get("age", 0))
+            current[virtual] = make(virtual, virtual.compute(values), age)
+            results.append(current[virtual])
+        return results
@@ -7,6 +7,7 @@ settings config file (usually AirPi/settings.cfg).
 """
 
 import math
+import threading
 import support
 
 class Calibration(support.Support):
@@ -56,6 +57,8 @@ class Calibration(support.Support):
         self.calibrations = []
         self.calibrated = []
         self.lastuncalibrated = []
+        # Output plugins may run in their own threads (see dispatcher.py)
+        self.lock = threading.Lock()
         temp = dict((k.lower(), v) for k,v in self.params.iteritems())
         for name, detail in temp.iteritems():
             if name.startswith('func_') and detail is not False:
@@ -79,26 +82,28 @@ class Calibration(support.Support):
                         property.
 
         """
-        if datapoints == self.lastuncalibrated:
-            # The same datapoints object, so the calculations would turn
-            # out the same, so we can just return the result of the last
-            # calculations.
+        with self.lock:
+            if datapoints == self.lastuncalibrated:
+                # The same datapoints object, so the calculations would turn
+                # out the same, so we can just return the result of the last
+                # calculations.
+                return self.calibrated
+
+            # findval() reads self.calibrated while we work, so build it in place
+            self.calibrated = list(datapoints)
+            # Recreate so we don't overwrite un-calibrated data:
+            for i in range(0, len(self.calibrated)):
+                self.calibrated[i] = dict(self.calibrated[i]) # recreate again
+                for j in self.calibrations:
+                    if self.calibrated[i]["name"].lower() == j["name"]:
+                        if self.calibrated[i]["value"] != None:
+                            self.calibrated[i]["value"] = \
+                                j["function"](self.calibrated[i]["value"])
+                            self.calibrated[i]["symbol"] = j["symbol"]
+            # Update which object we last worked on:
+            self.lastuncalibrated = datapoints
             return self.calibrated
 
-        self.calibrated = list(datapoints)
-        # Recreate so we don't overwrite un-calibrated data:
-        for i in range(0, len(self.calibrated)):
-            self.calibrated[i] = dict(self.calibrated[i]) # recreate again
-            for j in self.calibrations:
-                if self.calibrated[i]["name"].lower() == j["name"]:
-                    if self.calibrated[i]["value"] != None:
-                        self.calibrated[i]["value"] = \
-                            j["function"](self.calibrated[i]["value"])
-                        self.calibrated[i]["symbol"] = j["symbol"]
-        # Update which object we last worked on:
-        self.lastuncalibrated = datapoints
-        return self.calibrated
-
     def findval(self, key):
         """Find (calibrated) data value for a given key.
 
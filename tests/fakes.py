@@ -0,0 +1,84 @@
+"""Fake hardware modules, so that AirPi modules can be imported anywhere.
+
+install() puts stand-ins for RPi.GPIO, smbus and dhtreader into
+sys.modules (under the 'sensors.' prefix too, since the sensor modules
+import each other relatively), and adds the repository to sys.path.
+share_adc() stands a FakeADC in for the MCP3008 which the analogue
+sensors share.
+
+"""
+import os
+import sys
+import threading
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class FakeModule(types.ModuleType):
+    """A module whose every unknown attribute is a do-nothing function."""
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: 0
+
+class FakeSMBus(object):
+    """An I2C bus with devices which only answer at 'present' addresses."""
+
+    # The addresses which respond, for every bus
+    present = set()
+
+    def __init__(self, busnum):
+        self.busnum = busnum
+
+    def read_byte(self, address):
+        if address not in FakeSMBus.present:
+            raise IOError(121, "Remote I/O error")
+        return 0
+
+class FakeADC(object):
+    """An MCP3008 whose every channel reads 'value'."""
+
+    def __init__(self, value=512):
+        self.value = value
+        self.lock = threading.Lock()
+        self.channels = set()
+
+    def register(self, adcnum):
+        self.channels.add(adcnum)
+
+    def readadc(self, adcnum):
+        return self.value
+
+    def readburst(self, adcnum, count):
+        return [self.value] * count
+
+def share_adc(adc):
+    """Make MCP3008.getshared() return 'adc' (None to set up a real one).
+
+    Returns:
+        The ADC it was returning before, to restore afterwards.
+
+    """
+    from sensors import mcp3008
+    previous = mcp3008.MCP3008.sharedClass
+    mcp3008.MCP3008.sharedClass = adc
+    return previous
+
+def install():
+    """Install the fake modules (once)."""
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    if "smbus" in sys.modules:
+        return
+    rpi = FakeModule("RPi")
+    gpio = FakeModule("RPi.GPIO")
+    rpi.GPIO = gpio
+    smbus = FakeModule("smbus")
+    smbus.SMBus = FakeSMBus
+    dhtreader = FakeModule("dhtreader")
+    dhtreader.read = lambda kind, pin: None
+    for name, module in [("RPi", rpi), ("RPi.GPIO", gpio), ("smbus", smbus),
+                         ("dhtreader", dhtreader)]:
+        sys.modules[name] = module
+        sys.modules["sensors." + name] = module
@@ -0,0 +1,58 @@
+"""Tests for reading sensors concurrently."""
+import threading
+import time
+import unittest
+
+import acquisition
+
+class SlowSensor(object):
+    """A sensor on a bus which takes 'delay' seconds to read."""
+
+    def __init__(self, delay, bus="i2c-1"):
+        self.delay = delay
+        self.bus = bus
+        self.release = threading.Event()
+
+    def start(self):
+        pass
+
+    def ready(self):
+        return True
+
+def read(sensorplugin):
+    sensorplugin.release.wait(sensorplugin.delay)
+    return "reading"
+
+def missing(sensorplugin):
+    return "missing"
+
+class TestBusyGroup(unittest.TestCase):
+
+    def check(self, deadline):
+        slow = SlowSensor(5)
+        quick = SlowSensor(0, bus=None)
+        acquirer = acquisition.SensorAcquisition([slow, quick], read, missing,
+                                                 deadline=deadline)
+        acquirer.acquire([quick])
+        try:
+            # Keep the slow group busy, as if it overran the last pass
+            first = threading.Thread(target=acquirer.acquire, args=([slow],))
+            first.daemon = True
+            first.start()
+            time.sleep(0.1)
+            start = time.time()
+            readings = acquirer.acquire()
+            self.assertTrue(time.time() - start < 0.5)
+            self.assertEqual(readings, ["missing", "reading"])
+            self.assertEqual(acquirer.late, [slow])
+        finally:
+            slow.release.set()
+
+    def test_busy_group_is_late_at_once(self):
+        self.check(1.0)
+
+    def test_busy_group_without_deadline(self):
+        self.check(None)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,31 @@
+"""Tests for the running aggregators."""
+import random
+import unittest
+
+import fakes
+fakes.install()
+
+import aggregation
+
+class TestSumAggregator(unittest.TestCase):
+
+    def test_whole_counts_sum_exactly(self):
+        rng = random.Random(1)
+        for dummy in range(500):
+            counts = [rng.randint(0, 500) for i in range(rng.randint(1, 50))]
+            aggregator = aggregation.SumAggregator()
+            for count in counts:
+                aggregator.add(count)
+            self.assertEqual(aggregator.result()["value"], sum(counts))
+
+    def test_statistics_come_from_mean_aggregator(self):
+        aggregator = aggregation.SumAggregator()
+        for count in [1, 2, 3]:
+            aggregator.add(count)
+        result = aggregator.result()
+        self.assertEqual((result["min"], result["max"], result["count"]),
+                         (1, 3, 3))
+        self.assertAlmostEqual(result["stddev"], 1.0)
+
+if __name__ == "__main__":
+    unittest.main()
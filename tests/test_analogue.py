@@ -0,0 +1,78 @@
+"""Tests for combining analogue readings."""
+import unittest
+
+import fakes
+fakes.install()
+
+import readings
+from sensors import analogue
+from sensors import virtual
+
+class AnalogueTestCase(unittest.TestCase):
+    """Makes Analogue sensors which read from a FakeADC."""
+
+    def setUp(self):
+        self.adc = fakes.share_adc(fakes.FakeADC())
+        self.sensors = []
+
+    def tearDown(self):
+        for sensorplugin in self.sensors:
+            sensorplugin.close()
+        fakes.share_adc(self.adc)
+
+    def make(self, sensorname, **data):
+        """Make a sensor, as from a sensors.cfg section."""
+        data.update({"adcpin": "2", "measurement": sensorname,
+                     "sensorname": sensorname})
+        sensorplugin = analogue.Analogue(data)
+        self.sensors.append(sensorplugin)
+        return sensorplugin
+
+    def make_vane(self, **data):
+        return self.make("WindDirection", pullupResistance="10000", **data)
+
+class TestWindDirection(AnalogueTestCase):
+
+    def test_mean_around_north(self):
+        vane = self.make_vane()
+        result = vane.reduce([337.5, 360.0, 22.5], "mean")
+        self.assertTrue(result < 1 or result > 359, result)
+        self.assertEqual(vane.extras["samples"], 3)
+
+    def test_wiring_errors_are_ignored(self):
+        vane = self.make_vane()
+        self.assertAlmostEqual(vane.reduce([90.0, 1023.0, 90.0], "avg"), 90)
+
+    def test_most(self):
+        vane = self.make_vane()
+        self.assertEqual(vane.reduce([90.0, 90.0, 180.0], "most"), 90)
+
+    def test_north_is_never_zero(self):
+        vane = self.make_vane(vanetable="33000:0,6570:22.5")
+        self.assertEqual(vane.getWindDirection(33000), (360, False))
+        self.assertEqual(vane.getWindDirection(5e6)[0], 0)
+
+class TestNoiseReadings(AnalogueTestCase):
+
+    def test_weighted_levels_are_output(self):
+        if analogue.microphone.numpy is None:
+            self.skipTest("needs NumPy")
+        microphone = self.make("Microphone", fftsize="256")
+        # As set by airpi.py for each sensors.cfg section
+        microphone.section = "Microphone"
+        derived = virtual.Derivation([microphone])
+        self.assertEqual(derived.physical, [microphone])
+        self.assertEqual([v.valsymbol for v in derived.virtual],
+                         ["dBA", "dBC", "dBZ"])
+        reading = readings.Reading(readings.SensorInfo.get(microphone), 50.0,
+                                   0, 0, {"dba": 40.0, "dbc": 45.0})
+        values = derived.evaluate({microphone: reading},
+                                  lambda plugin, value, age: value)
+        self.assertEqual(values, [40.0, 45.0, None])
+
+    def test_no_levels_without_analysis(self):
+        microphone = self.make("Microphone", samplerate="0")
+        self.assertEqual(microphone.getderived(), {})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+"""Tests for splitting the BMP085's conversions around other reads."""
+import time
+import unittest
+
+import fakes
+fakes.install()
+
+from sensors import bmpBackend
+from sensors.sensor import TickCache
+import acquisition
+
+# The worked example from the datasheet (oversampling mode 0)
+CALIBRATION = (408, -72, -14383, 32741, 32757, 23153, 6190, 4, -32768, -8711, 2868)
+UT = 27898
+UP = 23843
+
+class FakeI2C(object):
+    """A BMP085 at 'address' on 'bus', which records commands and
+    returns the datasheet's raw readings.
+
+    """
+
+    def __init__(self, address, bus):
+        self.address = address
+        self.bus = bus
+        self.log = []
+        # Whether reads fail, as Adafruit_I2C reports it
+        self.failing = False
+
+    def readstruct(self, reg, fmt):
+        return CALIBRATION
+
+    def write8(self, reg, value):
+        self.log.append(("write", value))
+
+    def readu16(self, reg):
+        self.log.append(("temp", time.time()))
+        return UT
+
+    def readlist(self, reg, length):
+        self.log.append(("pressure", time.time()))
+        if self.failing:
+            return -1
+        return [UP >> 8, UP & 0xFF, 0]
+
+class FakeSensor(object):
+    def __init__(self, isready):
+        self.isready = isready
+
+    def ready(self):
+        return self.isready
+
+class TestBMP085(unittest.TestCase):
+
+    def setUp(self):
+        TickCache.advance(time.time())
+        self.i2c = bmpBackend.Adafruit_I2C
+        bmpBackend.Adafruit_I2C = FakeI2C
+        self.bmp = bmpBackend.BMP085(mode=0, bus=1)
+
+    def tearDown(self):
+        bmpBackend.Adafruit_I2C = self.i2c
+
+    def test_compensation(self):
+        self.assertEqual(self.bmp.compensate(UT, UP), (15.0, 69964))
+
+    def test_temperature_starts_pressure_without_waiting(self):
+        self.bmp.start()
+        self.assertFalse(self.bmp.pressureisready())
+        self.assertEqual(self.bmp.readtemperature(), 15.0)
+        commands = [entry[1] for entry in self.bmp.i2c.log if entry[0] == "write"]
+        self.assertEqual(len(commands), 2)
+        self.assertFalse(any(entry[0] == "pressure" for entry in self.bmp.i2c.log))
+        self.assertTrue(self.bmp.pressureready is not None)
+        self.assertEqual(self.bmp.readpressure(), 69964)
+        times = dict((entry[0], entry[1]) for entry in self.bmp.i2c.log)
+        self.assertTrue(times["pressure"] - times["temp"] >= self.bmp.PRESSURETIMES[0] - 0.001)
+
+    def test_one_read_per_tick(self):
+        self.bmp.start()
+        self.bmp.readpressure()
+        self.bmp.readtemperature()
+        self.bmp.start()
+        self.assertEqual(len([e for e in self.bmp.i2c.log if e[0] == "write"]), 2)
+        self.assertTrue(self.bmp.tempisready())
+        self.assertTrue(self.bmp.pressureisready())
+
+    def test_new_tick_abandons_unread_pressure(self):
+        self.bmp.start()
+        self.bmp.readtemperature()
+        TickCache.advance(time.time() + 1)
+        self.bmp.start()
+        self.assertTrue(self.bmp.pressureready is None)
+        self.assertEqual(self.bmp.read(), (15.0, 69964))
+
+    def test_pressure_read_error(self):
+        self.bmp.readtemperature()
+        self.bmp.i2c.failing = True
+        self.assertRaises(IOError, self.bmp.readpressure)
+
+    def test_ready_members_read_first(self):
+        waiting = FakeSensor(False)
+        ready = FakeSensor(True)
+        self.assertTrue(acquisition.SensorAcquisition.nextready([waiting, ready]) is ready)
+        self.assertTrue(acquisition.SensorAcquisition.nextready([waiting]) is waiting)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+"""Tests for triggering captures in the background."""
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+import StringIO
+
+import fakes
+fakes.install()
+
+from sensors import capture
+
+class CaptureADC(fakes.FakeADC):
+    """Captures a ramp, failing the first 'failures' times."""
+
+    def __init__(self, failures=0):
+        fakes.FakeADC.__init__(self)
+        self.failures = failures
+
+    def capture(self, adcnum, count, chunk=None, out=None):
+        if self.failures:
+            self.failures -= 1
+            raise IOError(28, "No space left on device")
+        start = time.time()
+        return range(count), [(start, start + 0.001)]
+
+class TestCapture(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+        self.triggers = []
+        self.adc = fakes.share_adc(None)
+
+    def tearDown(self):
+        for trigger in self.triggers:
+            trigger.close()
+        fakes.share_adc(self.adc)
+        sys.stdout = self.stdout
+        shutil.rmtree(self.directory)
+
+    def make_capture(self, adc, **data):
+        """Make a Capture trigger of 16 samples of channel 3 from 'adc'."""
+        fakes.share_adc(adc)
+        data.update({"adcpin": "3", "directory": self.directory,
+                     "samples": "16", "chunk": "16", "holdoff": "0"})
+        trigger = capture.Capture(data)
+        self.triggers.append(trigger)
+        return trigger
+
+    def test_failed_capture_doesnt_stop_trigger(self):
+        trigger = self.make_capture(CaptureADC(failures=2), interval="0.05")
+        time.sleep(0.4)
+        trigger.close()
+        self.assertFalse(trigger.thread.isAlive())
+        self.assertEqual(trigger.failures, 2)
+        self.assertTrue(trigger.captures >= 1)
+        self.assertTrue("failed" in sys.stdout.getvalue())
+
+    def test_captures_in_one_second_are_kept(self):
+        trigger = self.make_capture(CaptureADC())
+        paths = set(trigger.capture("interval") for i in range(3))
+        self.assertEqual(len(paths), 3)
+        self.assertEqual(len(os.listdir(self.directory)), 3)
+        header, samples = capture.load(sorted(paths)[0])
+        self.assertEqual(list(samples), range(16))
+
+    def test_close_is_prompt(self):
+        trigger = self.make_capture(CaptureADC(), interval="3600")
+        started = time.time()
+        trigger.close()
+        self.assertTrue(time.time() - started < 1)
+        self.assertFalse(trigger.thread.isAlive())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,29 @@
+"""Tests for queueing samples for the output plugins."""
+import unittest
+
+import dispatcher
+
+class FakePlugin(object):
+    """An output plugin with the given outputs.cfg parameters."""
+
+    def __init__(self, params):
+        self.params = params
+
+    def getname(self):
+        return "Fake"
+
+class TestDispatcher(unittest.TestCase):
+
+    def test_overflow_is_not_case_sensitive(self):
+        plugin = FakePlugin({"overflow": "Block "})
+        dispatch = dispatcher.OutputDispatcher([plugin], threaded=False)
+        self.assertEqual(dispatch.workers[0].overflow, "block")
+
+    def test_default_overflow(self):
+        dispatch = dispatcher.OutputDispatcher([FakePlugin({})],
+                                               overflow="coalesce",
+                                               threaded=False)
+        self.assertEqual(dispatch.workers[0].overflow, "coalesce")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+"""Tests for timing the Dust sensor's reads within its LED pulses."""
+import threading
+import unittest
+
+import fakes
+fakes.install()
+
+from sensors import dustBackend
+
+class FakeClock(object):
+    """A monotonic clock which moves on 1us every time it's read."""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        self.now += 1e-6
+        return self.now
+
+class FakeTransport(object):
+    """Conversions which take 10us, or as long as 'durations' says."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.durations = []
+
+    def convert(self, adcnum):
+        duration = 10e-6
+        if self.durations:
+            duration = self.durations.pop(0)
+        self.clock.now += duration
+        return 300
+
+class FakeADC(object):
+
+    def __init__(self, clock):
+        self.lock = threading.Lock()
+        self.transport = FakeTransport(clock)
+
+class TestPulseTrain(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.monotonic = dustBackend.monotonic
+        dustBackend.monotonic = self.clock
+        self.adc = FakeADC(self.clock)
+        self.dust = dustBackend.DustBackend(adc=self.adc, pulses=4)
+        self.dust.open()
+
+    def tearDown(self):
+        dustBackend.monotonic = self.monotonic
+
+    def test_calibration(self):
+        # Each conversion is timed with two clock reads, 1us apart
+        self.assertAlmostEqual(self.dust.convtime, 11e-6)
+
+    def test_slow_conversion_is_rejected(self):
+        self.adc.transport.durations = [10e-6, 80e-6, 10e-6, 10e-6]
+        readings = self.dust.train()
+        self.assertEqual(readings, [300, 300, 300])
+        stats = self.dust.stats
+        self.assertEqual((stats["accepted"], stats["mistimed"]), (3, 1))
+        self.assertAlmostEqual(stats["convtime"], 11)
+        self.assertTrue(stats["maxwindow"] <= stats["convtime"] + 1)
+        self.assertTrue(stats["maxdelayerror"] < 2)
+
+    def test_window_must_bracket_delay(self):
+        delay = self.dust.delay
+        self.assertTrue(self.dust.ontime(delay - 5e-6, delay + 5e-6))
+        # Finished before the target, or started after it
+        self.assertFalse(self.dust.ontime(delay - 40e-6, delay - 30e-6))
+        self.assertFalse(self.dust.ontime(delay + 30e-6, delay + 40e-6))
+        # Brackets the target, but far longer than a normal conversion
+        self.assertFalse(self.dust.ontime(delay - 50e-6, delay + 50e-6))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+"""Tests for finding connected I2C sensors, using a fake SMBus."""
+import ConfigParser
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import StringIO
+
+import fakes
+fakes.install()
+
+import airpi
+from sensors import i2cbus
+from sensors import i2cdiscovery
+
+SERIAL = "00000000abcdef01"
+
+class DiscoveryTestCase(unittest.TestCase):
+    """Fresh buses, a temporary cache file and a known board serial."""
+
+    def setUp(self):
+        i2cbus.I2CBus.buses = {}
+        fakes.FakeSMBus.present = set([0x77, 0x39])
+        self.directory = tempfile.mkdtemp()
+        self.cachepath = os.path.join(self.directory, "i2ctopology.json")
+        self.board_id = i2cdiscovery.board_id
+        i2cdiscovery.board_id = lambda: SERIAL
+
+    def tearDown(self):
+        i2cdiscovery.board_id = self.board_id
+        fakes.FakeSMBus.present = set()
+        shutil.rmtree(self.directory)
+
+class TestCache(DiscoveryTestCase):
+
+    def test_scan_finds_responding_addresses(self):
+        self.assertEqual(i2cdiscovery.scan([1]), {1: [0x39, 0x77]})
+
+    def test_cache_round_trip(self):
+        topology, cached = i2cdiscovery.discover([1], self.cachepath)
+        self.assertFalse(cached)
+        fakes.FakeSMBus.present = set()
+        again, cached = i2cdiscovery.discover([1], self.cachepath)
+        self.assertTrue(cached)
+        self.assertEqual(again, topology)
+        self.assertEqual(i2cdiscovery.load(self.cachepath, [1]), topology)
+
+    def test_rescan_ignores_cache(self):
+        i2cdiscovery.discover([1], self.cachepath)
+        fakes.FakeSMBus.present = set([0x60])
+        topology, cached = i2cdiscovery.discover([1], self.cachepath, True)
+        self.assertFalse(cached)
+        self.assertEqual(topology, {1: [0x60]})
+
+    def test_other_board_rescans(self):
+        i2cdiscovery.discover([1], self.cachepath)
+        i2cdiscovery.board_id = lambda: "00000000deadbeef"
+        self.assertTrue(i2cdiscovery.load(self.cachepath, [1]) is None)
+        fakes.FakeSMBus.present = set([0x1E])
+        topology, cached = i2cdiscovery.discover([1], self.cachepath)
+        self.assertFalse(cached)
+        self.assertEqual(topology, {1: [0x1E]})
+
+    def test_other_buses_rescan(self):
+        i2cdiscovery.discover([1], self.cachepath)
+        self.assertTrue(i2cdiscovery.load(self.cachepath, [0, 1]) is None)
+
+    def test_corrupt_cache_is_ignored(self):
+        with open(self.cachepath, "w") as cachefile:
+            cachefile.write("{not json")
+        self.assertTrue(i2cdiscovery.load(self.cachepath, [1]) is None)
+        topology, cached = i2cdiscovery.discover([1], self.cachepath)
+        self.assertFalse(cached)
+        self.assertEqual(i2cdiscovery.load(self.cachepath, [1]), topology)
+
+class TestCheckDiscovered(DiscoveryTestCase):
+    """Matching the topology to sections of sensors.cfg."""
+
+    def setUp(self):
+        DiscoveryTestCase.setUp(self)
+        airpi.LOGGER = logging.getLogger("test")
+        self.config = ConfigParser.SafeConfigParser()
+        for section, filename in [("BMP085-temp", "bmp085"),
+                                  ("SI1145-uvi", "SI1145")]:
+            self.config.add_section(section)
+            self.config.set(section, "filename", filename)
+            self.config.set(section, "i2cbus", "1")
+        self.config.add_section("LDR")
+        self.config.set("LDR", "filename", "analogue")
+        self.topology = i2cdiscovery.scan([1])
+        self.stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        DiscoveryTestCase.tearDown(self)
+
+    def check(self, action, section, enabled):
+        airpi.SETTINGS = {"I2CDISCOVERY": action}
+        return airpi.check_discovered(self.config, section, enabled,
+                                      self.topology)
+
+    def test_warn_changes_nothing(self):
+        self.assertTrue(self.check("warn", "SI1145-uvi", True))
+        self.assertFalse(self.check("warn", "BMP085-temp", False))
+        self.assertTrue("SI1145-uvi is enabled" in sys.stdout.getvalue())
+
+    def test_disable(self):
+        self.assertFalse(self.check("disable", "SI1145-uvi", True))
+        self.assertFalse(self.check("disable", "BMP085-temp", False))
+        self.assertTrue(self.check("disable", "BMP085-temp", True))
+
+    def test_enable(self):
+        self.assertFalse(self.check("enable", "SI1145-uvi", True))
+        self.assertTrue(self.check("enable", "BMP085-temp", False))
+
+    def test_undiscoverable_sensors_are_left_alone(self):
+        self.assertTrue(self.check("enable", "LDR", True))
+        self.assertFalse(self.check("enable", "LDR", False))
+        self.assertTrue(airpi.check_discovered(self.config, "SI1145-uvi",
+                                               True, None))
+
+if __name__ == "__main__":
+    unittest.main()
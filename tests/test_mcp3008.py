@@ -0,0 +1,45 @@
+"""Tests for using the MCP3008 modules away from a Pi."""
+import os
+import subprocess
+import sys
+import unittest
+
+import fakes
+
+# Imports the ADC modules with no fake hardware installed
+WITHOUTGPIO = """
+import sys
+sys.path[0:0] = [%r, %r]
+import mcp3008, dustBackend, microphone
+assert mcp3008.GPIO is None and dustBackend.GPIO is None
+try:
+    mcp3008.GpioTransport(23, 24, 18, 25)
+except ImportError as excep:
+    print(excep)
+try:
+    dustBackend.DustBackend(adc=object()).open()
+except ImportError as excep:
+    print(excep)
+""" % (fakes.ROOT, os.path.join(fakes.ROOT, "sensors"))
+
+class TestWithoutGPIO(unittest.TestCase):
+
+    def test_import_is_safe(self):
+        try:
+            import RPi.GPIO
+        except ImportError:
+            pass
+        else:
+            if not isinstance(RPi.GPIO, fakes.FakeModule):
+                self.skipTest("RPi.GPIO is installed")
+        process = subprocess.Popen([sys.executable, "-c", WITHOUTGPIO],
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+        self.assertEqual(process.returncode, 0, output)
+        self.assertEqual(output.splitlines(), [
+            "RPi.GPIO is needed for the 'bitbang' MCP3008 transport",
+            "RPi.GPIO is needed for the Dust sensor's LED"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+"""Tests for collecting noise levels from the background sampler."""
+import unittest
+
+import fakes
+fakes.install()
+
+from sensors import microphone
+
+class TestCollect(unittest.TestCase):
+
+    def setUp(self):
+        if microphone.numpy is None:
+            self.skipTest("needs NumPy")
+        self.mic = microphone.Microphone(2, adc=object(), samplerate=10,
+                                         sensorvoltage=5.0)
+        self.sampler = microphone.MicrophoneSampler(None, 2, 10, history=10)
+        self.mic.sampler = self.sampler
+
+    def write(self, values):
+        for value in values:
+            self.sampler.buffer[self.sampler.written % len(self.sampler.buffer)] = value
+            self.sampler.written += 1
+
+    def test_missed_is_taken_once(self):
+        self.write([512] * 10)
+        self.sampler.missed = 3
+        dummy, extras = self.mic.collect()
+        self.assertEqual(extras["missed"], 3)
+        self.write([512] * 10)
+        dummy, extras = self.mic.collect()
+        self.assertEqual(extras["missed"], 0)
+
+    def test_rms_uses_sensor_voltage(self):
+        # A square wave of +-100 counts around the bias
+        self.write([412, 612] * 5)
+        dummy, extras = self.mic.collect()
+        self.assertAlmostEqual(extras["rms"], 100 / 1023.0 * 5000)
+
+class SilentADC(object):
+    def readadc(self, adcnum):
+        return 512
+
+class TestSampler(unittest.TestCase):
+
+    def test_stop_before_start(self):
+        if microphone.numpy is None:
+            self.skipTest("needs NumPy")
+        sampler = microphone.MicrophoneSampler(SilentADC(), 2, 200)
+        sampler.stop()
+        sampler.start()
+        sampler.join(1)
+        self.assertFalse(sampler.isAlive())
+
+if __name__ == "__main__":
+    unittest.main()
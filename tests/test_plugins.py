@@ -0,0 +1,31 @@
+"""Check that every sensor module shipped in sensors.cfg can be loaded."""
+import ConfigParser
+import os
+import unittest
+
+import fakes
+fakes.install()
+
+import airpi
+from sensors import sensor
+
+class TestSensorDiscovery(unittest.TestCase):
+
+    def test_every_sensor_module_has_a_class(self):
+        config = ConfigParser.SafeConfigParser()
+        config.read(os.path.join(fakes.ROOT, "cfg", "sensors.cfg"))
+        filenames = set(config.get(section, "filename")
+                        for section in config.sections()
+                        if config.has_option(section, "filename"))
+        self.assertTrue(filenames)
+        for filename in sorted(filenames):
+            mod = __import__("sensors." + filename, fromlist=["a"])
+            found = airpi.get_subclasses(mod, sensor.Sensor)
+            self.assertTrue(found is not None, filename)
+            self.assertTrue(issubclass(found, sensor.Sensor), filename)
+
+    def test_abstract_bases_are_skipped(self):
+        self.assertTrue(airpi.get_subclasses(sensor, sensor.Sensor) is None)
+
+if __name__ == "__main__":
+    unittest.main()
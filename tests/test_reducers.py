@@ -0,0 +1,30 @@
+"""Tests for reducing bursts of ADC readings."""
+import unittest
+
+from sensors import reducers
+
+# More than half the readings the same, so the MAD is 0
+STEADY = [500] * 30 + [501] * 10 + [499] * 9 + [900]
+
+class TestHampel(unittest.TestCase):
+
+    def check(self, reduce_readings):
+        value, spread, used = reduce_readings(STEADY, "hampel", 0.1)
+        self.assertEqual(used, 49)
+        self.assertAlmostEqual(value, 500.02, places=2)
+
+    def test_steady_signal_list(self):
+        self.check(reducers.reduce_list)
+
+    def test_steady_signal_array(self):
+        if reducers.numpy is None:
+            return
+        self.check(lambda readings, reducer, trim: reducers.reduce_array(
+            reducers.numpy.array(readings), reducer, trim))
+
+    def test_identical_readings(self):
+        self.assertEqual(reducers.reduce_readings([512] * 8, "hampel"),
+                         (512.0, 0.0, 8))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+"""Tests for the sample scheduler, using a fake clock."""
+import unittest
+
+import fakes
+fakes.install()
+
+import scheduler
+
+class FakeClock(object):
+    """Wall-clock and monotonic time which only move when told to."""
+
+    def __init__(self, wall=1000000.0):
+        self.wall = wall
+        self.mono = 50.0
+        self.slept = 0.0
+
+    def time(self):
+        return self.wall
+
+    def monotonic(self):
+        return self.mono
+
+    def sleep(self, seconds):
+        self.slept += seconds
+        self.wall += seconds
+        self.mono += seconds
+
+class SchedulerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.time = scheduler.time
+        self.monotonic = scheduler.monotonic
+        scheduler.time = self.clock
+        scheduler.monotonic = self.clock.monotonic
+
+    def tearDown(self):
+        scheduler.time = self.time
+        scheduler.monotonic = self.monotonic
+
+class TestTickScheduler(SchedulerTestCase):
+
+    def test_aligned_ticks(self):
+        self.clock.wall = 1000000.4
+        ticks = scheduler.TickScheduler(1.0)
+        times = [ticks.wait() for i in range(3)]
+        self.assertEqual(times, [1000001.0, 1000002.0, 1000003.0])
+        self.assertAlmostEqual(self.clock.slept, 2.6)
+
+    def test_clock_stepped_back(self):
+        ticks = scheduler.TickScheduler(10.0)
+        first = ticks.wait()
+        self.clock.wall -= 3600
+        self.clock.slept = 0
+        second = ticks.wait()
+        # The beat carries on, rather than sleeping for an hour
+        self.assertAlmostEqual(self.clock.slept, 10.0)
+        self.assertEqual(second, first + 10 - 3600)
+        self.assertEqual(ticks.stats()["clocksteps"], 1)
+
+    def test_clock_stepped_forward(self):
+        ticks = scheduler.TickScheduler(10.0)
+        first = ticks.wait()
+        self.clock.wall += 86400
+        second = ticks.wait()
+        self.assertEqual(second, first + 10 + 86400)
+        self.assertEqual(ticks.stats()["overruns"], 0)
+
+    def test_small_adjustments_are_slewed(self):
+        ticks = scheduler.TickScheduler(10.0)
+        ticks.wait()
+        self.clock.wall -= 2.0
+        self.clock.slept = 0
+        ticks.wait()
+        # At most MAXSLEW of the period per tick
+        self.assertAlmostEqual(self.clock.slept, 10.0 + 10 * scheduler.MAXSLEW)
+        for i in range(10):
+            ticks.wait()
+        self.assertAlmostEqual(ticks.nexttick - self.clock.wall,
+                               ticks.nextmono - self.clock.mono)
+
+    def test_skip_after_overrun(self):
+        ticks = scheduler.TickScheduler(1.0, policy="skip")
+        first = ticks.wait()
+        self.clock.sleep(2.5)
+        self.assertEqual(ticks.wait(), first + 1)
+        self.assertEqual(ticks.wait(), first + 3)
+        stats = ticks.stats()
+        self.assertEqual((stats["overruns"], stats["skipped"]), (1, 1))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+"""Tests for acquiring sensor values in the background."""
+import sys
+import unittest
+import StringIO
+
+import fakes
+fakes.install()
+
+from sensors import sensor
+
+class Flaky(object):
+    """Fails with IOError 'failures' times, then returns 'value'."""
+
+    def __init__(self, failures, value=1):
+        self.failures = failures
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise IOError(121, "Remote I/O error")
+        return self.value
+
+class TestAcquirer(unittest.TestCase):
+
+    def setUp(self):
+        self.stdout = sys.stdout
+        sys.stdout = StringIO.StringIO()
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+
+    def acquire(self, acquire, times, setup=None):
+        """Run an Acquirer in this thread for 'times' acquisitions."""
+        acquirer = sensor.Acquirer(acquire, 0, "flaky", setup)
+        calls = [0]
+        def stopafter():
+            calls[0] += 1
+            if calls[0] >= times:
+                acquirer.stop()
+            return acquire()
+        acquirer.acquire = stopafter
+        acquirer.run()
+        return acquirer
+
+    def test_error_is_kept_and_printed_once(self):
+        acquirer = self.acquire(Flaky(3), 3)
+        self.assertEqual(acquirer.failures, 3)
+        self.assertTrue("Remote I/O error" in str(acquirer.lasterror))
+        output = sys.stdout.getvalue().splitlines()
+        self.assertEqual(output, ["Error: Background read of flaky failed: "
+                                  "[Errno 121] Remote I/O error"])
+
+    def test_recovery(self):
+        acquirer = self.acquire(Flaky(1), 2)
+        self.assertEqual(acquirer.failures, 1)
+        self.assertEqual(acquirer.latest().value, 1)
+        self.assertFalse(acquirer.failing)
+
+    def test_setup_error(self):
+        tries = []
+        def setup():
+            tries.append(1)
+            if len(tries) == 1:
+                raise RuntimeError("no chip")
+        acquirer = self.acquire(Flaky(0), 1, setup)
+        self.assertEqual(acquirer.failures, 1)
+        self.assertEqual(str(acquirer.lasterror), "no chip")
+        self.assertTrue("no chip" in sys.stdout.getvalue())
+
+class SteppedClock(object):
+    """Wall-clock and monotonic time; the wall clock can be stepped."""
+
+    def __init__(self):
+        self.wall = 1000000.0
+        self.mono = 50.0
+
+    def time(self):
+        return self.wall
+
+    def monotonic(self):
+        return self.mono
+
+class RecordingEvent(object):
+    """A stop event which records how long it was waited on."""
+
+    def __init__(self):
+        self.waits = []
+        self.stopped = False
+
+    def isSet(self):
+        return self.stopped
+
+    def set(self):
+        self.stopped = True
+
+    def wait(self, timeout):
+        self.waits.append(timeout)
+
+class TestAcquirerClock(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = SteppedClock()
+        self.time = sensor.time
+        self.monotonic = sensor.monotonic
+        sensor.time = self.clock
+        sensor.monotonic = self.clock.monotonic
+
+    def tearDown(self):
+        sensor.time = self.time
+        sensor.monotonic = self.monotonic
+
+    def test_clock_step_does_not_stretch_interval(self):
+        def acquire():
+            # The read takes 0.5s, during which the clock goes back an hour
+            self.clock.mono += 0.5
+            self.clock.wall -= 3600 - 0.5
+            acquirer.stop()
+            return 1
+        acquirer = sensor.Acquirer(acquire, 2, "stepped")
+        acquirer.stopping = RecordingEvent()
+        acquirer.run()
+        self.assertEqual(acquirer.stopping.waits, [1.5])
+        self.assertEqual(acquirer.latest().timestamp, 1000000.0)
+
+if __name__ == "__main__":
+    unittest.main()